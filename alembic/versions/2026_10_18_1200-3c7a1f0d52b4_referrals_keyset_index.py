@@ -0,0 +1,27 @@
+"""Referrals keyset index
+
+Revision ID: 3c7a1f0d52b4
+Revises: 9bee8521e951
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op  # type: ignore
+
+# revision identifiers, used by Alembic.
+revision: str = '3c7a1f0d52b4'
+down_revision: Union[str, None] = '9bee8521e951'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # индекс по id_referal - префикс нового индекса, отдельно он не нужен
+    op.create_index('ix_user_id_referal_created_at', 'user', ['id_referal', 'created_at', 'id'], unique=False)
+    op.drop_index(op.f('ix_user_id_referal'), table_name='user')
+
+
+def downgrade() -> None:
+    op.create_index(op.f('ix_user_id_referal'), 'user', ['id_referal'], unique=False)
+    op.drop_index('ix_user_id_referal_created_at', table_name='user')
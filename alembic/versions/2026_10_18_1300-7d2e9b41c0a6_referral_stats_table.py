@@ -0,0 +1,35 @@
+"""Referral stats table
+
+Revision ID: 7d2e9b41c0a6
+Revises: 3c7a1f0d52b4
+Create Date: 2026-10-18 13:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+
+from alembic import op  # type: ignore
+
+# revision identifiers, used by Alembic.
+revision: str = '7d2e9b41c0a6'
+down_revision: Union[str, None] = '3c7a1f0d52b4'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('referral_stats',
+                    sa.Column('referrer_id', sa.UUID(), nullable=False),
+                    sa.Column('total', sa.Integer(), nullable=False),
+                    sa.Column('active', sa.Integer(), nullable=False),
+                    sa.Column('week_start', sa.Date(), nullable=False),
+                    sa.Column('joined_week', sa.Integer(), nullable=False),
+                    sa.ForeignKeyConstraint(['referrer_id'], ['user.id'], ondelete='cascade'),
+                    sa.PrimaryKeyConstraint('referrer_id')
+                    )
+    # счетчики существующих рефералов: python -m src.database.referral_stats
+
+
+def downgrade() -> None:
+    op.drop_table('referral_stats')
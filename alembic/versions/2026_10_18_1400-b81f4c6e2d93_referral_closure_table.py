@@ -0,0 +1,37 @@
+"""Referral closure table
+
+Revision ID: b81f4c6e2d93
+Revises: 7d2e9b41c0a6
+Create Date: 2026-10-18 14:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+
+from alembic import op  # type: ignore
+
+# revision identifiers, used by Alembic.
+revision: str = 'b81f4c6e2d93'
+down_revision: Union[str, None] = '7d2e9b41c0a6'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('referral_closure',
+                    sa.Column('ancestor_id', sa.UUID(), nullable=False),
+                    sa.Column('depth', sa.Integer(), nullable=False),
+                    sa.Column('descendant_id', sa.UUID(), nullable=False),
+                    sa.ForeignKeyConstraint(['ancestor_id'], ['user.id'], ondelete='cascade'),
+                    sa.ForeignKeyConstraint(['descendant_id'], ['user.id'], ondelete='cascade'),
+                    sa.PrimaryKeyConstraint('ancestor_id', 'depth', 'descendant_id')
+                    )
+    op.create_index('ix_referral_closure_descendant', 'referral_closure',
+                    ['descendant_id', 'depth', 'ancestor_id'], unique=False)
+    # пары для существующих рефералов: python -m src.database.referral_tree
+
+
+def downgrade() -> None:
+    op.drop_index('ix_referral_closure_descendant', table_name='referral_closure')
+    op.drop_table('referral_closure')
@@ -0,0 +1,41 @@
+"""User import progress tables
+
+Revision ID: e5a9c3d70f18
+Revises: b81f4c6e2d93
+Create Date: 2026-10-18 15:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+
+from alembic import op  # type: ignore
+
+# revision identifiers, used by Alembic.
+revision: str = 'e5a9c3d70f18'
+down_revision: Union[str, None] = 'b81f4c6e2d93'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('user_import',
+                    sa.Column('source', sa.String(length=1024), nullable=False),
+                    sa.Column('rows', sa.Integer(), nullable=False),
+                    sa.Column('inserted', sa.Integer(), nullable=False),
+                    sa.Column('skipped', sa.Integer(), nullable=False),
+                    sa.Column('rejected', sa.Integer(), nullable=False),
+                    sa.Column('updated_at', sa.TIMESTAMP(), nullable=True),
+                    sa.PrimaryKeyConstraint('source')
+                    )
+    op.create_table('user_import_referral',
+                    sa.Column('user_id', sa.UUID(), nullable=False),
+                    sa.Column('referrer_code', sa.String(length=10), nullable=False),
+                    sa.ForeignKeyConstraint(['user_id'], ['user.id'], ondelete='cascade'),
+                    sa.PrimaryKeyConstraint('user_id')
+                    )
+
+
+def downgrade() -> None:
+    op.drop_table('user_import_referral')
+    op.drop_table('user_import')
@@ -0,0 +1,68 @@
+'''Сравнение реализаций CacheBackend на одинаковой нагрузке.
+
+Для каждого backend выполняются одни и те же операции: чтение
+пользователя по username и список рефералов через get_about_referrals_or_load
+с загрузчиком, имитирующим запрос в базу. Backend redis требует доступный
+Redis из настроек приложения.
+
+    python -m benchmarks.bench_cache_backends --backends redis memory null
+'''
+import argparse
+import asyncio
+
+from benchmarks.bench_cache_memory import make_user
+from benchmarks.utils import summary, timer
+from src.database import cache_keys
+from src.database.cache import create_cache
+from src.database.serializers import UserDTO
+
+
+async def run(backend: str, users: list[UserDTO], rounds: int, db_latency: float) -> None:
+    cache = create_cache(backend)
+    await cache.start()
+    batch = cache.batch()
+    for user in users:
+        batch.set_user(user)
+    await batch.execute()
+
+    async def loader() -> list[UserDTO]:
+        await asyncio.sleep(db_latency)
+        return users[:10]
+
+    reads: list[float] = []
+    referrals: list[float] = []
+    for _ in range(rounds):
+        for user in users:
+            with timer(reads):
+                await cache.get_user(user.username)
+        for user in users[:100]:
+            with timer(referrals):
+                await cache.get_about_referrals_or_load(str(user.id), loader)
+    print(summary(f'{backend}: get_user', reads, sum(reads)))
+    print(summary(f'{backend}: referrals', referrals, sum(referrals)))
+
+    batch = cache.batch()
+    for user in users:
+        batch.delete(
+            cache_keys.user(user.id),
+            cache_keys.username(user.username),
+            cache_keys.email(user.email),
+            cache_keys.referrals(user.id),
+        )
+    await batch.execute()
+    await cache.close()
+
+
+async def main(args: argparse.Namespace) -> None:
+    users = [make_user(index) for index in range(args.users)]
+    for backend in args.backends:
+        await run(backend, users, args.rounds, args.db_latency)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--backends', nargs='+', default=['redis', 'memory', 'null'])
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--rounds', type=int, default=5)
+    parser.add_argument('--db-latency', type=float, default=0.002)
+    asyncio.run(main(parser.parse_args()))
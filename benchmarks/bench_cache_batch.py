@@ -0,0 +1,52 @@
+'''Отложенные записи в кеш: N обращений к Redis против одного pipeline.
+
+Каждая итерация повторяет набор записей одного запроса (пользователь,
+список рефералов, удаление индекса) поштучно и через CacheBatch. Нужен
+доступный Redis из настроек приложения; ключи бенчмарка удаляются.
+
+    python -m benchmarks.bench_cache_batch --requests 2000
+'''
+import argparse
+import asyncio
+
+from benchmarks.bench_cache_memory import PREFIX, cleanup, make_user
+from benchmarks.utils import summary, timer
+from src.database import cache_keys
+from src.database.redis_tools import RedisCache
+
+
+async def main(requests: int) -> None:
+    cache = RedisCache()
+    users = [make_user(index) for index in range(requests)]
+    sequential: list[float] = []
+    batched: list[float] = []
+
+    for user in users:
+        with timer(sequential):
+            await cache.set_user(user)
+            await cache.set_about_referrals_with_id(str(user.id), [user])
+            await cache.delete_email_user(f'{PREFIX}missing')
+    for user in users:
+        with timer(batched):
+            await (
+                cache.batch()
+                .set_user(user)
+                .set_referrals(str(user.id), [user])
+                .delete(cache_keys.email(f'{PREFIX}missing'))
+                .execute()
+            )
+
+    print(summary('по одной команде', sequential, sum(sequential)))
+    print(summary('CacheBatch', batched, sum(batched)))
+    batch = cache.batch()
+    for user in users:
+        batch.delete(cache_keys.user(user.id), cache_keys.referrals(user.id))
+    await batch.execute()
+    await cleanup(cache._redis)  # type: ignore
+    await cache.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--requests', type=int, default=2000)
+    asyncio.run(main(parser.parse_args().requests))
@@ -0,0 +1,83 @@
+'''Память Redis на одного закешированного пользователя.
+
+Сравнивает прежнюю схему (полная копия под username и под email) с общей
+записью пользователя и индексами username/email. На компактных записях
+накладные расходы Redis на ключ больше самого значения, поэтому третий ключ
+съедает экономию от единственной копии: схема с индексами занимает примерно
+столько же памяти, ее выигрыш в согласованности копий. Нужен доступный Redis
+из настроек приложения; ключи бенчмарка удаляются по завершении.
+
+    python -m benchmarks.bench_cache_memory --users 10000
+'''
+import argparse
+import asyncio
+import uuid
+from datetime import datetime, timedelta
+
+from redis import asyncio as aioredis
+
+from core.config import settings
+from src.database import cache_keys
+from src.database.redis_tools import RedisCache
+from src.database.serializers import UserDTO, dumps_user
+
+PREFIX = 'bench-memory:'
+
+
+def make_user(index: int) -> UserDTO:
+    now = datetime.now()
+    return UserDTO(
+        id=uuid.uuid4(),
+        username=f'{PREFIX}user{index}',
+        email=f'{PREFIX}user{index}@example.com',
+        created_at=now,
+        is_active=True,
+        referal_code=f'c{index:09d}',
+        exp_ref_code=now + timedelta(days=30),
+    )
+
+
+async def used_memory(redis: aioredis.Redis) -> int:
+    return (await redis.info('memory'))['used_memory']
+
+
+async def cleanup(redis: aioredis.Redis) -> None:
+    async for key in redis.scan_iter(match=f'*{PREFIX}*', count=1000):
+        await redis.delete(key)
+
+
+async def main(count: int) -> None:
+    redis = aioredis.from_url(settings.cache.url)
+    users = [make_user(index) for index in range(count)]
+
+    await cleanup(redis)
+    before = await used_memory(redis)
+    async with redis.pipeline(transaction=False) as pipe:
+        for user in users:
+            raw = dumps_user(user)
+            pipe.set(user.username, raw, ex=600)
+            pipe.set(user.email, raw, ex=300)
+        await pipe.execute()
+    duplicated = (await used_memory(redis) - before) / count
+    await cleanup(redis)
+
+    cache = RedisCache()
+    before = await used_memory(redis)
+    batch = cache.batch()
+    for user in users:
+        batch.set_user(user)
+    await batch.execute()
+    canonical = (await used_memory(redis) - before) / count
+    await redis.delete(*(cache_keys.user(user.id) for user in users))
+    await cleanup(redis)
+
+    print(f'копия под username и email: {duplicated:.0f} байт на пользователя')
+    print(f'запись + индексы:           {canonical:.0f} байт на пользователя')
+    await redis.aclose()
+    await cache.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--users', type=int, default=10000)
+    asyncio.run(main(parser.parse_args().users))
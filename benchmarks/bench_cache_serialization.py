@@ -0,0 +1,60 @@
+'''Размер и скорость кодирования значений кеша: pickle ORM-объектов против UserDTO.
+
+    python -m benchmarks.bench_cache_serialization --referrals 100
+'''
+import argparse
+import pickle
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Any, Callable
+
+from src.database.models import User
+from src.database.serializers import dumps_user, dumps_users, loads_user, loads_users
+
+
+def make_user(index: int, id_referal: uuid.UUID | None = None) -> User:
+    now = datetime.now()
+    return User(
+        id=uuid.uuid4(),
+        username=f'user{index}',
+        email=f'user{index}@example.com',
+        created_at=now,
+        hashed_password=b'$2b$12$' + b'x' * 53,
+        is_active=True,
+        id_referal=id_referal,
+        referal_code=f'code{index:06d}',
+        exp_ref_code=now + timedelta(days=30),
+    )
+
+
+def per_call_us(func: Callable[[], Any], number: int) -> float:
+    start = time.perf_counter()
+    for _ in range(number):
+        func()
+    return (time.perf_counter() - start) / number * 1_000_000
+
+
+def report(name: str, item: Any, dumps: Callable, loads: Callable, number: int) -> None:
+    raw = dumps(item)
+    encode = per_call_us(lambda: dumps(item), number)
+    decode = per_call_us(lambda: loads(raw), number)
+    print(f'{name:<28}{len(raw):>10}{encode:>14.1f}{decode:>14.1f}')
+
+
+def main(referrals: int, number: int) -> None:
+    user = make_user(0)
+    items = [make_user(index, user.id) for index in range(1, referrals + 1)]
+    print(f'{"":<28}{"bytes":>10}{"encode, us":>14}{"decode, us":>14}')
+    report('user: pickle ORM', user, pickle.dumps, pickle.loads, number)
+    report('user: UserDTO + orjson', user, dumps_user, loads_user, number)
+    report(f'{referrals} referrals: pickle ORM', items, pickle.dumps, pickle.loads, max(1, number // referrals))
+    report(f'{referrals} referrals: UserDTO', items, dumps_users, loads_users, max(1, number // referrals))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--referrals', type=int, default=100)
+    parser.add_argument('--number', type=int, default=20000)
+    args = parser.parse_args()
+    main(args.referrals, args.number)
@@ -0,0 +1,72 @@
+'''Пропускная способность подписи и проверки JWT по алгоритмам.
+
+    python -m benchmarks.bench_jwt_algorithms --seconds 2
+
+Для RS256 дополнительно меряется прежний путь, когда PyJWT получал PEM-строку
+и разбирал ключ при каждом вызове.
+'''
+import argparse
+import time
+from typing import Any, Callable
+
+import jwt
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ec, ed25519, rsa
+
+PAYLOAD = {
+    'sub': '8ad5a1a9-0181-4859-9865-15f335c131af',
+    'username': 'user1',
+    'email': 'user1@user1.user',
+}
+
+
+def generate(algorithm: str) -> Any:
+    if algorithm == 'ES256':
+        return ec.generate_private_key(ec.SECP256R1())
+    if algorithm == 'EdDSA':
+        return ed25519.Ed25519PrivateKey.generate()
+    return rsa.generate_private_key(public_exponent=65537, key_size=2048)
+
+
+def ops_per_second(func: Callable[[], Any], seconds: float) -> float:
+    count = 0
+    start = time.perf_counter()
+    stop = start + seconds
+    while time.perf_counter() < stop:
+        func()
+        count += 1
+    return count / (time.perf_counter() - start)
+
+
+def main(seconds: float) -> None:
+    cases: list[tuple[str, str, Any, Any]] = []
+    for algorithm in ('RS256', 'ES256', 'EdDSA'):
+        private_key = generate(algorithm)
+        cases.append((algorithm, algorithm, private_key, private_key.public_key()))
+    rsa_key = cases[0][2]
+    cases.append((
+        'RS256 (PEM per call)',
+        'RS256',
+        rsa_key.private_bytes(
+            serialization.Encoding.PEM,
+            serialization.PrivateFormat.PKCS8,
+            serialization.NoEncryption(),
+        ),
+        rsa_key.public_key().public_bytes(
+            serialization.Encoding.PEM,
+            serialization.PublicFormat.SubjectPublicKeyInfo,
+        ),
+    ))
+
+    print(f'{"algorithm":<24}{"sign/s":>12}{"verify/s":>12}')
+    for name, algorithm, private_key, public_key in cases:
+        token = jwt.encode(PAYLOAD, private_key, algorithm=algorithm)
+        sign = ops_per_second(lambda: jwt.encode(PAYLOAD, private_key, algorithm=algorithm), seconds)
+        verify = ops_per_second(lambda: jwt.decode(token, public_key, algorithms=[algorithm]), seconds)
+        print(f'{name:<24}{sign:>12.0f}{verify:>12.0f}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--seconds', type=float, default=2.0)
+    main(parser.parse_args().seconds)
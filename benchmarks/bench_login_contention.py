@@ -0,0 +1,83 @@
+'''Задержка не связанных с авторизацией запросов во время логинов.
+
+Запускается против работающего сервиса:
+
+    python -m benchmarks.bench_login_contention --url http://127.0.0.1:8000 \
+        --username user1 --password password --logins 16 --readers 32
+
+Сначала меряется фон (только GET /auth/user/me), затем та же нагрузка вместе с
+параллельными POST /auth/login. До выноса bcrypt из event loop p99 чтений во
+второй фазе растет до сотен миллисекунд, после - остается близким к фону,
+а лишние логины получают 503.
+'''
+import argparse
+import asyncio
+import time
+from collections import Counter
+
+import httpx
+
+from benchmarks.utils import summary, timer
+
+
+async def reader(client: httpx.AsyncClient, token: str, stop: float, samples: list[float]) -> None:
+    headers = {'Authorization': f'Bearer {token}'}
+    while time.perf_counter() < stop:
+        with timer(samples):
+            await client.get('/auth/user/me/', headers=headers)
+
+
+async def login(
+    client: httpx.AsyncClient,
+    form: dict[str, str],
+    stop: float,
+    samples: list[float],
+    statuses: Counter,
+) -> None:
+    while time.perf_counter() < stop:
+        with timer(samples):
+            response = await client.post('/auth/login', data=form)
+        statuses[response.status_code] += 1
+
+
+async def phase(
+    client: httpx.AsyncClient,
+    token: str,
+    form: dict[str, str],
+    readers: int,
+    logins: int,
+    duration: float,
+) -> None:
+    stop = time.perf_counter() + duration
+    read_samples: list[float] = []
+    login_samples: list[float] = []
+    statuses: Counter = Counter()
+    await asyncio.gather(
+        *(reader(client, token, stop, read_samples) for _ in range(readers)),
+        *(login(client, form, stop, login_samples, statuses) for _ in range(logins)),
+    )
+    print(summary(f'GET /auth/user/me (logins={logins})', read_samples, duration))
+    if logins:
+        print(summary('POST /auth/login', login_samples, duration), dict(statuses))
+
+
+async def main(args: argparse.Namespace) -> None:
+    form = {'username': args.username, 'password': args.password}
+    limits = httpx.Limits(max_connections=args.readers + args.logins)
+    async with httpx.AsyncClient(base_url=args.url, limits=limits, timeout=30) as client:
+        response = await client.post('/auth/login', data=form)
+        response.raise_for_status()
+        token = response.json()['access_token']
+        await phase(client, token, form, args.readers, 0, args.duration)
+        await phase(client, token, form, args.readers, args.logins, args.duration)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--url', default='http://127.0.0.1:8000')
+    parser.add_argument('--username', required=True)
+    parser.add_argument('--password', required=True)
+    parser.add_argument('--readers', type=int, default=32)
+    parser.add_argument('--logins', type=int, default=16)
+    parser.add_argument('--duration', type=float, default=10.0)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,126 @@
+'''Чтение списка рефералов: сущности ORM против выборки столбцов в UserDTO.
+
+Создается реферер с --referrals рефералами, у каждого хеш пароля размером
+--hash-bytes. Режим entity читает select(User) и проверяет каждую сущность
+схемой ответа, как списки рефералов до выборки столбцов. Режим columns
+читает referrals_query в UserDTO и сериализует ответ через json_page, режим
+stream - тот же запрос через серверный курсор частями в NDJSON. Для каждого
+режима печатаются строки в секунду и пик памяти Python (tracemalloc) на
+10 тысяч рефералов. Нужен
+Postgres из настроек приложения с созданными таблицами; данные бенчмарка
+удаляются.
+
+    python -m benchmarks.bench_referral_projection --referrals 10000 --rounds 5
+'''
+import argparse
+import asyncio
+import os
+import time
+import tracemalloc
+import uuid
+from datetime import datetime, timedelta
+
+import orjson
+from sqlalchemy import delete, insert, select
+
+from benchmarks.utils import summary, timer
+from src.api.pagination import (
+    json_page,
+    load_referrals,
+    ndjson_lines,
+    referrals_query,
+    stream_referrals,
+)
+from src.database.config import async_session_maker, engine
+from src.database.models import User
+from src.database.schemas import User as UserSchema
+
+PREFIX = 'bench_proj_'
+
+
+async def seed(referrer: uuid.UUID, referrals: int, hash_bytes: int) -> None:
+    start = datetime.now()
+    rows = [
+        {
+            'id': uuid.uuid4(),
+            'username': f'{PREFIX}{index}',
+            'email': f'{PREFIX}{index}@bench.user',
+            'created_at': start + timedelta(microseconds=index),
+            'hashed_password': os.urandom(hash_bytes),
+            'id_referal': referrer,
+        }
+        for index in range(referrals)
+    ]
+    async with async_session_maker() as session:
+        for offset in range(0, len(rows), 1000):
+            await session.execute(insert(User), rows[offset:offset + 1000])
+        await session.commit()
+
+
+async def read_entities(referrer: uuid.UUID) -> int:
+    async with async_session_maker() as session:
+        users = (
+            await session.execute(
+                select(User).where(User.id_referal == referrer).order_by(User.created_at, User.id)
+            )
+        ).scalars().all()
+        return len([UserSchema.model_validate(user, from_attributes=True) for user in users])
+
+
+async def read_columns(referrer: uuid.UUID, referrals: int) -> int:
+    async with async_session_maker() as session:
+        users = await load_referrals(session, referrer, None, referrals)
+        return len(orjson.loads(json_page(users, None, UserSchema).body))
+
+
+async def read_stream(referrer: uuid.UUID) -> int:
+    count = 0
+    async with async_session_maker() as session:
+        async for chunk in ndjson_lines(stream_referrals(session, referrer, None), UserSchema):
+            count += chunk.count(b'\n')
+    return count
+
+
+async def main(args: argparse.Namespace) -> None:
+    referrer = uuid.uuid4()
+    await seed(referrer, args.referrals, args.hash_bytes)
+    modes = {
+        'entity': lambda: read_entities(referrer),
+        'columns': lambda: read_columns(referrer, args.referrals),
+        'stream': lambda: read_stream(referrer),
+    }
+    print(referrals_query(referrer).compile(engine.sync_engine))
+    try:
+        for mode in args.modes:
+            read = modes[mode]
+            await read()
+            samples: list[float] = []
+            rows = 0
+            for _ in range(args.rounds):
+                with timer(samples):
+                    rows += await read()
+            tracemalloc.start()
+            await read()
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            print(summary(f'{mode}: {args.referrals} referrals', samples, sum(samples)))
+            print(
+                f'{"":<32} rows/s={rows / sum(samples):.0f}'
+                f' peak={peak / args.referrals * 10000 / 2 ** 20:.1f} MiB per 10k referrals'
+            )
+    finally:
+        async with async_session_maker() as session:
+            await session.execute(delete(User).where(User.username.startswith(PREFIX)))
+            await session.commit()
+        await engine.dispose()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--referrals', type=int, default=10000)
+    parser.add_argument('--hash-bytes', type=int, default=60)
+    parser.add_argument('--rounds', type=int, default=5)
+    parser.add_argument('--modes', nargs='+', default=['entity', 'columns', 'stream'])
+    start = time.perf_counter()
+    asyncio.run(main(parser.parse_args()))
+    print(f'total {time.perf_counter() - start:.1f}s')
@@ -0,0 +1,129 @@
+'''Запросы к дереву рефералов: таблица замыкания против рекурсивного CTE.
+
+Для выборки пользователей леса из benchmarks.referral_forest измеряются
+размер поддерева, потомки до глубины --depth (не больше --limit) и цепочка
+рефереров. Режим closure выполняет запросы src.database.referral_tree,
+режим recursive - рекурсивные CTE по id_referal, как без таблицы замыкания.
+Рефереры выбираются из пар таблицы замыкания, поэтому пользователи с большими
+поддеревьями встречаются чаще. Нужен Postgres с созданным лесом:
+
+    python -m benchmarks.referral_forest --users 1000000
+    python -m benchmarks.bench_referral_tree --samples 200 --depth 3
+'''
+import argparse
+import asyncio
+import random
+import statistics
+import time
+import uuid
+from typing import Any, Callable
+
+from sqlalchemy import Executable, text
+
+from benchmarks.referral_forest import PREFIX
+from benchmarks.utils import summary, timer
+from src.database.config import engine
+from src.database.referral_tree import (
+    ancestors_query,
+    descendants_query,
+    subtree_size_query,
+)
+
+RECURSIVE_DESCENDANTS = text('''
+    WITH RECURSIVE tree (id, depth) AS (
+        SELECT id, 1 FROM "user" WHERE id_referal = :id
+        UNION ALL
+        SELECT u.id, tree.depth + 1 FROM "user" u JOIN tree ON u.id_referal = tree.id WHERE tree.depth < :depth
+    )
+    SELECT u.id, u.username, u.id_referal, tree.depth
+    FROM tree JOIN "user" u ON u.id = tree.id
+    ORDER BY tree.depth, tree.id
+    LIMIT :limit
+''')
+
+RECURSIVE_SIZE = text('''
+    WITH RECURSIVE tree (id) AS (
+        SELECT id FROM "user" WHERE id_referal = :id
+        UNION ALL
+        SELECT u.id FROM "user" u JOIN tree ON u.id_referal = tree.id
+    )
+    SELECT count(*) FROM tree
+''')
+
+RECURSIVE_ANCESTORS = text('''
+    WITH RECURSIVE chain (id, id_referal, depth) AS (
+        SELECT r.id, r.id_referal, 1 FROM "user" u JOIN "user" r ON r.id = u.id_referal WHERE u.id = :id
+        UNION ALL
+        SELECT r.id, r.id_referal, chain.depth + 1 FROM chain JOIN "user" r ON r.id = chain.id_referal
+    )
+    SELECT chain.id, r.username, chain.id_referal, chain.depth
+    FROM chain JOIN "user" r ON r.id = chain.id
+    ORDER BY chain.depth
+''')
+
+
+async def sample(statement: str, count: int) -> list[uuid.UUID]:
+    async with engine.connect() as conn:
+        return list((await conn.execute(text(statement), {'count': count})).scalars())
+
+
+async def measure(name: str, ids: list[uuid.UUID], query: Callable[[uuid.UUID], Executable]) -> list[Any]:
+    results: list[Any] = []
+    samples: list[float] = []
+    # оба режима выполняются через соединение Core, чтобы сравнивались запросы, а не пути выполнения ORM
+    async with engine.connect() as conn:
+        for id in ids:
+            with timer(samples):
+                results.append((await conn.execute(query(id))).all())
+    print(summary(name, samples, sum(samples)))
+    return results
+
+
+async def main(args: argparse.Namespace) -> None:
+    referrers = await sample(
+        'SELECT ancestor_id FROM referral_closure TABLESAMPLE SYSTEM (1) ORDER BY random() LIMIT :count',
+        args.samples,
+    )
+    users = await sample(
+        f"SELECT id FROM \"user\" WHERE username LIKE '{PREFIX}%' ORDER BY random() LIMIT :count",
+        args.samples,
+    )
+    if not referrers:
+        print('referral_closure is empty, create the forest: python -m benchmarks.referral_forest')
+        return None
+    random.shuffle(referrers)
+    params = {'depth': args.depth, 'limit': args.limit}
+    checks: dict[str, list[list[Any]]] = {}
+    for mode in args.modes:
+        start = time.perf_counter()
+        if mode == 'closure':
+            size = await measure('closure: subtree size', referrers, subtree_size_query)
+            tree = await measure(
+                f'closure: depth <= {args.depth}', referrers, lambda id: descendants_query(id, args.depth, args.limit)
+            )
+            chain = await measure('closure: referrers', users, ancestors_query)
+        else:
+            size = await measure('recursive: subtree size', referrers, lambda id: RECURSIVE_SIZE.bindparams(id=id))
+            tree = await measure(
+                f'recursive: depth <= {args.depth}',
+                referrers,
+                lambda id: RECURSIVE_DESCENDANTS.bindparams(id=id, **params),
+            )
+            chain = await measure('recursive: referrers', users, lambda id: RECURSIVE_ANCESTORS.bindparams(id=id))
+        print(f'{"":<32} {time.perf_counter() - start:.1f}s')
+        checks[mode] = [size, tree, chain]
+    sizes = [rows[0][0] for rows in next(iter(checks.values()))[0]]
+    print(f'subtree size: mean={statistics.fmean(sizes):.0f} max={max(sizes)}')
+    if len(checks) == 2:
+        closure, recursive = checks.values()
+        print('results match' if closure == recursive else 'RESULTS DIFFER')
+    await engine.dispose()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--samples', type=int, default=200)
+    parser.add_argument('--depth', type=int, default=3)
+    parser.add_argument('--limit', type=int, default=100)
+    parser.add_argument('--modes', nargs='+', default=['closure', 'recursive'])
+    asyncio.run(main(parser.parse_args()))
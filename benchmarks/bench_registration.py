@@ -0,0 +1,101 @@
+'''Пропускная способность регистрации со смесью неудачных попыток.
+
+Приложение вызывается в процессе через httpx. Доля попыток регистрирует
+занятый username (--duplicate-share), доля передает несуществующий
+реферальный код (--bad-code-share), доля - действующий код реферера
+(--referral-share), остальные - обычная регистрация. Нужен Postgres из
+настроек приложения с созданными таблицами; пользователи бенчмарка
+удаляются. Стоимость хеша задается настройками, например:
+
+    HASH_BCRYPT_ROUNDS=10 python -m benchmarks.bench_registration --attempts 400
+'''
+import argparse
+import asyncio
+import random
+import time
+import uuid
+from collections import Counter, defaultdict
+
+import httpx
+from sqlalchemy import delete
+
+from benchmarks.utils import summary, timer
+from main import app
+from src.database.cache import get_cache
+from src.database.config import engine
+from src.database.models import User
+
+PASSWORD = 'bench_password'
+
+
+def registration(username: str, referal_code: str | None = None) -> dict[str, str]:
+    params = {'username': username, 'email': f'{username}@bench.user', 'password': PASSWORD}
+    if referal_code:
+        params['referal_code'] = referal_code
+    return params
+
+
+async def main(args: argparse.Namespace) -> None:
+    prefix = f'bench_reg_{uuid.uuid4().hex[:6]}_'
+    cache = get_cache()
+    await cache.start()
+    async with httpx.AsyncClient(app=app, base_url='http://bench', timeout=60) as client:
+        referrer = f'{prefix}referrer'
+        response = await client.post('/auth/registration/', params=registration(referrer))
+        response.raise_for_status()
+        response = await client.post('/auth/login', data={'username': referrer, 'password': PASSWORD})
+        headers = {'Authorization': f'Bearer {response.json()["access_token"]}'}
+        response = await client.patch('/auth/user/me/referralcode/', headers=headers)
+        response.raise_for_status()
+        code = response.json()['referal_code']
+        taken = [f'{prefix}taken{index}' for index in range(8)]
+        for username in taken:
+            (await client.post('/auth/registration/', params=registration(username))).raise_for_status()
+
+        attempts: list[tuple[str, dict[str, str]]] = []
+        random.seed(args.seed)
+        for index in range(args.attempts):
+            draw = random.random()
+            if draw < args.duplicate_share:
+                attempts.append(('duplicate', registration(random.choice(taken))))
+            elif draw < args.duplicate_share + args.bad_code_share:
+                attempts.append(('bad_code', registration(f'{prefix}{index}', 'XXXXXXXXXX')))
+            elif draw < args.duplicate_share + args.bad_code_share + args.referral_share:
+                attempts.append(('referral', registration(f'{prefix}{index}', code)))
+            else:
+                attempts.append(('plain', registration(f'{prefix}{index}')))
+
+        samples: dict[str, list[float]] = defaultdict(list)
+        statuses: Counter = Counter()
+
+        async def worker() -> None:
+            while attempts:
+                kind, params = attempts.pop()
+                with timer(samples[kind]):
+                    response = await client.post('/auth/registration/', params=params)
+                statuses[kind, response.status_code] += 1
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+        elapsed = time.perf_counter() - start
+
+    print(summary('POST /auth/registration/', [s for kind in samples.values() for s in kind], elapsed))
+    for kind, kind_samples in sorted(samples.items()):
+        print(summary(f'  {kind}', kind_samples))
+    print(dict(sorted(statuses.items())))
+
+    async with engine.begin() as conn:
+        await conn.execute(delete(User).where(User.username.startswith(prefix)))
+    await cache.close()
+    await engine.dispose()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--attempts', type=int, default=400)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--duplicate-share', type=float, default=0.2)
+    parser.add_argument('--bad-code-share', type=float, default=0.1)
+    parser.add_argument('--referral-share', type=float, default=0.3)
+    parser.add_argument('--seed', type=int, default=1)
+    asyncio.run(main(parser.parse_args()))
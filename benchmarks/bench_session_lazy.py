@@ -0,0 +1,139 @@
+'''GET /auth/user/me при 95% попаданий в кеш: сессии, соединения и задержка.
+
+Приложение вызывается в процессе через httpx. Перед частью запросов
+(--miss-ratio) пользователь удаляется из кеша, и запрос идет в базу.
+Режим eager создает сессии в начале каждого запроса, как было до ленивого
+SessionRouter; режим lazy - текущее поведение. Нужны Redis и Postgres из
+настроек приложения с созданными таблицами.
+
+    python -m benchmarks.bench_session_lazy --requests 5000 --readers 8
+'''
+import argparse
+import asyncio
+import random
+import statistics
+import time
+from typing import AsyncGenerator
+
+import httpx
+from fastapi import Depends
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from benchmarks.utils import summary, timer
+from main import app
+from src.database import cache_keys
+from src.database.cache import get_cache
+from src.database.config import (
+    async_session_maker,
+    engine,
+    get_session_maker,
+    replica_session_maker,
+)
+from src.database.replica import SessionRouter, get_session_router
+
+USERNAME = 'bench_lazy'
+PASSWORD = 'bench_lazy_password'
+
+
+class CountingMaker:
+    '''Фабрика сессий, считающая созданные сессии'''
+
+    __slots__ = ['created']
+
+    def __init__(self) -> None:
+        self.created = 0
+
+    def __call__(self) -> AsyncSession:
+        self.created += 1
+        return async_session_maker()
+
+
+async def eager_session_router(
+    session_maker: async_sessionmaker[AsyncSession] = Depends(get_session_maker),
+) -> AsyncGenerator[SessionRouter, None]:
+    router = SessionRouter(session_maker, replica_session_maker)
+    router.primary
+    router.reader()
+    try:
+        yield router
+    finally:
+        await router.close()
+
+
+async def run(client: httpx.AsyncClient, token: str, args: argparse.Namespace, label: str) -> None:
+    maker = CountingMaker()
+    app.dependency_overrides[get_session_maker] = lambda: maker
+    checkouts = 0
+
+    def on_checkout(*_: object) -> None:
+        nonlocal checkouts
+        checkouts += 1
+
+    event.listen(engine.sync_engine, 'checkout', on_checkout)
+    cache = get_cache()
+    headers = {'Authorization': f'Bearer {token}'}
+    samples: list[float] = []
+    occupancy: list[int] = []
+    remaining = args.requests
+    done = asyncio.Event()
+
+    async def reader() -> None:
+        nonlocal remaining
+        while remaining > 0:
+            remaining -= 1
+            if random.random() < args.miss_ratio:
+                # вытеснение, а не инвалидация: после нее запись в кеш на время блокируется
+                await cache.batch().delete(cache_keys.username(USERNAME)).execute()
+            with timer(samples):
+                response = await client.get('/auth/user/me/', headers=headers)
+            response.raise_for_status()
+
+    async def sampler() -> None:
+        while not done.is_set():
+            occupancy.append(engine.pool.checkedout())  # type: ignore
+            await asyncio.sleep(0.001)
+
+    sampling = asyncio.create_task(sampler())
+    start = time.perf_counter()
+    await asyncio.gather(*(reader() for _ in range(args.readers)))
+    elapsed = time.perf_counter() - start
+    done.set()
+    await sampling
+    event.remove(engine.sync_engine, 'checkout', on_checkout)
+    print(summary(f'GET /auth/user/me [{label}]', samples, elapsed))
+    print(
+        f'{"":<32} sessions={maker.created} checkouts={checkouts}'
+        f' pool checked out: mean={statistics.fmean(occupancy):.2f} max={max(occupancy)}'
+    )
+
+
+async def main(args: argparse.Namespace) -> None:
+    cache = get_cache()
+    await cache.start()
+    async with httpx.AsyncClient(app=app, base_url='http://bench') as client:
+        await client.post(
+            '/auth/registration/',
+            params={'username': USERNAME, 'email': f'{USERNAME}@bench.user', 'password': PASSWORD},
+        )
+        response = await client.post('/auth/login', data={'username': USERNAME, 'password': PASSWORD})
+        response.raise_for_status()
+        token = response.json()['access_token']
+        for mode in args.modes:
+            if mode == 'eager':
+                app.dependency_overrides[get_session_router] = eager_session_router
+            else:
+                app.dependency_overrides.pop(get_session_router, None)
+            await run(client, token, args, mode)
+    app.dependency_overrides.clear()
+    await cache.close()
+    await engine.dispose()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--requests', type=int, default=5000)
+    parser.add_argument('--readers', type=int, default=8)
+    parser.add_argument('--miss-ratio', type=float, default=0.05)
+    parser.add_argument('--modes', nargs='+', default=['eager', 'lazy'])
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,124 @@
+'''Загрузка пользователей: COPY пачками против INSERT с коммитом на строку.
+
+Создается NDJSON с --users записями. Доля --hash-share передает пароль,
+остальные - готовый хеш (синтетический: уникальная строка формата bcrypt,
+проверять его при входе не нужно). У каждого пользователя свой код, доля
+--referral-share пришла по коду случайного более раннего пользователя.
+Режим import загружает файл src.database.user_import и связывает рефереров,
+режим rows вставляет первые --rows записей по одной, как регистрация без
+HTTP и хеширования. Нужен Postgres из настроек приложения с созданными
+таблицами; пользователи бенчмарка удаляются. Хеширование bcrypt в сотни раз
+медленнее записи, поэтому его лучше измерять отдельно:
+
+    python -m benchmarks.bench_user_import --users 200000
+    python -m benchmarks.bench_user_import --users 100 --hash-share 1 --batch-size 50 --modes import
+'''
+import argparse
+import asyncio
+import random
+import string
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import orjson
+from sqlalchemy import delete, insert
+
+from benchmarks.utils import summary, timer
+from src.database.config import engine
+from src.database.models import User, UserImport
+from src.database.user_import import import_users, link_referrers
+
+PREFIX = 'bench_import_'
+ALPHABET = string.ascii_letters + string.digits + './'
+
+
+def records(args: argparse.Namespace) -> list[dict]:
+    rng = random.Random(args.seed)
+    start = datetime.now() - timedelta(days=365)
+    result = []
+    for index in range(args.users):
+        record = {
+            'username': f'{PREFIX}{index}',
+            'email': f'{PREFIX}{index}@import.user',
+            'created_at': (start + timedelta(seconds=index)).isoformat(),
+            'referal_code': f'I{index:09d}',
+            'exp_ref_code': (start + timedelta(days=730)).isoformat(),
+        }
+        if rng.random() < args.hash_share:
+            record['password'] = f'{PREFIX}{index}'
+        else:
+            record['hashed_password'] = '$2b$12$' + ''.join(rng.choices(ALPHABET, k=53))
+        if index and rng.random() < args.referral_share:
+            record['referrer_code'] = f'I{rng.randrange(index):09d}'
+        result.append(record)
+    return result
+
+
+async def import_file(path: Path, args: argparse.Namespace) -> None:
+    start = time.perf_counter()
+    progress = await import_users(path, 'ndjson', batch_size=args.batch_size, workers=args.workers)
+    elapsed = time.perf_counter() - start
+    start = time.perf_counter()
+    async with engine.begin() as conn:
+        linked, pending, rejected = await link_referrers(conn)
+    print(f'import: {progress.inserted} users in {elapsed:.1f}s ({progress.inserted / elapsed:.0f} rows/s)')
+    print(
+        f'link: {linked} referrers, {pending} pending, {len(rejected)} rejected '
+        f'in {time.perf_counter() - start:.1f}s'
+    )
+
+
+async def insert_rows(items: list[dict]) -> None:
+    samples: list[float] = []
+    start = time.perf_counter()
+    for record in items:
+        values = {
+            'id': uuid.uuid4(),
+            'username': record['username'],
+            'email': record['email'],
+            'created_at': datetime.fromisoformat(record['created_at']),
+            'hashed_password': (record.get('hashed_password') or record['password']).encode(),
+        }
+        with timer(samples):
+            async with engine.begin() as conn:
+                await conn.execute(insert(User).values(**values))
+    print(summary('rows: INSERT + COMMIT', samples, time.perf_counter() - start))
+
+
+async def cleanup(path: Path) -> None:
+    async with engine.begin() as conn:
+        await conn.execute(delete(User).where(User.username.startswith(PREFIX)))
+        await conn.execute(delete(UserImport).where(UserImport.source == str(path.resolve())))
+
+
+async def main(args: argparse.Namespace) -> None:
+    items = records(args)
+    with tempfile.TemporaryDirectory() as directory:
+        path = Path(directory) / 'users.ndjson'
+        path.write_bytes(b''.join(orjson.dumps(record) + b'\n' for record in items))
+        try:
+            for mode in args.modes:
+                if mode == 'import':
+                    await import_file(path, args)
+                else:
+                    await insert_rows(items[:args.rows])
+                await cleanup(path)
+        finally:
+            await cleanup(path)
+    await engine.dispose()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--users', type=int, default=200_000)
+    parser.add_argument('--hash-share', type=float, default=0.0)
+    parser.add_argument('--referral-share', type=float, default=0.8)
+    parser.add_argument('--batch-size', type=int, default=5000)
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--rows', type=int, default=5000)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--modes', nargs='+', default=['import', 'rows'])
+    asyncio.run(main(parser.parse_args()))
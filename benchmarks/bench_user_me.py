@@ -0,0 +1,45 @@
+'''Пропускная способность GET /auth/user/me при разных режимах кеша.
+
+Запускается против работающего сервиса; режим кеша задается переменными
+окружения сервиса, бенчмарк лишь подписывает результат меткой:
+
+    CACHE_LOCAL_ENABLED=false uvicorn main:app
+    python -m benchmarks.bench_user_me --username user1 --password password --label redis
+
+    CACHE_LOCAL_ENABLED=true CACHE_LOCAL_INVALIDATION=tracking uvicorn main:app
+    python -m benchmarks.bench_user_me --username user1 --password password --label tracking
+'''
+import argparse
+import asyncio
+import time
+
+import httpx
+
+from benchmarks.bench_login_contention import reader
+from benchmarks.utils import summary
+
+
+async def main(args: argparse.Namespace) -> None:
+    form = {'username': args.username, 'password': args.password}
+    limits = httpx.Limits(max_connections=args.readers)
+    async with httpx.AsyncClient(base_url=args.url, limits=limits, timeout=30) as client:
+        response = await client.post('/auth/login', data=form)
+        response.raise_for_status()
+        token = response.json()['access_token']
+        # прогрев: пользователь попадает в Redis и в L1 воркера
+        await reader(client, token, time.perf_counter() + 1.0, [])
+        samples: list[float] = []
+        stop = time.perf_counter() + args.duration
+        await asyncio.gather(*(reader(client, token, stop, samples) for _ in range(args.readers)))
+    print(summary(f'GET /auth/user/me [{args.label}]', samples, args.duration))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--url', default='http://127.0.0.1:8000')
+    parser.add_argument('--username', required=True)
+    parser.add_argument('--password', required=True)
+    parser.add_argument('--readers', type=int, default=32)
+    parser.add_argument('--duration', type=float, default=10.0)
+    parser.add_argument('--label', default='')
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,126 @@
+'''Синтетический лес рефералов для бенчмарков дерева.
+
+Пользователи создаются по порядку регистрации: доля --root-share без
+реферера, остальные приглашены случайным из уже зарегистрированных, так что
+у ранних пользователей поддеревья больше. Глубина ограничена --max-depth:
+если выбранный реферер слишком глубоко, приглашает его реферер. Пользователи
+и пары таблицы замыкания загружаются через COPY, счетчики referral_stats
+пересчитываются. Нужен Postgres из настроек приложения с созданными
+таблицами. Пользователи леса имеют префикс --prefix и удаляются с --drop.
+
+    python -m benchmarks.referral_forest --users 1000000
+'''
+import argparse
+import asyncio
+import random
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Iterator
+
+from sqlalchemy import delete, func, select, text
+
+from src.database.config import engine
+from src.database.models import User
+from src.database.referral_stats import backfill
+
+PREFIX = 'forest_'
+
+
+class Forest:
+    '''Лес в памяти: реферер и глубина каждого пользователя по номеру регистрации'''
+
+    __slots__ = ['ids', 'parents', 'depths']
+
+    def __init__(self, users: int, root_share: float, max_depth: int, seed: int) -> None:
+        rng = random.Random(seed)
+        self.ids = [uuid.UUID(int=rng.getrandbits(128), version=4) for _ in range(users)]
+        self.parents = [-1] * users
+        self.depths = [0] * users
+        for index in range(1, users):
+            if rng.random() < root_share:
+                continue
+            parent = rng.randrange(index)
+            while self.depths[parent] >= max_depth:
+                parent = self.parents[parent]
+            self.parents[index] = parent
+            self.depths[index] = self.depths[parent] + 1
+
+    def users(self, prefix: str) -> Iterator[tuple]:
+        start = datetime.now() - timedelta(days=365)
+        for index, id in enumerate(self.ids):
+            parent = self.parents[index]
+            yield (
+                id,
+                f'{prefix}{index}',
+                f'{prefix}{index}@forest.user',
+                start + timedelta(seconds=index),
+                f'{prefix}{index}'.encode(),
+                True,
+                self.ids[parent] if parent >= 0 else None,
+            )
+
+    def closure(self) -> Iterator[tuple]:
+        for index, id in enumerate(self.ids):
+            ancestor, depth = self.parents[index], 1
+            while ancestor >= 0:
+                yield self.ids[ancestor], depth, id
+                ancestor, depth = self.parents[ancestor], depth + 1
+
+
+async def generate(args: argparse.Namespace) -> None:
+    start = time.perf_counter()
+    forest = Forest(args.users, args.root_share, args.max_depth, args.seed)
+    print(
+        f'forest: {args.users} users, {forest.parents.count(-1)} roots,'
+        f' {sum(forest.depths)} closure pairs, max depth {max(forest.depths)}'
+        f' ({time.perf_counter() - start:.1f}s)'
+    )
+    async with engine.connect() as conn:
+        driver = (await conn.get_raw_connection()).driver_connection
+        start = time.perf_counter()
+        await driver.copy_records_to_table(
+            'user',
+            records=forest.users(args.prefix),
+            columns=['id', 'username', 'email', 'created_at', 'hashed_password', 'is_active', 'id_referal'],
+        )
+        print(f'COPY user: {time.perf_counter() - start:.1f}s')
+        start = time.perf_counter()
+        await driver.copy_records_to_table(
+            'referral_closure',
+            records=forest.closure(),
+            columns=['ancestor_id', 'depth', 'descendant_id'],
+        )
+        print(f'COPY referral_closure: {time.perf_counter() - start:.1f}s')
+        await driver.execute('ANALYZE "user"; ANALYZE referral_closure')
+    async with engine.begin() as conn:
+        print(f'referral_stats: {await backfill(conn)} referrers')
+
+
+async def main(args: argparse.Namespace) -> None:
+    async with engine.connect() as conn:
+        existing = (
+            await conn.execute(select(func.count()).where(User.username.startswith(args.prefix)))
+        ).scalar_one()
+    if args.drop:
+        async with engine.begin() as conn:
+            await conn.execute(delete(User).where(User.username.startswith(args.prefix)))
+            await conn.execute(text('ANALYZE "user"'))
+            await conn.execute(text('ANALYZE referral_closure'))
+        print(f'dropped {existing} users')
+    elif existing:
+        print(f'forest already exists: {existing} users, use --drop first')
+    else:
+        await generate(args)
+    await engine.dispose()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--users', type=int, default=1_000_000)
+    parser.add_argument('--root-share', type=float, default=0.2)
+    parser.add_argument('--max-depth', type=int, default=12)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--prefix', default=PREFIX)
+    parser.add_argument('--drop', action='store_true')
+    asyncio.run(main(parser.parse_args()))
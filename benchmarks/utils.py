@@ -0,0 +1,38 @@
+import statistics
+import time
+from contextlib import contextmanager
+from typing import Iterator
+
+
+def percentile(samples: list[float], q: float) -> float:
+    '''Перцентиль q (0..100) по списку замеров'''
+    if not samples:
+        return float('nan')
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, round(q / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def summary(name: str, samples: list[float], elapsed: float | None = None) -> str:
+    '''Строка отчета: количество, rps, p50/p95/p99 в миллисекундах'''
+    line = f'{name:<32} n={len(samples):<7}'
+    if elapsed:
+        line += f' rps={len(samples) / elapsed:<9.1f}'
+    if samples:
+        line += (
+            f' mean={statistics.fmean(samples) * 1000:.2f}ms'
+            f' p50={percentile(samples, 50) * 1000:.2f}ms'
+            f' p95={percentile(samples, 95) * 1000:.2f}ms'
+            f' p99={percentile(samples, 99) * 1000:.2f}ms'
+        )
+    return line
+
+
+@contextmanager
+def timer(samples: list[float]) -> Iterator[None]:
+    '''Добавить длительность блока в samples'''
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        samples.append(time.perf_counter() - start)
@@ -0,0 +1,31 @@
+import argparse
+
+from src.api.auth.password_policy import SCHEMES, calibrate_argon2, calibrate_bcrypt
+
+parser = argparse.ArgumentParser(
+    description='Подбор параметров хеширования паролей под целевое время проверки'
+)
+parser.add_argument('--target-ms', type=float, default=250, help='Целевое время проверки пароля, мс')
+parser.add_argument('--scheme', choices=SCHEMES, default='bcrypt', help='Схема для HASH_SCHEME')
+parser.add_argument('--argon2-memory-cost', type=int, default=65536, help='Память argon2, КиБ')
+parser.add_argument('--argon2-parallelism', type=int, default=4)
+args = parser.parse_args()
+target = args.target_ms / 1000
+
+rounds, bcrypt_elapsed = calibrate_bcrypt(target)
+print(f'bcrypt: rounds={rounds} verify={bcrypt_elapsed * 1000:.1f}ms')
+
+time_cost, argon2_elapsed = calibrate_argon2(
+    target,
+    memory_cost=args.argon2_memory_cost,
+    parallelism=args.argon2_parallelism,
+)
+print(f'argon2: time_cost={time_cost} memory_cost={args.argon2_memory_cost} '
+      f'parallelism={args.argon2_parallelism} verify={argon2_elapsed * 1000:.1f}ms')
+
+print('\nДобавьте в .env:')
+print(f'HASH_SCHEME={args.scheme}')
+print(f'HASH_BCRYPT_ROUNDS={rounds}')
+print(f'HASH_ARGON2_TIME_COST={time_cost}')
+print(f'HASH_ARGON2_MEMORY_COST={args.argon2_memory_cost}')
+print(f'HASH_ARGON2_PARALLELISM={args.argon2_parallelism}')
@@ -17,20 +17,94 @@ class DbSettings(BaseModel):
     POSTGRES_HOST: str = os.environ['POSTGRES_HOST']
     url: str = f'postgresql+asyncpg://{POSTGRES_USER}:{POSTGRES_PASSWORD}@{POSTGRES_HOST}:5432/{POSTGRES_DB}'
     create_db_url: str = f'postgresql://{POSTGRES_USER}:{POSTGRES_PASSWORD}@{POSTGRES_HOST}:5432/{POSTGRES_DB}'
+    # реплика для чтения; без нее все запросы идут в основную базу
+    POSTGRES_REPLICA_HOST: str | None = os.environ.get('POSTGRES_REPLICA_HOST')
+    replica_url: str | None = (
+        f'postgresql+asyncpg://{POSTGRES_USER}:{POSTGRES_PASSWORD}@{POSTGRES_REPLICA_HOST}:5432/{POSTGRES_DB}'
+        if POSTGRES_REPLICA_HOST else None
+    )
+    # столько секунд после записи воркер читает из основной базы, а не из реплики
+    replica_lag: float = float(os.environ.get('DB_REPLICA_LAG', 2.0))
+    pool_size: int = int(os.environ.get('DB_POOL_SIZE', 10))
+    max_overflow: int = int(os.environ.get('DB_MAX_OVERFLOW', 10))
+    pool_timeout: float = float(os.environ.get('DB_POOL_TIMEOUT', 30))
+    # соединения старше pool_recycle секунд переоткрываются, -1 - без ограничения
+    pool_recycle: int = int(os.environ.get('DB_POOL_RECYCLE', 1800))
+    pool_pre_ping: bool = os.environ.get('DB_POOL_PRE_PING', 'false').lower() == 'true'
+    # сколько соединений открыть при старте приложения
+    pool_warmup: int = int(os.environ.get('DB_POOL_WARMUP', 5))
+    # кеш подготовленных выражений на соединение (prepared_statement_cache_size диалекта asyncpg), 0 - отключен
+    statement_cache_size: int = int(os.environ.get('DB_STATEMENT_CACHE_SIZE', 100))
+    # работа через PgBouncer в режиме pool_mode=transaction: пул соединений держит PgBouncer,
+    # подготовленные выражения не кешируются и получают уникальные имена
+    pgbouncer: bool = os.environ.get('DB_PGBOUNCER', 'false').lower() == 'true'
 
 
 class AuthJWT(BaseModel):
     private_key_path: Path = BASE_DIR / 'certs' / 'jwt-private.key'
     public_key_path: Path = BASE_DIR / 'certs' / 'jwt-public.key'
-    algorithm: str = 'RS256'
+    retired_keys_dir: Path = BASE_DIR / 'certs' / 'retired'
+    algorithm: str = os.environ.get('JWT_ALGORITHM', 'RS256')  # RS256 | ES256 | EdDSA
     access_token_expire_minutes: float = 30
+    token_cache_size: int = int(os.environ.get('JWT_CACHE_SIZE', 10000))
+    # кеш проверенных токенов у каждого воркера свой: purge_subject очищает только текущий
+    # процесс, в остальных токен измененного пользователя принимается еще до token_cache_ttl секунд
+    token_cache_ttl: float = float(os.environ.get('JWT_CACHE_TTL', 60))
+
+
+class HashingSettings(BaseModel):
+    executor: str = os.environ.get('HASH_EXECUTOR', 'thread')  # thread | process
+    max_workers: int = int(os.environ.get('HASH_MAX_WORKERS', os.cpu_count() or 1))
+    max_queue: int = int(os.environ.get('HASH_MAX_QUEUE', 32))
+    scheme: str = os.environ.get('HASH_SCHEME', 'bcrypt')  # bcrypt | argon2
+    bcrypt_rounds: int = int(os.environ.get('HASH_BCRYPT_ROUNDS', 12))
+    argon2_time_cost: int = int(os.environ.get('HASH_ARGON2_TIME_COST', 3))
+    argon2_memory_cost: int = int(os.environ.get('HASH_ARGON2_MEMORY_COST', 65536))
+    argon2_parallelism: int = int(os.environ.get('HASH_ARGON2_PARALLELISM', 4))
 
 
 class RedisSettings(BaseModel):
     host: str = os.environ['REDIS_HOST']
     port: int = int(os.environ['REDIS_PORT'])
     url: str = f'redis://{host}:{port}'
-    exp_second_set: int = 600
+    # redis - общий кеш воркеров, memory - кеш в памяти одного процесса, null - без кеша
+    backend: str = os.environ.get('CACHE_BACKEND', 'redis')
+    memory_maxsize: int = int(os.environ.get('CACHE_MEMORY_MAXSIZE', 100000))
+    # записи инвалидируются событиями репозиториев, TTL лишь страхует от потерянной инвалидации
+    exp_second_set: int = int(os.environ.get('CACHE_USER_TTL', 6 * 3600))
+    exp_second_referrals: int = int(os.environ.get('CACHE_REFERRALS_TTL', 6 * 3600))
+    # после инвалидации ключи пользователя tombstone_ttl секунд не принимают запись,
+    # чтобы значение, прочитанное из базы до изменения, не вернулось в кеш на весь TTL
+    tombstone_ttl: int = int(os.environ.get('CACHE_TOMBSTONE_TTL', 30))
+    # последние stale_grace секунд жизни записи ее перестраивает один запрос,
+    # остальные получают прежнее значение
+    stale_grace: int = 30
+    rebuild_lock_ms: int = 5000
+    rebuild_wait: float = 1.0
+    local_enabled: bool = os.environ.get('CACHE_LOCAL_ENABLED', 'false').lower() == 'true'
+    local_maxsize: int = int(os.environ.get('CACHE_LOCAL_MAXSIZE', 10000))
+    local_ttl: float = float(os.environ.get('CACHE_LOCAL_TTL', 30))
+    # pubsub - воркеры сами публикуют измененные ключи в invalidation_channel,
+    # tracking - Redis сообщает об изменении ключей (CLIENT TRACKING BCAST)
+    local_invalidation: str = os.environ.get('CACHE_LOCAL_INVALIDATION', 'pubsub')
+    invalidation_channel: str = 'cache:invalidate'
+    tracking_ping_interval: float = 5.0
+    # бюджет времени на одно обращение к Redis, после него запрос идет в базу
+    timeout: float = float(os.environ.get('CACHE_TIMEOUT', 0.05))
+    write_timeout: float = float(os.environ.get('CACHE_WRITE_TIMEOUT', 0.5))
+    breaker_failures: int = 5
+    breaker_reset: float = 5.0
+    max_pending_writes: int = int(os.environ.get('CACHE_MAX_PENDING_WRITES', 256))
+    # инвалидации, ожидающие повтора; при переполнении очищается L1 воркера
+    max_pending_retries: int = int(os.environ.get('CACHE_MAX_PENDING_RETRIES', 1024))
+
+
+class PaginationSettings(BaseModel):
+    # размер страницы по умолчанию; первая страница такого размера кешируется
+    default_limit: int = int(os.environ.get('PAGE_DEFAULT_LIMIT', 100))
+    max_limit: int = int(os.environ.get('PAGE_MAX_LIMIT', 1000))
+    # строк за одно чтение из серверного курсора при потоковом ответе
+    stream_batch: int = int(os.environ.get('PAGE_STREAM_BATCH', 500))
 
 
 class Email_SMTP_Server(BaseModel):
@@ -46,8 +120,12 @@ class Settings(BaseSettings):
 
     auth: AuthJWT = AuthJWT()
 
+    hashing: HashingSettings = HashingSettings()
+
     cache: RedisSettings = RedisSettings()
 
+    pagination: PaginationSettings = PaginationSettings()
+
     emailserver: Email_SMTP_Server = Email_SMTP_Server()
 
 
@@ -1,23 +1,64 @@
+import argparse
+import os
+import time
 from pathlib import Path
 
-from Crypto.PublicKey import RSA
+from Crypto.PublicKey import ECC, RSA
+
+ALGORITHMS = ('RS256', 'ES256', 'EdDSA')
 
 certsfolder = Path('certs/').exists()
 if not certsfolder:
     Path('certs/').mkdir()
 
 
-def generate(bit_size):
-    keys = RSA.generate(bit_size)
-    return keys
+def generate(algorithm, bit_size=2048):
+    if algorithm == 'ES256':
+        return ECC.generate(curve='P-256')
+    if algorithm == 'EdDSA':
+        return ECC.generate(curve='Ed25519')
+    return RSA.generate(bit_size)
+
+
+def export_private(keys):
+    if isinstance(keys, ECC.EccKey):
+        return keys.export_key(format='PEM').encode()
+    return keys.export_key()
+
+
+def export_public(keys):
+    if isinstance(keys, ECC.EccKey):
+        return keys.public_key().export_key(format='PEM').encode()
+    return keys.publickey().export_key('PEM')
+
+
+parser = argparse.ArgumentParser(description='Генерация ключей для подписи JWT')
+parser.add_argument(
+    '--algorithm',
+    choices=ALGORITHMS,
+    default=os.environ.get('JWT_ALGORITHM', 'RS256'),
+)
+parser.add_argument('--bits', type=int, default=2048, help='Размер RSA ключа')
+parser.add_argument(
+    '--rotate',
+    action='store_true',
+    help='Сохранить текущий публичный ключ в certs/retired/, '
+         'чтобы ранее выданные токены оставались валидными',
+)
+args = parser.parse_args()
 
+if args.rotate and Path('certs/jwt-public.key').exists():
+    Path('certs/retired/').mkdir(exist_ok=True)
+    retired = Path(f'certs/retired/jwt-public-{int(time.time())}.key')
+    Path('certs/jwt-public.key').rename(retired)
+    print(f'Move current public key to {retired}')
 
-keys = generate(2048)
+keys = generate(args.algorithm, args.bits)
 
-print('Generate RSA private key')
+print(f'Generate {args.algorithm} private key')
 with open('certs/jwt-private.key', 'wb') as file:
-    file.write(keys.export_key())
+    file.write(export_private(keys))
 
-print('Generate RSA public key')
+print(f'Generate {args.algorithm} public key')
 with open('certs/jwt-public.key', 'wb') as file:
-    file.write(keys.publickey().export_key('PEM'))
+    file.write(export_public(keys))
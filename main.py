@@ -4,17 +4,35 @@ import uvicorn
 from fastapi import FastAPI
 
 # from src.database.config import init_db
+from core.config import settings
+from src.api.auth.hashing import password_hasher
+from src.api.auth.keys import key_manager
 from src.api.auth.router import auth_router
 from src.api.info.router import info_router
+from src.api.metrics.router import metrics_router
 from src.api.user.router import user_router
-from src.database.redis_tools import RedisCache
+from src.database.cache import get_cache
+from src.database.config import engine, replica_engine
+from src.database.pool import register_metrics, warm_up
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # await init_db() # создание инициалзацию делаю через alembic upgrade head
-    RedisCache()
+    # ключи JWT и соединения с базой готовятся до приема запросов
+    key_manager.load()
+    register_metrics(engine)
+    await warm_up(engine, min(settings.db.pool_warmup, settings.db.pool_size))
+    if replica_engine is not None:
+        await warm_up(replica_engine, min(settings.db.pool_warmup, settings.db.pool_size))
+    cache = get_cache()
+    await cache.start()
     yield
+    await cache.close()
+    password_hasher.shutdown()
+    await engine.dispose()
+    if replica_engine is not None:
+        await replica_engine.dispose()
 
 app = FastAPI(lifespan=lifespan,
               title='API сервис реферальной системы',
@@ -33,12 +51,17 @@ app = FastAPI(lifespan=lifespan,
                       'name': 'USER',
                       'description': 'Работа с авторизованными пользователями',
                   },
+                  {
+                      'name': 'METRICS',
+                      'description': 'Метрики приложения',
+                  },
               ],
               )
 
 app.include_router(auth_router)
 app.include_router(info_router)
 app.include_router(user_router)
+app.include_router(metrics_router)
 
 
 if __name__ == '__main__':
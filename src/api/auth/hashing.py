@@ -0,0 +1,87 @@
+import asyncio
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable
+
+from core.config import settings
+from src.api.auth import utils as auth_utils
+
+
+class HashingOverloadError(Exception):
+    '''Очередь на хеширование паролей переполнена'''
+
+
+class PasswordHasher:
+    '''Асинхронное хеширование паролей в ограниченном пуле воркеров.
+
+    bcrypt блокирует поток на сотни миллисекунд, поэтому вычисления выносятся
+    из event loop. Одновременно в работе и в очереди может находиться не более
+    max_workers + max_queue задач, остальные сразу получают HashingOverloadError.
+    '''
+
+    __slots__ = ['executor_type', 'max_workers', 'limit', '_pending', '_executor']
+
+    def __init__(
+        self,
+        executor_type: str = settings.hashing.executor,
+        max_workers: int = settings.hashing.max_workers,
+        max_queue: int = settings.hashing.max_queue,
+    ) -> None:
+        if executor_type not in ('thread', 'process'):
+            raise ValueError(f'Unknown hash executor: {executor_type}')
+        self.executor_type = executor_type
+        self.max_workers = max_workers
+        self.limit = max_workers + max_queue
+        self._pending = 0
+        self._executor: Executor | None = None
+
+    @property
+    def pending(self) -> int:
+        '''Количество задач в работе и в очереди'''
+        return self._pending
+
+    def _get_executor(self) -> Executor:
+        if self._executor is None:
+            if self.executor_type == 'process':
+                self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+            else:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_workers, thread_name_prefix='hasher'
+                )
+        return self._executor
+
+    def _release(self) -> None:
+        self._pending -= 1
+
+    async def _run(self, func: Callable[..., Any], *args: Any) -> Any:
+        if self._pending >= self.limit:
+            raise HashingOverloadError('Server is busy, try again later')
+        loop = asyncio.get_running_loop()
+        future = self._get_executor().submit(func, *args)
+        self._pending += 1
+        # слот освобождается по завершении вычисления, а не ожидающей корутины,
+        # иначе отмененные запросы позволили бы переполнить пул
+        future.add_done_callback(lambda _: loop.call_soon_threadsafe(self._release))
+        return await asyncio.wrap_future(future)
+
+    async def hash_password(self, password: str) -> bytes:
+        '''Получить хеш пароля'''
+        return await self._run(auth_utils.hash_password, password)
+
+    async def validate_password(self, password: str, hashed_password: bytes) -> bool:
+        '''Проверить пароль'''
+        return await self._run(auth_utils.validate_password, password, hashed_password)
+
+    async def validate_and_rehash_password(
+        self, password: str, hashed_password: bytes
+    ) -> tuple[bool, bytes | None]:
+        '''Проверить пароль и получить новый хеш, если старый устарел'''
+        return await self._run(auth_utils.validate_and_rehash_password, password, hashed_password)
+
+    def shutdown(self) -> None:
+        '''Остановить пул воркеров'''
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+password_hasher = PasswordHasher()
@@ -0,0 +1,162 @@
+import base64
+import hashlib
+import json
+from pathlib import Path
+from typing import Any
+
+import jwt
+from cryptography.hazmat.primitives.asymmetric import ec, ed25519, rsa
+from cryptography.hazmat.primitives.serialization import (
+    load_pem_private_key,
+    load_pem_public_key,
+)
+from jwt.algorithms import get_default_algorithms
+from jwt.exceptions import InvalidKeyError, InvalidSignatureError, InvalidTokenError
+
+from core.config import settings
+
+SUPPORTED_ALGORITHMS = ('RS256', 'ES256', 'EdDSA')
+
+# обязательные поля JWK для вычисления отпечатка по RFC 7638
+THUMBPRINT_MEMBERS = {
+    'RSA': ('e', 'kty', 'n'),
+    'EC': ('crv', 'kty', 'x', 'y'),
+    'OKP': ('crv', 'kty', 'x'),
+}
+
+
+def key_algorithm(public_key: Any) -> str:
+    '''Определить алгоритм подписи по типу ключа'''
+    if isinstance(public_key, rsa.RSAPublicKey):
+        return 'RS256'
+    if isinstance(public_key, ec.EllipticCurvePublicKey) and isinstance(public_key.curve, ec.SECP256R1):
+        return 'ES256'
+    if isinstance(public_key, ed25519.Ed25519PublicKey):
+        return 'EdDSA'
+    raise InvalidKeyError(f'Unsupported key type: {type(public_key).__name__}')
+
+
+def public_jwk(public_key: Any) -> dict[str, str]:
+    '''Публичный ключ в формате JWK с kid и alg'''
+    algorithm = key_algorithm(public_key)
+    jwk = get_default_algorithms()[algorithm].to_jwk(public_key, as_dict=True)
+    members = {name: jwk[name] for name in THUMBPRINT_MEMBERS[jwk['kty']]}
+    digest = hashlib.sha256(json.dumps(members, separators=(',', ':')).encode()).digest()
+    jwk['kid'] = base64.urlsafe_b64encode(digest).rstrip(b'=').decode()
+    jwk['alg'] = algorithm
+    jwk['use'] = 'sig'
+    return jwk
+
+
+class VerificationKey:
+    '''Разобранный публичный ключ'''
+
+    __slots__ = ['kid', 'algorithm', 'key', 'jwk']
+
+    def __init__(self, public_key: Any) -> None:
+        self.jwk = public_jwk(public_key)
+        self.kid: str = self.jwk['kid']
+        self.algorithm: str = self.jwk['alg']
+        self.key = public_key
+
+
+class KeyManager:
+    '''Ключи для подписи и проверки JWT.
+
+    Ключи читаются и разбираются один раз. Токены подписываются активным
+    приватным ключом и получают в заголовке kid - отпечаток публичного ключа.
+    Для проверки, помимо активного, принимаются публичные ключи из каталога
+    retired_keys_dir, что позволяет менять ключ без разлогина пользователей.
+    '''
+
+    __slots__ = [
+        'algorithm',
+        'private_key_path',
+        'public_key_path',
+        'retired_keys_dir',
+        '_private_key',
+        '_active',
+        '_keys',
+    ]
+
+    def __init__(
+        self,
+        algorithm: str = settings.auth.algorithm,
+        private_key_path: Path = settings.auth.private_key_path,
+        public_key_path: Path = settings.auth.public_key_path,
+        retired_keys_dir: Path = settings.auth.retired_keys_dir,
+    ) -> None:
+        if algorithm not in SUPPORTED_ALGORITHMS:
+            raise ValueError(f'Unsupported JWT algorithm: {algorithm}')
+        self.algorithm = algorithm
+        self.private_key_path = private_key_path
+        self.public_key_path = public_key_path
+        self.retired_keys_dir = retired_keys_dir
+        self._private_key: Any = None
+        self._active: VerificationKey | None = None
+        self._keys: dict[str, VerificationKey] = {}
+
+    def load(self) -> None:
+        '''Прочитать и разобрать ключи'''
+        private_key = load_pem_private_key(self.private_key_path.read_bytes(), password=None)
+        active = VerificationKey(load_pem_public_key(self.public_key_path.read_bytes()))
+        if active.algorithm != self.algorithm:
+            raise InvalidKeyError(
+                f'Key {self.public_key_path} is {active.algorithm}, expected {self.algorithm}'
+            )
+        if public_jwk(private_key.public_key())['kid'] != active.kid:
+            raise InvalidKeyError('Private and public keys do not match')
+        keys = {active.kid: active}
+        if self.retired_keys_dir.is_dir():
+            for path in sorted(self.retired_keys_dir.glob('*.key')):
+                retired = VerificationKey(load_pem_public_key(path.read_bytes()))
+                keys.setdefault(retired.kid, retired)
+        self._private_key = private_key
+        self._active = active
+        self._keys = keys
+
+    def _ensure_loaded(self) -> VerificationKey:
+        if self._active is None:
+            self.load()
+        return self._active  # type: ignore
+
+    def signing_key(self) -> tuple[str, str, Any]:
+        '''Вернуть kid, алгоритм и приватный ключ для подписи'''
+        active = self._ensure_loaded()
+        return active.kid, active.algorithm, self._private_key
+
+    def verification_keys(self, kid: str | None, algorithm: str | None = None) -> list[VerificationKey]:
+        '''Найти ключи для проверки подписи по kid.
+
+        Токены без kid выпущены до появления kid и могли быть подписаны любым
+        из загруженных ключей, поэтому для них подходят все ключи алгоритма
+        токена, начиная с активного.
+        '''
+        self._ensure_loaded()
+        if kid is None:
+            return [key for key in self._keys.values() if algorithm in (None, key.algorithm)]
+        try:
+            return [self._keys[kid]]
+        except KeyError:
+            raise InvalidTokenError(f'Unknown key id: {kid}')
+
+    def decode(self, token: str | bytes) -> dict:
+        '''Проверить подпись токена ключом из заголовка или, без kid, перебором ключей'''
+        header = jwt.get_unverified_header(token)
+        keys = self.verification_keys(header.get('kid'), header.get('alg'))
+        if not keys:
+            raise InvalidTokenError(f"No key for algorithm: {header.get('alg')}")
+        for key in keys[:-1]:
+            try:
+                return jwt.decode(token, key.key, algorithms=[key.algorithm])
+            except InvalidSignatureError:
+                continue
+        return jwt.decode(token, keys[-1].key, algorithms=[keys[-1].algorithm])
+
+    def jwks(self) -> dict[str, list[dict[str, str]]]:
+        '''Набор публичных ключей (JWKS)'''
+        self._ensure_loaded()
+        return {'keys': [key.jwk for key in self._keys.values()]}
+
+
+key_manager = KeyManager()
@@ -0,0 +1,103 @@
+import statistics
+import time
+
+from pwdlib import PasswordHash
+from pwdlib.exceptions import UnknownHashError
+from pwdlib.hashers import HasherProtocol
+from pwdlib.hashers.argon2 import Argon2Hasher
+from pwdlib.hashers.bcrypt import BcryptHasher
+
+from core.config import settings
+
+SCHEMES = ('bcrypt', 'argon2')
+
+
+def build_password_hash(
+    scheme: str = settings.hashing.scheme,
+    bcrypt_rounds: int = settings.hashing.bcrypt_rounds,
+    argon2_time_cost: int = settings.hashing.argon2_time_cost,
+    argon2_memory_cost: int = settings.hashing.argon2_memory_cost,
+    argon2_parallelism: int = settings.hashing.argon2_parallelism,
+) -> PasswordHash:
+    '''Политика хеширования: первая схема хеширует, все схемы проверяют.
+
+    Хеши другой схемы или с другими параметрами остаются валидными и
+    считаются устаревшими, поэтому их можно перехешировать после входа.
+    '''
+    if scheme not in SCHEMES:
+        raise ValueError(f'Unknown password hash scheme: {scheme}')
+    bcrypt_hasher = BcryptHasher(rounds=bcrypt_rounds)
+    argon2_hasher = Argon2Hasher(
+        time_cost=argon2_time_cost,
+        memory_cost=argon2_memory_cost,
+        parallelism=argon2_parallelism,
+    )
+    if scheme == 'argon2':
+        return PasswordHash((argon2_hasher, bcrypt_hasher))
+    return PasswordHash((bcrypt_hasher, argon2_hasher))
+
+
+password_hash = build_password_hash()
+
+
+def hash(password: str) -> bytes:
+    '''Хеш пароля по текущей политике'''
+    return password_hash.hash(password).encode()
+
+
+def verify(password: str, hashed_password: bytes) -> bool:
+    '''Проверить пароль'''
+    try:
+        return password_hash.verify(password, hashed_password)
+    except UnknownHashError:
+        return False
+
+
+def verify_and_update(password: str, hashed_password: bytes) -> tuple[bool, bytes | None]:
+    '''Проверить пароль и вернуть новый хеш, если старый не соответствует политике'''
+    try:
+        valid, updated = password_hash.verify_and_update(password, hashed_password)
+    except UnknownHashError:
+        return False, None
+    return valid, updated.encode() if updated else None
+
+
+def measure(hasher: HasherProtocol, samples: int = 3) -> float:
+    '''Медианное время проверки пароля в секундах'''
+    hashed = hasher.hash('calibration-password')
+    timings = []
+    for _ in range(samples):
+        start = time.perf_counter()
+        hasher.verify('calibration-password', hashed)
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+
+def calibrate_bcrypt(target: float, min_rounds: int = 10, max_rounds: int = 16) -> tuple[int, float]:
+    '''Наибольшее число раундов bcrypt, укладывающееся в target секунд'''
+    rounds, elapsed = min_rounds, measure(BcryptHasher(rounds=min_rounds))
+    for candidate in range(min_rounds + 1, max_rounds + 1):
+        # каждый раунд удваивает время, поэтому дальше мерить не нужно
+        if elapsed * 2 > target * 1.5:
+            break
+        candidate_elapsed = measure(BcryptHasher(rounds=candidate))
+        if candidate_elapsed > target:
+            break
+        rounds, elapsed = candidate, candidate_elapsed
+    return rounds, elapsed
+
+
+def calibrate_argon2(
+    target: float,
+    memory_cost: int = settings.hashing.argon2_memory_cost,
+    parallelism: int = settings.hashing.argon2_parallelism,
+    max_time_cost: int = 20,
+) -> tuple[int, float]:
+    '''Наибольший time_cost argon2 при заданной памяти, укладывающийся в target секунд'''
+    time_cost, elapsed = 1, measure(Argon2Hasher(1, memory_cost, parallelism))
+    for candidate in range(2, max_time_cost + 1):
+        candidate_elapsed = measure(Argon2Hasher(candidate, memory_cost, parallelism))
+        if candidate_elapsed > target:
+            break
+        time_cost, elapsed = candidate, candidate_elapsed
+    return time_cost, elapsed
@@ -1,57 +1,133 @@
+import uuid
 from datetime import datetime
 
 from fastapi import Depends
-from sqlalchemy import delete, select
+from sqlalchemy import Executable, and_, delete, exists, insert, literal, select, update
 from sqlalchemy.exc import DBAPIError, IntegrityError
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import aliased
+from sqlalchemy.orm.attributes import set_committed_value
 
-from src.api.auth import utils as auth_utils
+from src.api.auth.hashing import password_hasher
 from src.api.auth.schemas import ChangePassword, UserRegistration
-from src.database.config import get_async_session
+from src.database.events import UserCreated, event_bus
 from src.database.models import ResetPass, User
+from src.database.referral_stats import count_referrals
+from src.database.referral_tree import link_referrals
+from src.database.replica import SessionRouter, get_session_router
 
 
 class UserAuthRepository:
     '''Репозиторий для работой с базой данных при регистрации и аутендификации'''
-    __slots__ = ['session']
+    __slots__ = ['sessions']
 
-    def __init__(self, session: AsyncSession = Depends(get_async_session)) -> None:
-        self.session = session
+    def __init__(self, sessions: SessionRouter = Depends(get_session_router)) -> None:
+        self.sessions = sessions
+
+    @property
+    def session(self) -> AsyncSession:
+        return self.sessions.primary
 
     async def create(self, user: UserRegistration) -> User:
-        '''Создать пользователя'''
-        data = user.model_dump()
+        '''Создать пользователя.
+
+        Сначала одним запросом проверяются реферальный код и занятость username
+        и email: на заведомо неудачную регистрацию не тратится хеширование.
+        Затем пароль хешируется, и пользователь вставляется выражением
+        INSERT ... SELECT ... RETURNING, которое само находит реферера и проверяет
+        его код; для реферала то же выражение увеличивает счетчики реферера
+        (referral_stats) и добавляет его в дерево рефералов (referral_closure).
+        Обращений к базе два; гонки с параллельными регистрациями разрешают
+        ограничения уникальности и условие в INSERT ... SELECT.
+        '''
+        referrer = aliased(User, name='referrer')
+        valid_code = and_(
+            referrer.referal_code == user.referal_code,
+            referrer.is_active.is_(True),
+            referrer.exp_ref_code >= datetime.now(),
+        )
+        checks = [
+            exists().where(User.username == user.username).label('username'),
+            exists().where(User.email == user.email).label('email'),
+        ]
+        if user.referal_code:
+            checks.append(exists().where(valid_code).label('referrer'))
+        check = (await self.sessions.execute_once(select(*checks))).one()
+        if user.referal_code and not check.referrer:
+            raise ValueError('User with referral code not found or expire referral code')
+        if check.username:
+            raise ValueError(f'Key (username)=({user.username}) already exists.')
+        if check.email:
+            raise ValueError(f'Key (email)=({user.email}) already exists.')
+
+        hashed_password = await password_hasher.hash_password(user.password)
+        columns = ['username', 'email', 'hashed_password']
+        values = select(
+            literal(user.username, User.username.type),
+            literal(user.email, User.email.type),
+            literal(hashed_password, User.hashed_password.type),
+        )
+        if user.referal_code:
+            # без действующего кода SELECT не вернет строк и пользователь не будет создан
+            columns.append('id_referal')
+            values = values.add_columns(referrer.id).where(valid_code)
+        statement: Executable = insert(User).from_select(columns, values).returning(User)
         if user.referal_code:
-            user_check = await self.read_user_at_referal_code(user.referal_code)
-            if not user_check or not user_check.is_active or user_check.exp_ref_code < datetime.now():
-                raise ValueError('User with referral code not found or expire referral code')
-            del data['referal_code']
-            data['id_referal'] = user_check.id
-        password = data.pop('password')
-        data['hashed_password'] = auth_utils.hash_password(password)
-        result = User(**data)
-        self.session.add(result)
+            # счетчики реферера и дерево рефералов меняются тем же выражением, что вставляет пользователя;
+            # для INSERT внутри CTE значения по умолчанию на стороне Python не подставляются
+            defaults = {'id': uuid.uuid4(), 'created_at': datetime.now(), 'is_active': True}
+            columns.extend(defaults)
+            values = values.add_columns(
+                *(literal(value, User.__table__.c[name].type) for name, value in defaults.items())
+            )
+            inserted = insert(User).from_select(columns, values).returning(*User.__table__.c).cte('created')
+            statement = (
+                select(aliased(User, inserted))
+                .add_cte(count_referrals(inserted).cte('stats'))
+                .add_cte(link_referrals(inserted).cte('closure'))
+                .execution_options(populate_existing=True)
+            )
         try:
-            await self.session.commit()
+            result = await self.sessions.write(statement)
         except IntegrityError as e:
             raise ValueError(e.args[0])
-        return result
+        created = result.scalar_one_or_none()
+        if created is None:
+            # код истек или удален между проверкой и вставкой
+            raise ValueError('User with referral code not found or expire referral code')
+        await event_bus.emit(UserCreated(created))
+        return created
 
     async def read(self, username: str) -> User:
-        '''Получить пользователя по username'''
-        result = (
-            await self.session.execute(
-                select(User).where(
-                    User.username == username
-                )
-            )
-        ).scalar()
+        '''Получить пользователя по username.
+
+        Промах в реплике перепроверяется в основной базе: пользователь мог
+        только что зарегистрироваться через другой воркер.
+        '''
+        statement = select(User).where(User.username == username)
+        session = self.sessions.reader()
+        result = (await session.execute(statement)).scalar()
+        if result is None and session is not self.sessions.primary:
+            result = (await self.sessions.primary.execute(statement)).scalar()
+        await self.sessions.end_read()
         return result
 
+    async def update_hashed_password(self, user: User, hashed_password: bytes) -> None:
+        '''Заменить устаревший хеш пароля, если пароль не меняли параллельно'''
+        await self.sessions.write(
+            update(User)
+            .where(User.id == user.id)
+            .where(User.hashed_password == user.hashed_password)
+            .values(hashed_password=hashed_password)
+            .execution_options(synchronize_session=False)
+        )
+        set_committed_value(user, 'hashed_password', hashed_password)
+        return None
+
     async def read_user_at_referal_code(self, referal_code: str) -> User:
         '''Получить пользователя по реферальному коду'''
         result = (
-            await self.session.execute(
+            await self.sessions.reader().execute(
                 select(User).where(
                     User.referal_code == referal_code
                 )
@@ -62,62 +138,68 @@ class UserAuthRepository:
 
 class ResetPasswordRepository:
     '''Репозиторий для создания ключа сброса пароля'''
-    __slots__ = ['session']
+    __slots__ = ['sessions']
 
-    def __init__(self, session: AsyncSession = Depends(get_async_session)) -> None:
-        self.session = session
+    def __init__(self, sessions: SessionRouter = Depends(get_session_router)) -> None:
+        self.sessions = sessions
 
     async def create_reset_key(self, email: str) -> str:
-        '''Создает ключ для сброса'''
-        result = (
-            await self.session.execute(
-                select(User.email).where(
-                    User.email == email
-                )
-            )
-        ).scalar()
-        if not result:
-            raise ValueError('Email not found')
-        result = ResetPass(email=email)
-        self.session.add(result)
+        '''Создает ключ для сброса: INSERT ... SELECT ... RETURNING, одно обращение к базе'''
         try:
-            await self.session.commit()
+            result = await self.sessions.write(
+                insert(ResetPass)
+                .from_select(['email'], select(User.email).where(User.email == email))
+                .returning(ResetPass.resetkey)
+            )
         except IntegrityError as e:
             raise ValueError(e.args[0])
-        return str(result.resetkey)
+        resetkey = result.scalar()
+        if not resetkey:
+            raise ValueError('Email not found')
+        return str(resetkey)
 
     async def change_password(self, data: ChangePassword) -> User:
-        '''Изменить пароль'''
+        '''Изменить пароль.
+
+        Ключ проверяется до хеширования, чтобы не тратить на неверные ключи
+        время хеширования. Затем одно выражение удаляет ключ и меняет пароль:
+        WITH deleted AS (DELETE ... RETURNING), updated AS (UPDATE ... RETURNING) SELECT.
+        Обращений к базе два: проверка ключа и запись.
+        '''
         try:
-            result = (
-                await self.session.execute(
-                    select(User).join(ResetPass)
-                    .where(User.email == ResetPass.email)
-                    .where(ResetPass.resetkey == data.resetkey)
+            email = (
+                await self.sessions.execute_once(
+                    select(ResetPass.email).where(ResetPass.resetkey == data.resetkey)
                 )
             ).scalar()
         except DBAPIError:
             raise ValueError('Key invalid')
-        if not result:
+        if not email:
             raise ValueError('Email or key not found or invalid')
-        result.hashed_password = auth_utils.hash_password(data.new_password)
-        try:
-            await self.session.merge(result)
-            await self.session.commit()
-        except IntegrityError as e:
-            raise ValueError(e.args[0])
-        await self.delete_reset_key(data.resetkey)
-        return result
-
-    async def delete_reset_key(self, key: str) -> None:
-        '''Удаляет ключ для сброса'''
-        await self.session.execute(
-            delete(ResetPass).where(
-                ResetPass.resetkey == key
-            )
+        hashed_password = await password_hasher.hash_password(data.new_password)
+        # ключ удаляется первым: параллельный запрос с тем же ключом ждет блокировку
+        # строки ключа и после коммита не находит его, поэтому пароль меняется один раз
+        deleted = (
+            delete(ResetPass)
+            .where(ResetPass.resetkey == data.resetkey)
+            .returning(ResetPass.email)
+            .cte('deleted')
+        )
+        updated = (
+            update(User)
+            .where(User.email.in_(select(deleted.c.email)))
+            .values(hashed_password=hashed_password)
+            .returning(*User.__table__.c)
+            .cte('updated')
         )
         try:
-            await self.session.commit()
+            result = await self.sessions.write(
+                select(aliased(User, updated)).execution_options(populate_existing=True)
+            )
         except IntegrityError as e:
             raise ValueError(e.args[0])
-        return None
+        user = result.scalar_one_or_none()
+        if user is None:
+            # ключ использован параллельным запросом
+            raise ValueError('Email or key not found or invalid')
+        return user
@@ -1,5 +1,7 @@
 from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, status
 
+from src.api.auth.hashing import HashingOverloadError
+from src.api.auth.keys import key_manager
 from src.api.auth.schemas import ChangePassword, Token, UserRegistration
 from src.api.auth.service import (
     ResetPasswordService,
@@ -16,19 +18,26 @@ auth_router = APIRouter(prefix='/auth', tags=['AUTH'])
     response_model=User,
     status_code=status.HTTP_201_CREATED,
     summary='Зарегистрировать пользователя',
+    description='Обращений к базе: два - проверка username, email и реферального кода, '
+                'затем INSERT ... SELECT ... RETURNING. Пароль хешируется только после проверки.',
 )
 async def registration(
-    background_tasks: BackgroundTasks,
     data: UserRegistration = Depends(),
     service: UserRegistrationService = Depends()
 ) -> User:
     try:
-        return await service.create(data, background_tasks)
+        return await service.create(data)
     except ValueError as e:
         raise HTTPException(
             status_code=status.HTTP_409_CONFLICT,
             detail=e.args[0],
         )
+    except HashingOverloadError as e:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=e.args[0],
+            headers={'Retry-After': '1'},
+        )
 
 
 @auth_router.post(
@@ -46,12 +55,19 @@ async def login_for_access_jwt(service: TokenService = Depends()) -> Token:
             detail=e.args[0],
             headers={'WWW-Authenticate': 'Bearer'}
         )
+    except HashingOverloadError as e:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=e.args[0],
+            headers={'Retry-After': '1'},
+        )
 
 
 @auth_router.get(
     '/resetpassword/',
     status_code=status.HTTP_200_OK,
     summary='Отправить ключ для сброса пароля',
+    description='Обращений к базе: одно (INSERT ... SELECT ... RETURNING) после ответа.',
 )
 async def resetpassword(
     background_tasks: BackgroundTasks,
@@ -72,17 +88,33 @@ async def resetpassword(
     '/resetpassword/',
     status_code=status.HTTP_200_OK,
     summary='Изменить забытый пароль с помощью ключа',
+    description='Обращений к базе: два - проверка ключа и одно выражение, '
+                'удаляющее ключ и меняющее пароль (DELETE и UPDATE в CTE).',
 )
 async def change_password_with_key(
-    background_tasks: BackgroundTasks,
     data: ChangePassword = Depends(),
     service: ResetPasswordService = Depends()
 ) -> dict:
     try:
-        await service.change_password(data, background_tasks)
+        await service.change_password(data)
     except ValueError as e:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=e.args[0],
         )
+    except HashingOverloadError as e:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=e.args[0],
+            headers={'Retry-After': '1'},
+        )
     return {'detail': 'Password update'}
+
+
+@auth_router.get(
+    '/.well-known/jwks.json',
+    status_code=status.HTTP_200_OK,
+    summary='Получить публичные ключи для проверки токенов (JWKS)',
+)
+async def jwks() -> dict:
+    return key_manager.jwks()
@@ -3,10 +3,13 @@ from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from jwt.exceptions import InvalidTokenError
 
 from src.api.auth import utils as auth_utils
+from src.api.auth.hashing import password_hasher
 from src.api.auth.repository import ResetPasswordRepository, UserAuthRepository
 from src.api.auth.schemas import ChangePassword, Token, UserRegistration
+from src.api.auth.token_cache import token_cache
+from src.database.cache import CacheBackend, CacheBatch, get_cache, get_cache_batch
 from src.database.models import User
-from src.database.redis_tools import RedisCache
+from src.database.serializers import UserDTO
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl='/auth/login')
 
@@ -14,57 +17,58 @@ oauth2_scheme = OAuth2PasswordBearer(tokenUrl='/auth/login')
 class UserRegistrationService:
     '''Сервис для регистрации пользователя'''
 
-    __slots__ = ['repository', 'cache_repo']
+    __slots__ = ['repository', 'cache_batch']
 
     def __init__(
         self,
         repository: UserAuthRepository = Depends(),
+        cache_batch: CacheBatch = Depends(get_cache_batch),
     ) -> None:
 
         self.repository = repository
-        self.cache_repo = RedisCache()
+        self.cache_batch = cache_batch
 
-    async def create(
-        self,
-        user: UserRegistration,
-        background_tasks: BackgroundTasks
-    ) -> User:
+    async def create(self, user: UserRegistration) -> User:
         '''Создать пользователя'''
         result = await self.repository.create(user)
-        background_tasks.add_task(self.cache_repo.set_user, result)
+        self.cache_batch.set_user(result)
         return result
 
 
 class UserAuthService:
     '''Сервис для аутентификации пользователя'''
 
-    __slots__ = ['repository', 'form_data', 'cache_repo']
+    __slots__ = ['repository', 'form_data', 'cache_batch']
 
     def __init__(
         self,
         repository: UserAuthRepository = Depends(),
         form_data: OAuth2PasswordRequestForm = Depends(),
+        cache_batch: CacheBatch = Depends(get_cache_batch),
     ) -> None:
 
         self.repository = repository
         self.form_data = form_data
-        self.cache_repo = RedisCache()
+        self.cache_batch = cache_batch
 
-    async def validate_auth_user(self, background_tasks: BackgroundTasks = BackgroundTasks()) -> User:
+    async def validate_auth_user(self) -> User:
         '''Проверка данных пользователя'''
         user = await self.repository.read(self.form_data.username.strip())
         if not user:
             raise ValueError('Invalid username')
 
-        if not auth_utils.validate_password(
+        valid, rehashed_password = await password_hasher.validate_and_rehash_password(
             password=self.form_data.password.strip(),
             hashed_password=user.hashed_password,
-        ):
+        )
+        if not valid:
             raise ValueError('Invalid password')
 
         if not user.is_active:
             raise ValueError('User not found')
-        background_tasks.add_task(self.cache_repo.set_user, user)
+        if rehashed_password:
+            await self.repository.update_hashed_password(user, rehashed_password)
+        self.cache_batch.set_user(user)
         return user
 
 
@@ -96,27 +100,33 @@ class TokenService:
 class CurrentSessionService:
     '''Сервис для работы с текущим пользователем'''
 
-    __slots__ = ['token', 'repository', 'cache_repo']
+    __slots__ = ['token', 'repository', 'cache_repo', 'cache_batch']
 
     def __init__(
         self,
         token: str = Depends(oauth2_scheme),
         repository: UserAuthRepository = Depends(),
-
+        cache_repo: CacheBackend = Depends(get_cache),
+        cache_batch: CacheBatch = Depends(get_cache_batch),
     ) -> None:
         self.token = token
         self.repository = repository
-        self.cache_repo = RedisCache()
+        self.cache_repo = cache_repo
+        self.cache_batch = cache_batch
 
     async def get_token_payload(self) -> dict:
         '''Получить токен'''
+        payload = token_cache.get(self.token)
+        if payload is not None:
+            return payload
         try:
             payload = auth_utils.decode_jwt(token=self.token)
         except InvalidTokenError as e:
             raise InvalidTokenError(f'Invalid token error: {e}')
+        token_cache.set(self.token, payload)
         return payload
 
-    async def get_auth_user(self, background_tasks: BackgroundTasks = BackgroundTasks()) -> User:
+    async def get_auth_user(self) -> User | UserDTO:
         '''Проверить авторизацию пользователя'''
         payload = await self.get_token_payload()
         username: str | None = payload.get('username')
@@ -127,11 +137,11 @@ class CurrentSessionService:
             return cache
         user = await self.repository.read(username)
         if user:
-            background_tasks.add_task(self.cache_repo.set_user, user)
+            self.cache_batch.set_user(user)
             return user
         raise InvalidTokenError('Invalid token error: User not found')
 
-    async def get_active_auth_user(self) -> User:
+    async def get_active_auth_user(self) -> User | UserDTO:
         '''Проверить активен ли пользователь'''
         user = await self.get_auth_user()
         if user.is_active:
@@ -142,15 +152,16 @@ class CurrentSessionService:
 class ResetPasswordService:
     '''Сервис для сброса пароля'''
 
-    __slots__ = ['repository', 'cache_repo']
+    __slots__ = ['repository', 'cache_batch']
 
     def __init__(
         self,
         repository: ResetPasswordRepository = Depends(),
+        cache_batch: CacheBatch = Depends(get_cache_batch),
     ) -> None:
 
         self.repository = repository
-        self.cache_repo = RedisCache()
+        self.cache_batch = cache_batch
 
     async def create_reset_key(
         self,
@@ -173,15 +184,11 @@ class ResetPasswordService:
                          email=email, key=key)
         return None
 
-    async def change_password(
-        self,
-        data: ChangePassword,
-        background_tasks: BackgroundTasks
-    ) -> None:
+    async def change_password(self, data: ChangePassword) -> None:
         '''Изменить пароль'''
         try:
             result = await self.repository.change_password(data)
         except ValueError as e:
             raise e
-        background_tasks.add_task(self.cache_repo.set_user, result)
+        self.cache_batch.set_user(result)
         return None
@@ -0,0 +1,87 @@
+import hashlib
+import time
+
+from core.config import settings
+from src.api.metrics.registry import labels, registry
+from src.database.memory_cache import TTLCache
+
+
+class VerifiedTokenCache:
+    '''Кеш уже проверенных JWT.
+
+    Ключ - sha256 от токена, значение - декодированный payload, который
+    хранится до exp токена, но не дольше ttl секунд. Повторные запросы с тем
+    же токеном не проверяют RSA подпись заново. Индекс sub -> ключи токенов
+    позволяет удалить токены пользователя без обхода всего кеша.
+    '''
+
+    __slots__ = ['_tokens', '_subjects', 'ttl']
+
+    def __init__(
+        self,
+        maxsize: int = settings.auth.token_cache_size,
+        ttl: float = settings.auth.token_cache_ttl,
+    ) -> None:
+        self._tokens = TTLCache(maxsize=maxsize)
+        self._subjects: dict[str, set[bytes]] = {}
+        self.ttl = ttl
+
+    @staticmethod
+    def digest(token: str | bytes) -> bytes:
+        if isinstance(token, str):
+            token = token.encode()
+        return hashlib.sha256(token).digest()
+
+    def get(self, token: str | bytes) -> dict | None:
+        '''Получить payload ранее проверенного токена'''
+        return self._tokens.get(self.digest(token))
+
+    def set(self, token: str | bytes, payload: dict) -> None:
+        '''Сохранить payload проверенного токена до его exp'''
+        expire_at = payload.get('exp')
+        if expire_at is None:
+            return None
+        key = self.digest(token)
+        self._tokens.set(key, payload, expire_at=min(float(expire_at), time.time() + self.ttl))
+        sub = payload.get('sub')
+        if sub is not None:
+            # ключи, вытесненные из LRU или истекшие, убираются из индекса по ходу
+            keys = {item for item in self._subjects.get(sub, ()) if item in self._tokens}
+            keys.add(key)
+            self._subjects[sub] = keys
+            if len(self._subjects) > 2 * self._tokens.maxsize:
+                self._prune()
+        return None
+
+    def _prune(self) -> None:
+        '''Оставить в индексе только живые токены'''
+        subjects: dict[str, set[bytes]] = {}
+        for sub, keys in self._subjects.items():
+            alive = {key for key in keys if key in self._tokens}
+            if alive:
+                subjects[sub] = alive
+        self._subjects = subjects
+
+    def purge_subject(self, sub: str) -> int:
+        '''Удалить токены пользователя (например при деактивации) в этом процессе'''
+        purged = 0
+        for key in self._subjects.pop(sub, ()):
+            if self._tokens.pop(key) is not None:
+                purged += 1
+        return purged
+
+    def clear(self) -> None:
+        self._tokens.clear()
+        self._subjects.clear()
+
+    def stats(self) -> dict[str, int | float]:
+        return self._tokens.stats()
+
+
+token_cache = VerifiedTokenCache()
+
+registry.gauge(
+    'jwt_cache',
+    'Кеш проверенных JWT: размер, попадания, промахи',
+    lambda: {labels(stat=name): value for name, value in token_cache.stats().items()},
+)
@@ -2,17 +2,19 @@ import smtplib
 from datetime import datetime, timedelta, timezone
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
+from typing import Any
 
-import bcrypt
 import jwt
 
 from core.config import settings
+from src.api.auth import password_policy
+from src.api.auth.keys import key_manager
 
 
 def encode_jwt(
     payload: dict,
-    private_key: str = settings.auth.private_key_path.read_text(),
-    algorithm: str = settings.auth.algorithm,
+    private_key: Any = None,
+    algorithm: str | None = None,
     expire_minutes: float = settings.auth.access_token_expire_minutes,
     expire_timedelta: timedelta | None = None,
 ) -> str:
@@ -26,38 +28,44 @@ def encode_jwt(
         exp=expire,
         iat=now,
     )
+    headers = None
+    if private_key is None:
+        kid, algorithm, private_key = key_manager.signing_key()
+        headers = {'kid': kid}
     encoded = jwt.encode(
         to_encode,
         private_key,
-        algorithm=algorithm,
+        algorithm=algorithm or settings.auth.algorithm,
+        headers=headers,
     )
     return encoded  # type: ignore
 
 
 def decode_jwt(
     token: str | bytes,
-    public_key: str = settings.auth.public_key_path.read_text(),
-    algorithm: str = settings.auth.algorithm,
+    public_key: Any = None,
+    algorithm: str | None = None,
 ) -> dict:
+    if public_key is None:
+        return key_manager.decode(token)
     decoded = jwt.decode(
         token,
         public_key,
-        algorithms=[algorithm],
+        algorithms=[algorithm or settings.auth.algorithm],
     )
     return decoded
 
 
 def hash_password(password: str) -> bytes:
-    salt: bytes = bcrypt.gensalt()
-    password_bytes: bytes = password.encode()
-    return bcrypt.hashpw(password_bytes, salt)
+    return password_policy.hash(password)
 
 
 def validate_password(password: str, hashed_password: bytes) -> bool:
-    return bcrypt.checkpw(
-        password=password.encode(),
-        hashed_password=hashed_password,
-    )
+    return password_policy.verify(password, hashed_password)
+
+
+def validate_and_rehash_password(password: str, hashed_password: bytes) -> tuple[bool, bytes | None]:
+    return password_policy.verify_and_update(password, hashed_password)
 
 
 def send_key_for_reset_password(email: str, key: str) -> None:
@@ -1,42 +1,92 @@
+import uuid
 from datetime import datetime
+from typing import AsyncIterator, Sequence
 
 from fastapi import Depends
-from sqlalchemy import select
-from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import Row, select
 
-from src.database.config import get_async_session
-from src.database.models import User
+from core.config import settings
+from src.api.pagination import load_referrals, stream_referrals
+from src.database.models import ReferralStats, User
+from src.database.referral_tree import (
+    ancestors_query,
+    descendants_query,
+    subtree_size_query,
+)
+from src.database.replica import SessionRouter, get_session_router
+from src.database.serializers import UserDTO
+
+
+def check_referral_code(user: User | UserDTO | None) -> None:
+    '''Проверить, что у реферера есть действующий реферальный код'''
+    if not user or not user.is_active:
+        raise ValueError('Referral with email not found')
+    if not user.referal_code or user.exp_ref_code < datetime.now():
+        raise ValueError('Referral code not activated or expire referral code')
+    return None
 
 
 class InfoRepository:
     '''Репозиторий для работой с базой данных при регистрации и аутендификации'''
-    __slots__ = ['session']
+    __slots__ = ['sessions']
 
-    def __init__(self, session: AsyncSession = Depends(get_async_session)) -> None:
-        self.session = session
+    def __init__(self, sessions: SessionRouter = Depends(get_session_router)) -> None:
+        self.sessions = sessions
 
     async def read_user_at_email(self, email: str) -> User:
         '''Получить пользователя по email'''
         user = (
-            await self.session.execute(
+            await self.sessions.reader().execute(
                 select(User).where(
                     User.email == email
                 )
             )
         ).scalar()
-        if not user or not user.is_active:
-            raise ValueError('Referral with email not found')
-        if not user.referal_code or user.exp_ref_code < datetime.now():
-            raise ValueError('Referral code not activated or expire referral code')
+        check_referral_code(user)
         return user
 
-    async def get_users_id_referal(self, id: str) -> list[User]:
-        '''Получить всех пользователей по id реферала'''
-        users = (
-            await self.session.execute(
-                select(User).where(
-                    User.id_referal == id
+    async def get_referral_stats(self, id: uuid.UUID) -> ReferralStats | None:
+        '''Получить счетчики рефералов реферера'''
+        return (
+            await self.sessions.reader().execute(
+                select(ReferralStats).where(
+                    ReferralStats.referrer_id == id
                 )
             )
-        ).scalars().all()
-        return users
+        ).scalar()
+
+    async def get_descendants(self, id: uuid.UUID, depth: int, limit: int) -> Sequence[Row]:
+        '''Получить рефералов до глубины depth одним запросом по таблице замыкания'''
+        return (await self.sessions.reader().execute(descendants_query(id, depth, limit))).all()
+
+    async def get_subtree_size(self, id: uuid.UUID, depth: int | None) -> int:
+        '''Получить число рефералов на всех уровнях или до глубины depth'''
+        return (await self.sessions.reader().execute(subtree_size_query(id, depth))).scalar_one()
+
+    async def get_ancestors(self, id: uuid.UUID) -> Sequence[Row]:
+        '''Получить цепочку рефереров от прямого до корневого'''
+        return (await self.sessions.reader().execute(ancestors_query(id))).all()
+
+    async def get_users_id_referal(
+        self,
+        id: str,
+        after: tuple[datetime, uuid.UUID] | None = None,
+        limit: int = settings.pagination.default_limit,
+    ) -> list[UserDTO]:
+        '''Получить страницу рефералов по id реферера и одну строку сверх limit'''
+        return await load_referrals(self.sessions.reader(), id, after, limit)
+
+    async def load_users_id_referal(self, id: str) -> list[UserDTO]:
+        '''Первая страница рефералов в сессии основной базы (см. UserRepository.load_all_referral)'''
+        async with self.sessions.detached_primary() as session:
+            return await load_referrals(session, id, None, settings.pagination.default_limit)
+
+    async def stream_users_id_referal(
+        self,
+        id: str,
+        after: tuple[datetime, uuid.UUID] | None = None,
+    ) -> AsyncIterator[list[UserDTO]]:
+        '''Рефералы по id реферера частями из серверного курсора'''
+        async with self.sessions.detached_reader() as session:
+            async for partition in stream_referrals(session, id, after):
+                yield partition
@@ -1,7 +1,19 @@
-from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, status
+import uuid
+from typing import Literal
 
-from src.api.info.schemas import ReferralCodeInfo, UserInfo
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from fastapi.responses import Response, StreamingResponse
+
+from core.config import settings
+from src.api.info.schemas import (
+    ReferralCodeInfo,
+    ReferralStatsInfo,
+    ReferralTreeNode,
+    ReferralTreeSize,
+    UserInfo,
+)
 from src.api.info.service import EmailHunter, InfoService, ReceiveCodeEmailService
+from src.api.pagination import NDJSON, REFERRALS_PAGE, PageParams, json_page
 
 info_router = APIRouter(prefix='/auth', tags=['INFO'])
 
@@ -23,11 +35,29 @@ async def check_email_with_emailhunter(service: EmailHunter = Depends()) -> dict
 )
 async def receive_code_by_email(
     email: str,
-    background_tasks: BackgroundTasks,
     service: ReceiveCodeEmailService = Depends()
 ) -> ReferralCodeInfo:
     try:
-        return await service.get_code(email.strip(), background_tasks)
+        return await service.get_code(email.strip())
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=e.args[0],
+        )
+
+
+@info_router.get(
+    '/referrals/{id}/stats',
+    status_code=status.HTTP_200_OK,
+    response_model=ReferralStatsInfo,
+    summary='Получить число рефералов реферера: всего, активных и за текущую неделю',
+)
+async def get_referral_stats(
+    id: uuid.UUID,
+    service: InfoService = Depends(),
+) -> ReferralStatsInfo:
+    try:
+        return await service.referral_stats(id)
     except ValueError as e:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -35,21 +65,69 @@ async def receive_code_by_email(
         )
 
 
+@info_router.get(
+    '/referrals/{id}/tree',
+    status_code=status.HTTP_200_OK,
+    response_model=list[ReferralTreeNode],
+    summary='Получить рефералов реферера на всех уровнях до глубины depth',
+    description='Рефералы по уровням (depth 1 - прямые), не больше limit. Один запрос по таблице замыкания.',
+)
+async def get_referral_tree(
+    id: uuid.UUID,
+    depth: int = Query(3, ge=1),
+    limit: int = Query(settings.pagination.default_limit, ge=1, le=settings.pagination.max_limit),
+    service: InfoService = Depends(),
+) -> list[ReferralTreeNode]:
+    return await service.referral_tree(id, depth, limit)
+
+
+@info_router.get(
+    '/referrals/{id}/tree/size',
+    status_code=status.HTTP_200_OK,
+    response_model=ReferralTreeSize,
+    summary='Получить число рефералов реферера на всех уровнях или до глубины depth',
+)
+async def get_referral_tree_size(
+    id: uuid.UUID,
+    depth: int | None = Query(None, ge=1),
+    service: InfoService = Depends(),
+) -> ReferralTreeSize:
+    return await service.referral_tree_size(id, depth)
+
+
+@info_router.get(
+    '/referrals/{id}/referrers',
+    status_code=status.HTTP_200_OK,
+    response_model=list[ReferralTreeNode],
+    summary='Получить цепочку рефереров пользователя от прямого до корневого',
+)
+async def get_referrers(
+    id: uuid.UUID,
+    service: InfoService = Depends(),
+) -> list[ReferralTreeNode]:
+    return await service.referrers(id)
+
+
 @info_router.get(
     '/referrals/{id}',
     status_code=status.HTTP_200_OK,
     response_model=list[UserInfo],
     summary='Получить информацию о рефералах по id реферера',
+    description=REFERRALS_PAGE,
 )
 async def get_info_about_referrals(
     id: str,
-    background_tasks: BackgroundTasks,
+    page: PageParams = Depends(),
+    format: Literal['json', 'ndjson'] = 'json',
     service: InfoService = Depends(),
-) -> list[UserInfo]:
+) -> Response:
     try:
-        return await service.about_referrals(id.strip(), background_tasks)
+        if format == 'ndjson':
+            return StreamingResponse(await service.stream_referrals(id.strip(), page), media_type=NDJSON)
+        items, next_cursor = await service.about_referrals(id.strip(), page)
     except ValueError as e:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=e.args[0],
         )
+    return json_page(items, next_cursor, UserInfo)
@@ -1,7 +1,15 @@
-from datetime import datetime
+from datetime import date, datetime
 from typing import Optional
 
-from pydantic import UUID4, BaseModel, ConfigDict, EmailStr, StrictBool, StrictStr
+from pydantic import (
+    UUID4,
+    BaseModel,
+    ConfigDict,
+    EmailStr,
+    StrictBool,
+    StrictInt,
+    StrictStr,
+)
 
 
 class UserInfo(BaseModel):
@@ -20,3 +28,30 @@ class ReferralCodeInfo(BaseModel):
 
     email: EmailStr
     referal_code: StrictStr
+
+
+class ReferralStatsInfo(BaseModel):
+    model_config = ConfigDict(strict=True)
+
+    referrer_id: UUID4
+    total: StrictInt
+    active: StrictInt
+    week_start: date
+    joined_this_week: StrictInt
+
+
+class ReferralTreeNode(BaseModel):
+    model_config = ConfigDict(strict=True)
+
+    id: UUID4
+    username: StrictStr
+    id_referal: Optional[UUID4 | None]
+    depth: StrictInt
+
+
+class ReferralTreeSize(BaseModel):
+    model_config = ConfigDict(strict=True)
+
+    id: UUID4
+    depth: Optional[StrictInt | None]
+    size: StrictInt
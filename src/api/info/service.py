@@ -1,33 +1,65 @@
-import httpx
-from fastapi import BackgroundTasks, Depends
+import uuid
+from typing import AsyncIterator, Sequence
 
-from src.api.info.repository import InfoRepository
+import httpx
+from fastapi import Depends
+
+from src.api.info.repository import InfoRepository, check_referral_code
+from src.api.info.schemas import (
+    ReferralStatsInfo,
+    ReferralTreeNode,
+    ReferralTreeSize,
+    UserInfo,
+)
+from src.api.pagination import PageParams, ndjson_lines, split_page
+from src.database.cache import CacheBackend, CacheBatch, get_cache, get_cache_batch
 from src.database.models import User
-from src.database.redis_tools import RedisCache
+from src.database.referral_stats import week_start
+from src.database.serializers import UserDTO
+
+
+def _referrer_id(id: str) -> str:
+    '''Id реферера в каноническом виде; у некорректного id рефералов нет'''
+    try:
+        return str(uuid.UUID(id))
+    except ValueError:
+        raise ValueError('Referrals not found')
+
+
+async def _prepend(first: list[UserDTO] | None, rest: AsyncIterator[list[UserDTO]]) -> AsyncIterator[list[UserDTO]]:
+    if first is not None:
+        yield first
+    async for partition in rest:
+        yield partition
 
 
 class ReceiveCodeEmailService:
 
-    __slots__ = ['repository', 'cache_repo']
+    __slots__ = ['repository', 'cache_repo', 'cache_batch']
 
     def __init__(
         self,
         repository: InfoRepository = Depends(),
+        cache_repo: CacheBackend = Depends(get_cache),
+        cache_batch: CacheBatch = Depends(get_cache_batch),
     ) -> None:
         self.repository = repository
-        self.cache_repo = RedisCache()
+        self.cache_repo = cache_repo
+        self.cache_batch = cache_batch
 
-    async def get_code(self, email: str, background_tasks: BackgroundTasks) -> User:
+    async def get_code(self, email: str) -> User | UserDTO:
         '''Получить реферальный код'''
         cache = await self.cache_repo.get_email_user(email)
         if cache:
+            # по email индексируется общая запись пользователя, код в ней может отсутствовать
+            check_referral_code(cache)
             return cache
         else:
             try:
                 user = await self.repository.read_user_at_email(email)
             except ValueError as e:
                 raise e
-        background_tasks.add_task(self.cache_repo.set_email_user, user)
+        self.cache_batch.set_user(user)
         return user
 
 
@@ -38,22 +70,66 @@ class InfoService:
     def __init__(
         self,
         repository: InfoRepository = Depends(),
+        cache_repo: CacheBackend = Depends(get_cache),
     ) -> None:
         self.repository = repository
-        self.cache_repo = RedisCache()
-
-    async def about_referrals(self, id: str, background_tasks: BackgroundTasks) -> list[User]:
-        '''Получить информацию о рефералах по id рефера'''
-        cache = await self.cache_repo.get_about_referrals_with_id(id)
-        if cache:
-            return cache
-        result = await self.repository.get_users_id_referal(id)
-        if result != []:
-            background_tasks.add_task(
-                self.cache_repo.set_about_referrals_with_id, id=id, items=result)
-            return result
+        self.cache_repo = cache_repo
+
+    async def about_referrals(self, id: str, page: PageParams) -> tuple[list[User | UserDTO], str | None]:
+        '''Получить страницу рефералов по id рефера и курсор следующей страницы'''
+        id = _referrer_id(id)
+        rows: Sequence[User | UserDTO]
+        if page.cacheable:
+            rows = await self.cache_repo.get_about_referrals_or_load(
+                id, lambda: self.repository.load_users_id_referal(id)
+            )
+        else:
+            rows = await self.repository.get_users_id_referal(id, page.after, page.limit)
+        if rows or page.after is not None:
+            return split_page(rows, page.limit)
         raise ValueError('Referrals not found')
 
+    async def referral_stats(self, id: uuid.UUID) -> ReferralStatsInfo:
+        '''Получить счетчики рефералов по id рефера одним чтением по первичному ключу'''
+        stats = await self.repository.get_referral_stats(id)
+        if stats is None:
+            raise ValueError('Referrals not found')
+        week = week_start()
+        return ReferralStatsInfo(
+            referrer_id=stats.referrer_id,
+            total=stats.total,
+            active=stats.active,
+            week_start=week,
+            # записанная неделя могла закончиться без новых регистраций
+            joined_this_week=stats.joined_week if stats.week_start == week else 0,
+        )
+
+    async def referral_tree(self, id: uuid.UUID, depth: int, limit: int) -> list[ReferralTreeNode]:
+        '''Получить рефералов по id рефера до глубины depth'''
+        rows = await self.repository.get_descendants(id, depth, limit)
+        return [ReferralTreeNode(**row._mapping) for row in rows]
+
+    async def referral_tree_size(self, id: uuid.UUID, depth: int | None) -> ReferralTreeSize:
+        '''Получить число рефералов по id рефера на всех уровнях или до глубины depth'''
+        return ReferralTreeSize(id=id, depth=depth, size=await self.repository.get_subtree_size(id, depth))
+
+    async def referrers(self, id: uuid.UUID) -> list[ReferralTreeNode]:
+        '''Получить цепочку рефереров пользователя, последний в ней - корневой'''
+        rows = await self.repository.get_ancestors(id)
+        return [ReferralTreeNode(**row._mapping) for row in rows]
+
+    async def stream_referrals(self, id: str, page: PageParams) -> AsyncIterator[bytes]:
+        '''Все рефералы после курсора в формате NDJSON, без кеша.
+
+        Id и первая часть проверяются до начала ответа: после отправки
+        заголовков ошибку уже нельзя вернуть статусом, как в about_referrals.
+        '''
+        partitions = self.repository.stream_users_id_referal(_referrer_id(id), page.after)
+        first = await anext(partitions, None)
+        if first is None and page.after is None:
+            raise ValueError('Referrals not found')
+        return ndjson_lines(_prepend(first, partitions), UserInfo)
+
 
 class EmailHunter:
 
@@ -0,0 +1,138 @@
+import math
+from typing import Callable, Iterable
+
+LabelValues = tuple[tuple[str, str], ...]
+
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+
+def _labels(labels: dict[str, str]) -> LabelValues:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def _format_labels(labels: Iterable[tuple[str, str]]) -> str:
+    pairs = ','.join(f'{key}="{value}"' for key, value in labels)
+    return f'{{{pairs}}}' if pairs else ''
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return '+Inf'
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Counter:
+    '''Монотонно растущий счетчик'''
+
+    __slots__ = ['name', 'help', '_values']
+
+    def __init__(self, name: str, help: str) -> None:
+        self.name = name
+        self.help = help
+        self._values: dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key = _labels(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels: str) -> float:
+        return self._values.get(_labels(labels), 0)
+
+    def render(self) -> list[str]:
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} counter']
+        for labels, value in self._values.items():
+            lines.append(f'{self.name}{_format_labels(labels)} {_format_value(value)}')
+        return lines
+
+
+class Histogram:
+    '''Распределение значений по корзинам'''
+
+    __slots__ = ['name', 'help', 'buckets', '_values']
+
+    def __init__(self, name: str, help: str, buckets: tuple[float, ...] = DEFAULT_BUCKETS) -> None:
+        self.name = name
+        self.help = help
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        # для каждого набора меток: счетчики по корзинам, сумма, количество
+        self._values: dict[LabelValues, tuple[list[int], list[float]]] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = _labels(labels)
+        if key not in self._values:
+            self._values[key] = ([0] * len(self.buckets), [0.0, 0])
+        counts, total = self._values[key]
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                counts[index] += 1
+                break
+        total[0] += value
+        total[1] += 1
+
+    def render(self) -> list[str]:
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        for labels, (counts, (total, count)) in self._values.items():
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                bucket_labels = labels + (('le', _format_value(bound)),)
+                lines.append(f'{self.name}_bucket{_format_labels(bucket_labels)} {cumulative}')
+            lines.append(f'{self.name}_sum{_format_labels(labels)} {_format_value(total)}')
+            lines.append(f'{self.name}_count{_format_labels(labels)} {_format_value(count)}')
+        return lines
+
+
+class Gauge:
+    '''Текущее значение, вычисляемое в момент сбора метрик'''
+
+    __slots__ = ['name', 'help', 'collect']
+
+    def __init__(self, name: str, help: str, collect: Callable[[], dict[LabelValues, float]]) -> None:
+        self.name = name
+        self.help = help
+        self.collect = collect
+
+    def render(self) -> list[str]:
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} gauge']
+        for labels, value in self.collect().items():
+            lines.append(f'{self.name}{_format_labels(labels)} {_format_value(value)}')
+        return lines
+
+
+class MetricsRegistry:
+    '''Реестр метрик приложения в текстовом формате Prometheus'''
+
+    __slots__ = ['_metrics']
+
+    def __init__(self) -> None:
+        self._metrics: dict[str, Counter | Histogram | Gauge] = {}
+
+    def counter(self, name: str, help: str) -> Counter:
+        metric = self._metrics.setdefault(name, Counter(name, help))
+        assert isinstance(metric, Counter)
+        return metric
+
+    def histogram(self, name: str, help: str, buckets: tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+        metric = self._metrics.setdefault(name, Histogram(name, help, buckets))
+        assert isinstance(metric, Histogram)
+        return metric
+
+    def gauge(self, name: str, help: str, collect: Callable[[], dict[LabelValues, float]]) -> Gauge:
+        '''Зарегистрировать (или заменить) вычисляемую метрику'''
+        metric = Gauge(name, help, collect)
+        self._metrics[name] = metric
+        return metric
+
+    def render(self) -> str:
+        lines: list[str] = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry()
+
+
+def labels(**values: str) -> LabelValues:
+    '''Набор меток для значений Gauge'''
+    return _labels(values)
@@ -0,0 +1,16 @@
+from fastapi import APIRouter, status
+from fastapi.responses import PlainTextResponse
+
+from src.api.metrics.registry import registry
+
+metrics_router = APIRouter(tags=['METRICS'])
+
+
+@metrics_router.get(
+    '/metrics',
+    status_code=status.HTTP_200_OK,
+    response_class=PlainTextResponse,
+    summary='Получить метрики приложения в формате Prometheus',
+)
+async def metrics() -> str:
+    return registry.render()
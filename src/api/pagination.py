@@ -0,0 +1,141 @@
+import base64
+import binascii
+import uuid
+from datetime import datetime
+from typing import Any, AsyncIterator, Sequence, TypeVar
+
+import orjson
+from fastapi import HTTPException, Query, Response, status
+from pydantic import BaseModel
+from sqlalchemy import Select, literal, select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from core.config import settings
+from src.database.models import User
+from src.database.serializers import UserDTO
+
+NDJSON = 'application/x-ndjson'
+NEXT_CURSOR_HEADER = 'X-Next-Cursor'
+
+# описание списков рефералов в документации API
+REFERRALS_PAGE = (
+    'Рефералы по порядку регистрации, не больше limit. Если есть следующая страница, ответ содержит '
+    'заголовок X-Next-Cursor, его значение передается в параметре after. С format=ndjson возвращаются '
+    'все рефералы после after, по одному JSON объекту в строке; limit при этом не применяется.'
+)
+
+Item = TypeVar('Item', bound=User | UserDTO)
+
+
+def encode_cursor(user: User | UserDTO) -> str:
+    '''Курсор, указывающий на позицию после пользователя в порядке (created_at, id)'''
+    raw = f'{user.created_at.isoformat()}|{user.id}'.encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor: str) -> tuple[datetime, uuid.UUID]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        created_at, id = raw.split('|')
+        return datetime.fromisoformat(created_at), uuid.UUID(id)
+    except (binascii.Error, ValueError):
+        raise ValueError('Invalid cursor')
+
+
+class PageParams:
+    '''Параметры страницы: limit и курсор after из заголовка X-Next-Cursor предыдущей страницы'''
+
+    __slots__ = ['limit', 'after']
+
+    def __init__(
+        self,
+        limit: int = Query(settings.pagination.default_limit, ge=1, le=settings.pagination.max_limit),
+        after: str | None = Query(None, description='Курсор из заголовка X-Next-Cursor предыдущей страницы'),
+    ) -> None:
+        self.limit = limit
+        try:
+            self.after = decode_cursor(after) if after else None
+        except ValueError as e:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=e.args[0],
+            )
+
+    @property
+    def cacheable(self) -> bool:
+        '''Страницу можно взять из закешированной первой страницы'''
+        return self.after is None and self.limit <= settings.pagination.default_limit
+
+
+def referrals_query(id: Any, after: tuple[datetime, uuid.UUID] | None = None) -> Select:
+    '''Рефералы пользователя по порядку (created_at, id), начиная после курсора.
+
+    Условие по курсору и сортировка используют индекс (id_referal, created_at, id),
+    поэтому стоимость страницы не зависит от ее номера. Выбираются только столбцы
+    UserDTO: хеш пароля не читается, объекты ORM и identity map не создаются.
+    '''
+    query = select(*UserDTO.columns()).where(User.id_referal == id)
+    if after is not None:
+        query = query.where(tuple_(User.created_at, User.id) > tuple_(*map(literal, after)))
+    return query.order_by(User.created_at, User.id)
+
+
+async def load_referrals(
+    session: AsyncSession,
+    id: Any,
+    after: tuple[datetime, uuid.UUID] | None,
+    limit: int,
+) -> list[UserDTO]:
+    '''Страница рефералов и одна строка сверх limit, по которой видно, есть ли следующая'''
+    result = await session.execute(referrals_query(id, after).limit(limit + 1))
+    return [UserDTO.from_record(record) for record in result]
+
+
+async def stream_referrals(
+    session: AsyncSession,
+    id: Any,
+    after: tuple[datetime, uuid.UUID] | None,
+) -> AsyncIterator[list[UserDTO]]:
+    '''Рефералы после курсора частями из серверного курсора'''
+    result = await session.stream(
+        referrals_query(id, after).execution_options(yield_per=settings.pagination.stream_batch)
+    )
+    async for partition in result.partitions():
+        yield [UserDTO.from_record(record) for record in partition]
+
+
+def split_page(rows: Sequence[Item], limit: int) -> tuple[list[Item], str | None]:
+    '''Страница и курсор следующей страницы; rows читаются с запасом в одну строку'''
+    if len(rows) > limit:
+        page = list(rows[:limit])
+        return page, encode_cursor(page[-1])
+    return list(rows), None
+
+
+def _fields(item: User | UserDTO, fields: tuple[str, ...]) -> dict[str, Any]:
+    return {name: getattr(item, name) for name in fields}
+
+
+def json_page(items: Sequence[User | UserDTO], next_cursor: str | None, schema: type[BaseModel]) -> Response:
+    '''Страница в JSON с полями schema и курсором следующей страницы в заголовке.
+
+    Строки из базы уже соответствуют схеме, поэтому они сериализуются сразу
+    через orjson, без проверки pydantic на каждую строку (response_model
+    маршрута остается для документации).
+    '''
+    fields = tuple(schema.model_fields)
+    return Response(
+        orjson.dumps([_fields(item, fields) for item in items], default=str),
+        media_type='application/json',
+        headers={NEXT_CURSOR_HEADER: next_cursor} if next_cursor else None,
+    )
+
+
+async def ndjson_lines(partitions: AsyncIterator[Sequence[UserDTO]], schema: type[BaseModel]) -> AsyncIterator[bytes]:
+    '''Строки NDJSON с полями schema по частям результата, по одной порции байт на часть (см. json_page)'''
+    fields = tuple(schema.model_fields)
+    async for partition in partitions:
+        yield b''.join(
+            orjson.dumps(_fields(item, fields), default=str, option=orjson.OPT_APPEND_NEWLINE)
+            for item in partition
+        )
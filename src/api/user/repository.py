@@ -1,86 +1,159 @@
+import uuid
 from datetime import datetime, timedelta
+from typing import Any, AsyncIterator
 
 from fastapi import Depends
-from sqlalchemy import select
+from sqlalchemy import ColumnElement, or_, select, update
 from sqlalchemy.exc import IntegrityError
-from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import aliased
 
-from src.api.auth.utils import hash_password
+from core.config import settings
+from src.api.auth.hashing import password_hasher
+from src.api.pagination import load_referrals, stream_referrals
 from src.api.user.schemas import UserUpdate
 from src.api.user.utils import generate_ref_code
-from src.database.config import get_async_session
+from src.database.events import (
+    ReferralCodeChanged,
+    UserDeactivated,
+    UserUpdated,
+    event_bus,
+)
 from src.database.models import User
+from src.database.referral_stats import count_activity
+from src.database.replica import SessionRouter, get_session_router
+from src.database.serializers import UserDTO
 
 
 class UserRepository:
-    '''Репозиторий для работы с базой данных пользователя'''
+    '''Репозиторий для работы с базой данных пользователя.
 
-    __slots__ = ['session']
+    Каждая запись - одно выражение UPDATE ... RETURNING в autocommit
+    (SessionRouter.write): одно обращение к базе при прогретом кеше
+    подготовленных выражений, без предварительного SELECT.
+    '''
 
-    def __init__(self, session: AsyncSession = Depends(get_async_session)):
-        self.session = session
+    __slots__ = ['sessions']
 
-    async def update(self, user: User, data: UserUpdate):
-        '''Обновить данные пользователя'''
-        user.username = data.username
-        user.email = data.email
-        user.hashed_password = hash_password(data.password)
-        self.session.add(user)
+    def __init__(self, sessions: SessionRouter = Depends(get_session_router)) -> None:
+        self.sessions = sessions
+
+    async def _update_if(self, user: User | UserDTO, *conditions: ColumnElement[bool], **values: Any) -> User | None:
+        '''Изменить поля пользователя, если строка удовлетворяет условиям; None - не изменена'''
         try:
-            await self.session.merge(user)
-            await self.session.commit()
+            result = await self.sessions.write(
+                update(User).where(User.id == user.id, *conditions).values(**values).returning(User)
+            )
         except IntegrityError as e:
             raise ValueError(e.args[0])
-        return user
+        return result.scalar_one_or_none()
+
+    async def _update(self, user: User | UserDTO, **values: Any) -> User:
+        '''Изменить поля пользователя и вернуть его новое состояние'''
+        updated = await self._update_if(user, **values)
+        if updated is None:
+            raise ValueError('User not found')
+        return updated
+
+    async def update(self, user: User | UserDTO, data: UserUpdate) -> User:
+        '''Обновить данные пользователя'''
+        hashed_password = await password_hasher.hash_password(data.password)
+        before = UserDTO.from_user(user)
+        result = await self._update(
+            user, username=data.username, email=data.email, hashed_password=hashed_password
+        )
+        await event_bus.emit(UserUpdated(before, result))
+        return result
+
+    async def _set_active(self, user: User | UserDTO, is_active: bool) -> User | None:
+        '''Изменить is_active вместе со счетчиком активных рефералов реферера.
 
-    async def deactivate(self, user: User) -> None:
+        Возвращает None, если is_active уже такой: тогда счетчик не меняется,
+        в том числе при параллельных запросах (UPDATE перепроверяет условие
+        после блокировки строки).
+        '''
+        updated = (
+            update(User)
+            .where(User.id == user.id, User.is_active.is_distinct_from(is_active))
+            .values(is_active=is_active)
+            .returning(*User.__table__.c)
+            .cte('updated')
+        )
+        result = await self.sessions.write(
+            select(aliased(User, updated))
+            .add_cte(count_activity(updated, is_active).cte('stats'))
+            .execution_options(populate_existing=True)
+        )
+        return result.scalar_one_or_none()
+
+    async def deactivate(self, user: User | UserDTO) -> None:
         '''Отключить пользователя'''
-        user.is_active = False
-        self.session.add(user)
-        try:
-            await self.session.merge(user)
-            await self.session.commit()
-        except IntegrityError as e:
-            raise ValueError(e.args[0])
+        result = await self._set_active(user, False)
+        if result is not None:
+            await event_bus.emit(UserDeactivated(result))
         return None
 
-    async def create_referral_code(self, user: User, expire_timedelta_day: int | None) -> User:
-        '''Создать реферальный код'''
+    async def create_referral_code(self, user: User | UserDTO, expire_timedelta_day: int | None) -> User:
+        '''Создать реферальный код, если у пользователя нет действующего.
+
+        Условие проверяется в самом UPDATE: user может быть устаревшей копией
+        из кеша, а параллельный запрос - успеть создать код раньше.
+        '''
         now = datetime.now()
-        if user.referal_code and user.exp_ref_code > now:
-            raise ValueError(
-                f" Refarral code alredy exist. "
-                f"Your code: '{user.referal_code}' "
-            )
         if expire_timedelta_day:
             expire = now + timedelta(days=expire_timedelta_day)
         else:
             expire = now + timedelta(days=30)
-        user.referal_code = generate_ref_code()
-        user.exp_ref_code = expire
-        self.session.add(user)
-        try:
-            await self.session.merge(user)
-            await self.session.commit()
-        except IntegrityError as e:
-            raise ValueError(e.args[0])
-        return user
+        result = await self._update_if(
+            user,
+            or_(User.referal_code.is_(None), User.exp_ref_code <= now),
+            referal_code=generate_ref_code(),
+            exp_ref_code=expire,
+        )
+        if result is None:
+            code = (
+                await self.sessions.execute_once(select(User.referal_code).where(User.id == user.id))
+            ).scalar_one_or_none()
+            if code is None:
+                raise ValueError('User not found')
+            raise ValueError(
+                f" Refarral code alredy exist. "
+                f"Your code: '{code}' "
+            )
+        await event_bus.emit(ReferralCodeChanged(result))
+        return result
 
-    async def delete_referral_code(self, user: User) -> User:
+    async def delete_referral_code(self, user: User | UserDTO) -> User:
         '''Удалить реферальный код'''
-        user.referal_code = None
-        user.exp_ref_code = None
-        self.session.add(user)
-        try:
-            await self.session.merge(user)
-            await self.session.commit()
-        except IntegrityError as e:
-            raise ValueError(e.args[0])
-        return user
+        result = await self._update(user, referal_code=None, exp_ref_code=None)
+        await event_bus.emit(ReferralCodeChanged(result))
+        return result
 
-    async def get_all_referral(self, id: str) -> list[User]:
-        '''Получить всех рефералов пользователя'''
-        result = await self.session.execute(
-            select(User).where(User.id_referal == id)
-        )
-        return result.scalars().all()
+    async def get_all_referral(
+        self,
+        id: uuid.UUID,
+        after: tuple[datetime, uuid.UUID] | None = None,
+        limit: int = settings.pagination.default_limit,
+    ) -> list[UserDTO]:
+        '''Получить страницу рефералов пользователя и одну строку сверх limit'''
+        return await load_referrals(self.sessions.reader(), id, after, limit)
+
+    async def load_all_referral(self, id: uuid.UUID) -> list[UserDTO]:
+        '''Первая страница рефералов в собственной сессии основной базы.
+
+        Загрузку для кеша разделяют конкурентные запросы (SingleFlight), поэтому
+        она не должна зависеть от сессии запроса, который начал ее первым.
+        Реплика могла еще не получить реферала, зарегистрированного в другом
+        воркере, а результат хранится в кеше часами.
+        '''
+        async with self.sessions.detached_primary() as session:
+            return await load_referrals(session, id, None, settings.pagination.default_limit)
+
+    async def stream_all_referral(
+        self,
+        id: uuid.UUID,
+        after: tuple[datetime, uuid.UUID] | None = None,
+    ) -> AsyncIterator[list[UserDTO]]:
+        '''Рефералы пользователя частями из серверного курсора'''
+        async with self.sessions.detached_reader() as session:
+            async for partition in stream_referrals(session, id, after):
+                yield partition
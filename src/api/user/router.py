@@ -1,12 +1,20 @@
+from typing import Literal
+
 from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, status
+from fastapi.responses import Response, StreamingResponse
 from jwt import InvalidTokenError
 
+from src.api.auth.hashing import HashingOverloadError
+from src.api.pagination import NDJSON, REFERRALS_PAGE, PageParams, json_page
 from src.api.user.schemas import ReferralCode, UserUpdate
 from src.api.user.service import UserService
 from src.database.schemas import User
 
 user_router = APIRouter(prefix='/auth/user/me', tags=['USER'])
 
+# чтение пользователя по токену при промахе кеша
+AUTH_USER_READS = 'Если пользователя нет в кеше, еще три обращения на его чтение (BEGIN, SELECT, COMMIT).'
+
 
 @user_router.get(
     '/',
@@ -34,14 +42,14 @@ async def read(service: UserService = Depends()) -> User:
     response_model=User,
     status_code=status.HTTP_200_OK,
     summary='Обновить информацию авторизованного пользователя',
+    description='Обращений к базе: одно (UPDATE ... RETURNING). ' + AUTH_USER_READS,
 )
 async def update(
-    background_tasks: BackgroundTasks,
     data: UserUpdate = Depends(),
     service: UserService = Depends()
 ) -> User:
     try:
-        return await service.update(data, background_tasks)
+        return await service.update(data)
     except ValueError as e:
         raise HTTPException(
             status_code=status.HTTP_409_CONFLICT,
@@ -52,12 +60,19 @@ async def update(
             status_code=status.HTTP_403_FORBIDDEN,
             detail=e.args[0]
         )
+    except HashingOverloadError as e:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=e.args[0],
+            headers={'Retry-After': '1'},
+        )
 
 
 @user_router.delete(
     '/',
     status_code=status.HTTP_200_OK,
     summary='Деактивировать авторизованного пользователя (отключить)',
+    description='Обращений к базе: одно (UPDATE ... RETURNING) после ответа. ' + AUTH_USER_READS,
 )
 async def deactivate(
     background_tasks: BackgroundTasks,
@@ -78,14 +93,14 @@ async def deactivate(
     response_model=ReferralCode,
     status_code=status.HTTP_201_CREATED,
     summary='Создать реферальный код авторизованного пользователя, cо сроком действия (по умолчанию 30 дней)',
+    description='Обращений к базе: одно (UPDATE ... RETURNING). ' + AUTH_USER_READS,
 )
 async def create_referral_code(
-    background_tasks: BackgroundTasks,
     expire_timedelta_day: str | int = 30,
     service: UserService = Depends(),
 ):
     try:
-        return await service.create_ref_code(int(expire_timedelta_day), background_tasks)
+        return await service.create_ref_code(int(expire_timedelta_day))
     except ValueError as e:
         raise HTTPException(
             status_code=status.HTTP_409_CONFLICT,
@@ -101,14 +116,14 @@ async def create_referral_code(
 @user_router.delete(
     '/referralcode/',
     status_code=status.HTTP_200_OK,
-    summary='Удалить реферальный код авторизованного пользователя'
+    summary='Удалить реферальный код авторизованного пользователя',
+    description='Обращений к базе: одно (UPDATE ... RETURNING). ' + AUTH_USER_READS,
 )
 async def delete_referral_code(
-    background_tasks: BackgroundTasks,
     service: UserService = Depends()
 ) -> dict:
     try:
-        await service.delete_ref_code(background_tasks)
+        await service.delete_ref_code()
         return {'detail': 'Referral code is deleted'}
     except ValueError as e:
         raise HTTPException(
@@ -122,15 +137,20 @@ async def delete_referral_code(
     response_model=list[User],
     status_code=status.HTTP_200_OK,
     summary='Получить всех рефералов авторизованного пользователя',
+    description=REFERRALS_PAGE,
 )
 async def get_all_referrals(
-    background_tasks: BackgroundTasks,
+    page: PageParams = Depends(),
+    format: Literal['json', 'ndjson'] = 'json',
     service: UserService = Depends()
-) -> list[User]:
+) -> Response:
     try:
-        return await service.get_all_referral(background_tasks)
+        if format == 'ndjson':
+            return StreamingResponse(await service.stream_all_referral(page), media_type=NDJSON)
+        items, next_cursor = await service.get_all_referral(page)
     except ValueError as e:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail=e.args[0]
         )
+    return json_page(items, next_cursor, User)
@@ -1,26 +1,35 @@
+from typing import AsyncIterator
+
 from fastapi import BackgroundTasks, Depends
 from jwt import InvalidTokenError
 
 from src.api.auth.service import CurrentSessionService
+from src.api.auth.token_cache import token_cache
+from src.api.pagination import PageParams, ndjson_lines, split_page
 from src.api.user.repository import UserRepository
 from src.api.user.schemas import UserUpdate
+from src.database.cache import CacheBackend, CacheBatch, get_cache, get_cache_batch
 from src.database.models import User
-from src.database.redis_tools import RedisCache
+from src.database.schemas import User as UserSchema
+from src.database.serializers import UserDTO
 
 
 class UserService:
 
-    __slots__ = ['user', 'repository', 'cache_repo']
+    __slots__ = ['user', 'repository', 'cache_repo', 'cache_batch']
 
     def __init__(self,
                  current: CurrentSessionService = Depends(),
                  repository: UserRepository = Depends(),
+                 cache_repo: CacheBackend = Depends(get_cache),
+                 cache_batch: CacheBatch = Depends(get_cache_batch),
                  ) -> None:
         self.user = current.get_active_auth_user()
         self.repository = repository
-        self.cache_repo = RedisCache()
+        self.cache_repo = cache_repo
+        self.cache_batch = cache_batch
 
-    async def read(self) -> User:
+    async def read(self) -> User | UserDTO:
         try:
             return await self.user
         except ValueError as e:
@@ -28,45 +37,50 @@ class UserService:
         except InvalidTokenError as e:
             raise e
 
-    async def update(self, data: UserUpdate, background_tasks: BackgroundTasks) -> User:
+    async def update(self, data: UserUpdate) -> User:
         user = await self.user
-        background_tasks.add_task(self.cache_repo.del_user, user.username)
         try:
             result = await self.repository.update(user, data)
         except ValueError as e:
             raise e
-        background_tasks.add_task(self.cache_repo.set_user, result)
+        self.cache_batch.set_user(result)
+        token_cache.purge_subject(str(user.id))
         return result
 
     async def deactivate(self, background_tasks: BackgroundTasks) -> None:
         user = await self.user
         background_tasks.add_task(self.repository.deactivate, user)
-        background_tasks.add_task(self.cache_repo.del_user, user.username)
+        token_cache.purge_subject(str(user.id))
         return None
 
-    async def get_all_referral(self, background_tasks: BackgroundTasks) -> list[User]:
+    async def get_all_referral(self, page: PageParams) -> tuple[list[User] | list[UserDTO], str | None]:
+        '''Получить страницу рефералов и курсор следующей страницы'''
         user = await self.user
-        cache = await self.cache_repo.get_about_referrals_with_id(str(user.id))
-        if cache:
-            return cache
-        result = await self.repository.get_all_referral(user.id)
-        background_tasks.add_task(
-            self.cache_repo.set_about_referrals_with_id, id=str(user.id), items=result)
-        return result
+        if page.cacheable:
+            rows = await self.cache_repo.get_about_referrals_or_load(
+                str(user.id), lambda: self.repository.load_all_referral(user.id)
+            )
+        else:
+            rows = await self.repository.get_all_referral(user.id, page.after, page.limit)
+        return split_page(rows, page.limit)
+
+    async def stream_all_referral(self, page: PageParams) -> AsyncIterator[bytes]:
+        '''Все рефералы после курсора в формате NDJSON, без кеша'''
+        # пользователь проверяется до начала ответа, чтобы ошибка авторизации вернулась статусом
+        user = await self.user
+        return ndjson_lines(self.repository.stream_all_referral(user.id, page.after), UserSchema)
 
-    async def create_ref_code(self, expire_timedelta_day: int | None, background_tasks: BackgroundTasks) -> User:
+    async def create_ref_code(self, expire_timedelta_day: int | None) -> User:
         user = await self.user
         try:
             result = await self.repository.create_referral_code(user, expire_timedelta_day)
         except ValueError as e:
             raise e
-        background_tasks.add_task(self.cache_repo.set_user, result)
+        self.cache_batch.set_user(result)
         return result
 
-    async def delete_ref_code(self, background_tasks: BackgroundTasks) -> None:
+    async def delete_ref_code(self) -> None:
         user = await self.user
         result = await self.repository.delete_referral_code(user)
-        background_tasks.add_task(
-            self.cache_repo.delete_email_user, user.email)
-        background_tasks.add_task(self.cache_repo.set_user, result)
+        self.cache_batch.set_user(result)
         return None
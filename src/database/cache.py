@@ -0,0 +1,196 @@
+from typing import Awaitable, Callable, Iterable, Protocol
+
+from fastapi import BackgroundTasks, Depends
+
+from core.config import settings
+from src.database.events import (
+    ReferralCodeChanged,
+    UserCreated,
+    UserDeactivated,
+    UserUpdated,
+    event_bus,
+)
+from src.database.memory_cache import MemoryCache
+from src.database.models import User
+from src.database.redis_tools import RedisCache
+from src.database.serializers import UserDTO
+
+
+class CacheBatch(Protocol):
+    '''Отложенные операции с кешем, выполняемые вместе'''
+
+    def __len__(self) -> int:
+        '''Число накопленных операций'''
+
+    def set_user(self, item: User | UserDTO) -> 'CacheBatch':
+        '''Сохранить пользователя с индексами username/email'''
+
+    def del_user(self, username: str, email: str | None = None) -> 'CacheBatch':
+        '''Удалить пользователя и все его индексы по username и email'''
+
+    def set_referrals(self, id: str, items: Iterable[User | UserDTO]) -> 'CacheBatch':
+        '''Сохранить список рефералов пользователя id'''
+
+    def del_referrals(self, id: str) -> 'CacheBatch':
+        '''Удалить список рефералов пользователя id; перестройка, начатая раньше, его не запишет'''
+
+    def delete(self, *keys: str) -> 'CacheBatch':
+        '''Удалить ключи'''
+
+    async def execute(self) -> None:
+        '''Выполнить операции и дождаться результата'''
+
+    async def invalidate(self) -> None:
+        '''Выполнить операции инвалидации, не теряя их при недоступном кеше'''
+
+    async def submit(self) -> None:
+        '''Выполнить операции, не задерживая вызывающего'''
+
+
+class CacheBackend(Protocol):
+    '''Кеш пользователей и списков рефералов, ключи см. в cache_keys'''
+
+    async def start(self) -> None:
+        '''Запустить фоновые задачи кеша при старте приложения'''
+
+    async def close(self) -> None:
+        '''Дождаться записей и закрыть соединения при остановке'''
+
+    async def get_user(self, username: str) -> UserDTO | None:
+        '''Пользователь по username или None при промахе'''
+
+    async def get_email_user(self, email: str) -> UserDTO | None:
+        '''Пользователь по email или None при промахе'''
+
+    async def get_about_referrals_or_load(
+        self,
+        id: str,
+        loader: Callable[[], Awaitable[list[User] | list[UserDTO]]],
+    ) -> list[User] | list[UserDTO]:
+        '''Список рефералов из кеша или из loader при промахе'''
+
+    def batch(self) -> CacheBatch:
+        '''Новый набор отложенных операций'''
+
+
+class NullCacheBatch:
+    '''Набор операций, который ничего не делает'''
+
+    __slots__: list[str] = []
+
+    def __len__(self) -> int:
+        return 0
+
+    def set_user(self, item: User | UserDTO) -> 'NullCacheBatch':
+        return self
+
+    def del_user(self, username: str, email: str | None = None) -> 'NullCacheBatch':
+        return self
+
+    def set_referrals(self, id: str, items: Iterable[User | UserDTO]) -> 'NullCacheBatch':
+        return self
+
+    def del_referrals(self, id: str) -> 'NullCacheBatch':
+        return self
+
+    def delete(self, *keys: str) -> 'NullCacheBatch':
+        return self
+
+    async def execute(self) -> None:
+        return None
+
+    async def invalidate(self) -> None:
+        return None
+
+    async def submit(self) -> None:
+        return None
+
+
+class NullCache:
+    '''Кеш без хранения: каждый запрос идет в базу'''
+
+    __slots__: list[str] = []
+
+    async def start(self) -> None:
+        return None
+
+    async def close(self) -> None:
+        return None
+
+    async def get_user(self, username: str) -> UserDTO | None:
+        return None
+
+    async def get_email_user(self, email: str) -> UserDTO | None:
+        return None
+
+    async def get_about_referrals_or_load(
+        self,
+        id: str,
+        loader: Callable[[], Awaitable[list[User] | list[UserDTO]]],
+    ) -> list[User] | list[UserDTO]:
+        return await loader()
+
+    def batch(self) -> NullCacheBatch:
+        return NullCacheBatch()
+
+
+def create_cache(backend: str) -> CacheBackend:
+    '''Создать кеш по имени реализации из настроек'''
+    if backend == 'redis':
+        return RedisCache()
+    if backend == 'memory':
+        return MemoryCache()
+    if backend == 'null':
+        return NullCache()
+    raise ValueError(f'Unknown cache backend: {backend}')
+
+
+_cache: CacheBackend | None = None
+
+
+def get_cache() -> CacheBackend:
+    '''Кеш приложения, выбранный в settings.cache.backend.
+
+    Используется как зависимость FastAPI, поэтому в тестах и бенчмарках его
+    можно подменить через app.dependency_overrides.
+    '''
+    global _cache
+    if _cache is None:
+        _cache = create_cache(settings.cache.backend)
+        if isinstance(_cache, RedisCache):
+            # другие экземпляры (тесты, бенчмарки) не подменяют метрики кеша приложения
+            _cache.register_metrics()
+    return _cache
+
+
+def get_cache_batch(
+    background_tasks: BackgroundTasks,
+    cache: CacheBackend = Depends(get_cache),
+) -> CacheBatch:
+    '''Общий для всех сервисов запроса набор отложенных записей в кеш.
+
+    Зависимость кешируется FastAPI в пределах запроса, поэтому все записи
+    выполняются вместе после отправки ответа.
+    '''
+    batch = cache.batch()
+    background_tasks.add_task(batch.submit)
+    return batch
+
+
+@event_bus.subscribe(UserCreated)
+async def invalidate_referrer(event: UserCreated) -> None:
+    '''Новый реферал меняет список рефералов реферера'''
+    if event.user.id_referal is not None:
+        await get_cache().batch().del_referrals(str(event.user.id_referal)).invalidate()
+    return None
+
+
+@event_bus.subscribe(UserUpdated, UserDeactivated, ReferralCodeChanged)
+async def invalidate_user(event: UserUpdated | UserDeactivated | ReferralCodeChanged) -> None:
+    '''Удалить запись пользователя, его индексы и список рефералов его реферера'''
+    before = event.before if isinstance(event, UserUpdated) else event.user
+    batch = get_cache().batch().del_user(before.username, before.email)
+    if event.user.id_referal is not None:
+        batch.del_referrals(str(event.user.id_referal))
+    await batch.invalidate()
+    return None
@@ -0,0 +1,58 @@
+'''Схема ключей кеша.
+
+Все ключи приложения начинаются с NAMESPACE и префикса типа записи, поэтому
+username, похожий на чужой id, не пересекается с ключом записи, а записи одного
+типа можно найти через SCAN MATCH {prefix}*. При несовместимом изменении схемы
+ключей NAMESPACE увеличивается, и старые ключи просто истекают по TTL.
+'''
+
+NAMESPACE = 'v1'
+
+USER = f'{NAMESPACE}:u:'
+USERNAME = f'{NAMESPACE}:username:'
+EMAIL = f'{NAMESPACE}:email:'
+REFERRALS = f'{NAMESPACE}:ref:'
+LOCK = f'{NAMESPACE}:lock:'
+
+PREFIXES = {
+    'user': USER,
+    'username': USERNAME,
+    'email': EMAIL,
+    'referrals': REFERRALS,
+    'lock': LOCK,
+}
+
+
+def user(id: object) -> str:
+    '''Запись пользователя'''
+    return f'{USER}{id}'
+
+
+def username(value: str) -> str:
+    '''Индекс username -> id'''
+    return f'{USERNAME}{value}'
+
+
+def email(value: str) -> str:
+    '''Индекс email -> id'''
+    return f'{EMAIL}{value}'
+
+
+def referrals(id: object) -> str:
+    '''Список рефералов пользователя'''
+    return f'{REFERRALS}{id}'
+
+
+def lock(key: str) -> str:
+    '''Блокировка перестройки записи key'''
+    return f'{LOCK}{key}'
+
+
+def entity(key: str | bytes) -> str | None:
+    '''Тип записи по ключу или None для чужого ключа'''
+    if isinstance(key, bytes):
+        key = key.decode()
+    for name, prefix in PREFIXES.items():
+        if key.startswith(prefix):
+            return name
+    return None
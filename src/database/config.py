@@ -1,24 +1,28 @@
-from typing import AsyncGenerator
-
 from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import DeclarativeBase
 
 from core.config import settings
+from src.database.pool import engine_options
 
 
 class Base(DeclarativeBase):
     pass
 
 
-engine = create_async_engine(settings.db.url)
+engine = create_async_engine(settings.db.url, **engine_options(settings.db))
 async_session_maker = async_sessionmaker(engine, expire_on_commit=False)
 
+replica_engine = (
+    create_async_engine(settings.db.replica_url, **engine_options(settings.db)) if settings.db.replica_url else None
+)
+replica_session_maker = async_sessionmaker(replica_engine, expire_on_commit=False) if replica_engine else None
+
 
 async def init_db():
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
 
 
-async def get_async_session() -> AsyncGenerator[AsyncSession, None]:
-    async with async_session_maker() as session:
-        yield session
+def get_session_maker() -> async_sessionmaker[AsyncSession]:
+    '''Фабрика сессий основной базы; зависимость FastAPI, в тестах подменяется'''
+    return async_session_maker
@@ -0,0 +1,77 @@
+import logging
+from collections import defaultdict
+from typing import Any, Awaitable, Callable
+
+logger = logging.getLogger(__name__)
+
+Handler = Callable[[Any], Awaitable[None]]
+
+
+class UserCreated:
+    '''Зарегистрирован пользователь (возможно, по реферальному коду)'''
+
+    __slots__ = ['user']
+
+    def __init__(self, user: Any) -> None:
+        self.user = user
+
+
+class UserUpdated:
+    '''Изменены username, email или пароль; before - данные до изменения'''
+
+    __slots__ = ['before', 'user']
+
+    def __init__(self, before: Any, user: Any) -> None:
+        self.before = before
+        self.user = user
+
+
+class UserDeactivated:
+    '''Пользователь отключен'''
+
+    __slots__ = ['user']
+
+    def __init__(self, user: Any) -> None:
+        self.user = user
+
+
+class ReferralCodeChanged:
+    '''Реферальный код создан или удален'''
+
+    __slots__ = ['user']
+
+    def __init__(self, user: Any) -> None:
+        self.user = user
+
+
+class EventBus:
+    '''Синхронная шина доменных событий.
+
+    Репозитории публикуют событие после коммита, обработчики выполняются по
+    очереди в том же запросе. Ошибка обработчика логируется и не отменяет
+    уже выполненную запись в базу.
+    '''
+
+    __slots__ = ['_handlers']
+
+    def __init__(self) -> None:
+        self._handlers: dict[type, list[Handler]] = defaultdict(list)
+
+    def subscribe(self, *event_types: type) -> Callable[[Handler], Handler]:
+        '''Декоратор подписки обработчика на события'''
+        def decorator(handler: Handler) -> Handler:
+            for event_type in event_types:
+                self._handlers[event_type].append(handler)
+            return handler
+        return decorator
+
+    async def emit(self, event: Any) -> None:
+        for handler in self._handlers.get(type(event), ()):
+            try:
+                await handler(event)
+            except Exception:
+                logger.exception('Handler %s failed on %s', handler.__name__, type(event).__name__)
+        return None
+
+
+event_bus = EventBus()
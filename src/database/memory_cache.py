@@ -0,0 +1,268 @@
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Hashable, Iterable
+
+from core.config import settings
+from src.database import cache_keys
+from src.database.models import User
+from src.database.serializers import UserDTO
+from src.database.single_flight import SingleFlight
+
+
+class TTLCache:
+    '''Ограниченный по размеру LRU-кеш с временем жизни записей.
+
+    Время хранится в секундах unix-эпохи, поэтому срок записи можно задать
+    как абсолютным моментом (например exp токена), так и через ttl.
+    '''
+
+    __slots__ = ['maxsize', 'ttl', 'hits', 'misses', 'evictions', '_data']
+
+    def __init__(self, maxsize: int, ttl: float | None = None) -> None:
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._data: OrderedDict[Hashable, tuple[float | None, Any]] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __contains__(self, key: Hashable) -> bool:
+        '''Есть ли живая запись; не меняет LRU и счетчики'''
+        item = self._data.get(key)
+        return item is not None and (item[0] is None or item[0] > time.time())
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        '''Получить значение, обновив его позицию в LRU'''
+        item = self._data.get(key)
+        if item is None:
+            self.misses += 1
+            return default
+        expire_at, value = item
+        if expire_at is not None and expire_at <= time.time():
+            del self._data[key]
+            self.misses += 1
+            return default
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: Hashable, value: Any, expire_at: float | None = None) -> None:
+        '''Сохранить значение до expire_at (по умолчанию now + ttl)'''
+        if self.maxsize <= 0:
+            return None
+        if expire_at is None and self.ttl is not None:
+            expire_at = time.time() + self.ttl
+        self._data[key] = (expire_at, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+        return None
+
+    def pop(self, key: Hashable) -> Any:
+        '''Удалить запись, вернуть ее значение или None'''
+        item = self._data.pop(key, None)
+        return item[1] if item else None
+
+    def evict_if(self, predicate: Callable[[Any], bool]) -> int:
+        '''Удалить все записи, значения которых удовлетворяют условию'''
+        keys = [key for key, (_, value) in self._data.items() if predicate(value)]
+        for key in keys:
+            del self._data[key]
+        return len(keys)
+
+    def clear(self) -> None:
+        self._data.clear()
+
+    def stats(self) -> dict[str, int | float]:
+        '''Счетчики попаданий и промахов'''
+        total = self.hits + self.misses
+        return {
+            'size': len(self._data),
+            'maxsize': self.maxsize,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_ratio': self.hits / total if total else 0.0,
+        }
+
+
+# метка инвалидированного ключа, см. MemoryCache._del_user
+TOMBSTONE = object()
+
+
+class MemoryCache:
+    '''Кеш приложения в памяти процесса (TTL + LRU), реализация CacheBackend.
+
+    Хранит готовые UserDTO без сериализации. Каждый процесс держит свою
+    копию и не узнает об изменениях в других, поэтому подходит для одного
+    воркера, локальных нагрузочных тестов и бенчмарков. Все операции
+    синхронны, между ними нет точек переключения event loop, поэтому
+    конкурентные корутины видят согласованное состояние без блокировок.
+    '''
+
+    __slots__ = ['_data', '_flights']
+
+    def __init__(self, maxsize: int = settings.cache.memory_maxsize) -> None:
+        self._data = TTLCache(maxsize=maxsize)
+        self._flights = SingleFlight()
+
+    async def start(self) -> None:
+        return None
+
+    async def close(self) -> None:
+        self._data.clear()
+        return None
+
+    def stats(self) -> dict[str, int | float]:
+        return self._data.stats()
+
+    def _get_user_by_index(self, key: str) -> UserDTO | None:
+        id = self._data.get(key)
+        if id is None or id is TOMBSTONE:
+            return None
+        user = self._data.get(cache_keys.user(id))
+        return user if user is not TOMBSTONE else None
+
+    async def get_user(self, username: str) -> UserDTO | None:
+        user = self._get_user_by_index(cache_keys.username(username))
+        return user if user is not None and user.username == username else None
+
+    async def get_email_user(self, email: str) -> UserDTO | None:
+        user = self._get_user_by_index(cache_keys.email(email))
+        return user if user is not None and user.email == email else None
+
+    async def get_about_referrals_or_load(
+        self,
+        id: str,
+        loader: Callable[[], Awaitable[list[User] | list[UserDTO]]],
+    ) -> list[User] | list[UserDTO]:
+        key = cache_keys.referrals(id)
+        items = self._data.get(key)
+        if items is not None:
+            return list(items)
+        return await self._flights.do(key, lambda: self._load_referrals(key, loader))
+
+    async def _load_referrals(
+        self,
+        key: str,
+        loader: Callable[[], Awaitable[list[User] | list[UserDTO]]],
+    ) -> list[UserDTO]:
+        '''Загрузить список и сохранить его, если загрузку не опередила инвалидация.
+
+        Как и в RedisCache, перестройка держит метку под ключом блокировки,
+        а _del_referrals удаляет ее вместе со списком.
+        '''
+        lock_key = cache_keys.lock(key)
+        token = object()
+        self._data.set(lock_key, token)
+        try:
+            items = [UserDTO.from_user(user) for user in await loader()]
+        finally:
+            current = self._data.pop(lock_key)
+        if current is token:
+            self._data.set(key, tuple(items), expire_at=time.time() + settings.cache.exp_second_referrals)
+        return items
+
+    def batch(self) -> 'MemoryCacheBatch':
+        return MemoryCacheBatch(self)
+
+    def _set_user(self, item: User | UserDTO) -> None:
+        user = UserDTO.from_user(item)
+        id = str(user.id)
+        keys = (cache_keys.user(id), cache_keys.username(user.username), cache_keys.email(user.email))
+        if any(self._data.get(key) is TOMBSTONE for key in keys):
+            return None
+        expire_at = time.time() + settings.cache.exp_second_set
+        old = self._data.get(cache_keys.user(id))
+        if old is not None:
+            # прежние username/email больше не должны находить пользователя
+            for key in (cache_keys.username(old.username), cache_keys.email(old.email)):
+                if self._data.get(key) == id:
+                    self._data.pop(key)
+        self._data.set(cache_keys.user(id), user, expire_at=expire_at)
+        self._data.set(cache_keys.username(user.username), id, expire_at=expire_at)
+        self._data.set(cache_keys.email(user.email), id, expire_at=expire_at)
+
+    def _del_user(self, username: str, email: str | None = None) -> None:
+        '''Пометить индексы, запись и ее индексы на tombstone_ttl секунд.
+
+        Пока метка жива, _set_user не пишет поверх нее значение, прочитанное
+        из базы до инвалидации (см. SET_USER в redis_tools).
+        '''
+        keys = [cache_keys.username(username)]
+        if email is not None:
+            keys.append(cache_keys.email(email))
+        ids = {self._data.get(key) for key in keys} - {None, TOMBSTONE}
+        for id in ids:
+            user = self._data.get(cache_keys.user(id))
+            keys.append(cache_keys.user(id))
+            if user is not None and user is not TOMBSTONE:
+                for key in (cache_keys.username(user.username), cache_keys.email(user.email)):
+                    if self._data.get(key) == id:
+                        keys.append(key)
+        expire_at = time.time() + settings.cache.tombstone_ttl
+        for key in keys:
+            self._data.set(key, TOMBSTONE, expire_at=expire_at)
+        return None
+
+    def _del_referrals(self, id: str) -> None:
+        key = cache_keys.referrals(id)
+        self._data.pop(key)
+        self._data.pop(cache_keys.lock(key))
+        return None
+
+
+class MemoryCacheBatch:
+    '''Набор операций MemoryCache; выполняется сразу целиком, без ожидания'''
+
+    __slots__ = ['_cache', '_operations']
+
+    def __init__(self, cache: MemoryCache) -> None:
+        self._cache = cache
+        self._operations: list[Callable[[], None]] = []
+
+    def __len__(self) -> int:
+        return len(self._operations)
+
+    def set_user(self, item: User | UserDTO) -> 'MemoryCacheBatch':
+        self._operations.append(lambda: self._cache._set_user(item))
+        return self
+
+    def del_user(self, username: str, email: str | None = None) -> 'MemoryCacheBatch':
+        self._operations.append(lambda: self._cache._del_user(username, email))
+        return self
+
+    def set_referrals(self, id: str, items: Iterable[User | UserDTO]) -> 'MemoryCacheBatch':
+        users = tuple(UserDTO.from_user(user) for user in items)
+        expire_at = time.time() + settings.cache.exp_second_referrals
+        self._operations.append(lambda: self._cache._data.set(cache_keys.referrals(id), users, expire_at=expire_at))
+        return self
+
+    def del_referrals(self, id: str) -> 'MemoryCacheBatch':
+        self._operations.append(lambda: self._cache._del_referrals(id))
+        return self
+
+    def delete(self, *keys: str) -> 'MemoryCacheBatch':
+        def operation() -> None:
+            for key in keys:
+                self._cache._data.pop(key)
+        self._operations.append(operation)
+        return self
+
+    async def execute(self) -> None:
+        operations, self._operations = self._operations, []
+        for operation in operations:
+            operation()
+        return None
+
+    async def invalidate(self) -> None:
+        await self.execute()
+        return None
+
+    async def submit(self) -> None:
+        await self.execute()
+        return None
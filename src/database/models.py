@@ -1,11 +1,13 @@
 import uuid
-from datetime import datetime
+from datetime import date, datetime
 
 from sqlalchemy import (
     TIMESTAMP,
     UUID,
     Boolean,
+    Date,
     ForeignKey,
+    Index,
     Integer,
     LargeBinary,
     String,
@@ -29,7 +31,7 @@ class User(Base):
         String(length=320), nullable=False, index=True, unique=True
     )
     created_at: Mapped[datetime] = mapped_column(
-        TIMESTAMP, default=datetime.now()
+        TIMESTAMP, default=datetime.now
     )
     hashed_password: Mapped[bytes] = mapped_column(
         LargeBinary(length=1024), nullable=False, unique=True
@@ -38,7 +40,7 @@ class User(Base):
         Boolean, default=True, nullable=False
     )
     id_referal: Mapped[uuid.UUID] = mapped_column(
-        UUID, nullable=True, index=True, default=None
+        UUID, nullable=True, default=None
     )
     referal_code: Mapped[str] = mapped_column(
         String(length=10), nullable=True, default=None, unique=True
@@ -48,6 +50,11 @@ class User(Base):
     )
     resetpass = relationship('ResetPass', back_populates='user')
 
+    __table_args__ = (
+        # страницы рефералов: условие по id_referal и курсору (created_at, id) в порядке индекса
+        Index('ix_user_id_referal_created_at', 'id_referal', 'created_at', 'id'),
+    )
+
 
 class ResetPass(Base):
 
@@ -61,3 +68,87 @@ class ResetPass(Base):
         UUID, nullable=True, default=uuid.uuid4
     )
     user = relationship('User', back_populates='resetpass')
+
+
+class ReferralStats(Base):
+    '''Счетчики рефералов реферера, обновляются теми же выражениями, что и пользователи'''
+
+    __tablename__ = 'referral_stats'
+
+    referrer_id: Mapped[uuid.UUID] = mapped_column(
+        UUID, ForeignKey('user.id', ondelete='cascade'), primary_key=True
+    )
+    total: Mapped[int] = mapped_column(
+        Integer, nullable=False, default=0
+    )
+    active: Mapped[int] = mapped_column(
+        Integer, nullable=False, default=0
+    )
+    # joined_week - регистрации за неделю, начинающуюся с week_start (понедельник)
+    week_start: Mapped[date] = mapped_column(
+        Date, nullable=False
+    )
+    joined_week: Mapped[int] = mapped_column(
+        Integer, nullable=False, default=0
+    )
+
+
+class ReferralClosure(Base):
+    '''Пары предок - потомок дерева рефералов с расстоянием между ними (depth >= 1)'''
+
+    __tablename__ = 'referral_closure'
+
+    # первичный ключ обслуживает потомков реферера до заданной глубины и размер поддерева
+    ancestor_id: Mapped[uuid.UUID] = mapped_column(
+        UUID, ForeignKey('user.id', ondelete='cascade'), primary_key=True
+    )
+    depth: Mapped[int] = mapped_column(
+        Integer, primary_key=True
+    )
+    descendant_id: Mapped[uuid.UUID] = mapped_column(
+        UUID, ForeignKey('user.id', ondelete='cascade'), primary_key=True
+    )
+
+    __table_args__ = (
+        # цепочка рефереров пользователя
+        Index('ix_referral_closure_descendant', 'descendant_id', 'depth', 'ancestor_id'),
+    )
+
+
+class UserImport(Base):
+    '''Ход загрузки пользователей из источника: сколько записей уже обработано'''
+
+    __tablename__ = 'user_import'
+
+    source: Mapped[str] = mapped_column(
+        String(length=1024), primary_key=True
+    )
+    # rows - записи источника, записанные или отброшенные; загрузка продолжается со следующей
+    rows: Mapped[int] = mapped_column(
+        Integer, nullable=False, default=0
+    )
+    inserted: Mapped[int] = mapped_column(
+        Integer, nullable=False, default=0
+    )
+    skipped: Mapped[int] = mapped_column(
+        Integer, nullable=False, default=0
+    )
+    rejected: Mapped[int] = mapped_column(
+        Integer, nullable=False, default=0
+    )
+    updated_at: Mapped[datetime] = mapped_column(
+        TIMESTAMP, default=datetime.now
+    )
+
+
+class UserImportReferral(Base):
+    '''Коды рефереров загруженных пользователей, еще не найденные среди пользователей'''
+
+    __tablename__ = 'user_import_referral'
+
+    user_id: Mapped[uuid.UUID] = mapped_column(
+        UUID, ForeignKey('user.id', ondelete='cascade'), primary_key=True
+    )
+    referrer_code: Mapped[str] = mapped_column(
+        String(length=10), nullable=False
+    )
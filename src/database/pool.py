@@ -0,0 +1,95 @@
+import asyncio
+import time
+import uuid
+from typing import Any
+
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine
+from sqlalchemy.pool import AsyncAdaptedQueuePool, ConnectionPoolEntry, NullPool
+
+from core.config import DbSettings
+from src.api.metrics.registry import labels, registry
+
+db_pool_wait = registry.histogram(
+    'db_pool_checkout_seconds',
+    'Ожидание соединения из пула, включая открытие нового соединения',
+)
+
+
+class TimedQueuePool(AsyncAdaptedQueuePool):
+    '''Пул соединений, измеряющий время получения соединения'''
+
+    def _do_get(self) -> ConnectionPoolEntry:
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            db_pool_wait.observe(time.perf_counter() - start)
+
+
+def _statement_name() -> str:
+    return f'__asyncpg_{uuid.uuid4()}__'
+
+
+def engine_options(db: DbSettings) -> dict[str, Any]:
+    '''Параметры create_async_engine для настроек базы.
+
+    За PgBouncer в режиме transaction каждая транзакция может попасть на другое
+    соединение с Postgres. Поэтому пул приложения не нужен (NullPool), а
+    подготовленные выражения не кешируются (иначе выражение, подготовленное на
+    одном соединении, ищется на другом) и получают уникальные имена (иначе
+    имена клиентов совпадают на общем соединении).
+    '''
+    if db.pgbouncer:
+        return {
+            'poolclass': NullPool,
+            'connect_args': {
+                'statement_cache_size': 0,
+                'prepared_statement_cache_size': 0,
+                'prepared_statement_name_func': _statement_name,
+            },
+        }
+    return {
+        'poolclass': TimedQueuePool,
+        'pool_size': db.pool_size,
+        'max_overflow': db.max_overflow,
+        'pool_timeout': db.pool_timeout,
+        'pool_recycle': db.pool_recycle,
+        'pool_pre_ping': db.pool_pre_ping,
+        'connect_args': {'prepared_statement_cache_size': db.statement_cache_size},
+    }
+
+
+async def warm_up(engine: AsyncEngine, connections: int) -> None:
+    '''Открыть connections соединений заранее, чтобы первые запросы их не ждали'''
+    if not isinstance(engine.pool, AsyncAdaptedQueuePool):
+        return None
+    results = await asyncio.gather(
+        *(engine.connect().start() for _ in range(connections)),
+        return_exceptions=True,
+    )
+    opened = [conn for conn in results if isinstance(conn, AsyncConnection)]
+    try:
+        for result in results:
+            if isinstance(result, BaseException):
+                raise result
+        await asyncio.gather(*(conn.exec_driver_sql('SELECT 1') for conn in opened))
+    finally:
+        # соединения возвращаются в пул открытыми
+        await asyncio.gather(*(conn.close() for conn in opened))
+
+
+def register_metrics(engine: AsyncEngine) -> None:
+    pool = engine.pool
+    if not isinstance(pool, AsyncAdaptedQueuePool):
+        return None
+    registry.gauge(
+        'db_pool_connections',
+        'Соединения пула: size - размер пула, checked_out - выданы, idle - свободны, overflow - сверх размера',
+        lambda: {
+            labels(state='size'): pool.size(),
+            labels(state='checked_out'): pool.checkedout(),
+            labels(state='idle'): pool.checkedin(),
+            labels(state='overflow'): max(pool.overflow(), 0),
+        },
+    )
+    return None
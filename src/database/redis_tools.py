@@ -1,74 +1,760 @@
-import pickle
+import asyncio
+import contextlib
+import logging
+import time
+import uuid
+from typing import AsyncIterator, Awaitable, Callable, Iterable
 
-from redis import Redis  # noqa
+import orjson
 from redis import asyncio as aioredis
+from redis.asyncio.client import Pipeline
 
 from core.config import settings
+from src.api.metrics.registry import labels, registry
+from src.database import cache_keys
+from src.database.memory_cache import TTLCache
 from src.database.models import User
+from src.database.resilience import (
+    CacheGuard,
+    CacheUnavailableError,
+    CircuitBreaker,
+    register_metrics,
+)
+from src.database.serializers import (
+    SCHEMA_VERSION,
+    UserDTO,
+    dumps_user,
+    dumps_users,
+    loads_user,
+    loads_users,
+)
+from src.database.single_flight import SingleFlight
 
+logger = logging.getLogger(__name__)
 
-class MetaSingleton(type):
-    _instances: dict = {}
+# добавляет команды в pipeline и возвращает ключи, которые нужно убрать из L1
+Operation = Callable[[Pipeline], Awaitable[list]]
 
-    def __call__(cls, *args, **kwargs):
-        if cls not in cls._instances:
-            cls._instances[cls] = super().__call__(*args, **kwargs)
-        return cls._instances[cls]
+cache_requests = registry.counter(
+    'cache_requests_total', 'Обращения к кешу по уровням (l1 - память воркера, l2 - Redis)'
+)
+cache_rebuilds = registry.counter(
+    'cache_rebuilds_total',
+    'Обработка устаревших записей: rebuild - перестроена, stale - отдано прежнее значение, '
+    'waited - дождались другого воркера, fallback - не дождались',
+)
 
 
-class RedisCache(metaclass=MetaSingleton):
-    _redis = None  # type: Redis
+def _hit_ratio(tier: str) -> float:
+    hits = cache_requests.value(tier=tier, result='hit')
+    total = hits + cache_requests.value(tier=tier, result='miss')
+    return hits / total if total else 0.0
 
-    def __init__(self):
-        if self._redis is None:
-            self._redis = aioredis.from_url(settings.cache.url)
 
-    async def set_user(self, item: User) -> None:
-        await self._redis.set(  # type: ignore
-            item.username,
-            pickle.dumps(item),
-            ex=settings.cache.exp_second_set
+registry.gauge(
+    'cache_hit_ratio',
+    'Доля попаданий в кеш по уровням',
+    lambda: {labels(tier=tier): _hit_ratio(tier) for tier in ('l1', 'l2')},
+)
+
+cache_operations = registry.counter(
+    'cache_operations_total',
+    'Операции RedisCache: hit/miss/error для чтений, ok/error/dropped для записей; '
+    'для списка рефералов также stale/rebuild/waited/fallback',
+)
+cache_latency = registry.histogram(
+    'cache_operation_seconds',
+    'Время операций RedisCache, включая попадания в L1; запись - время одного pipeline',
+)
+cache_value_size = registry.histogram(
+    'cache_value_bytes',
+    'Размер сохраняемых в Redis значений',
+    buckets=(64, 128, 256, 512, 1024, 2048, 4096, 8192, 16384, 65536, 262144, 1048576),
+)
+# возраст записи в момент попадания в Redis: если почти все попадания приходятся
+# на молодые записи, TTL можно сократить без потери доли попаданий
+cache_hit_age = registry.histogram(
+    'cache_hit_age_seconds',
+    'Возраст записи при попадании в Redis',
+    buckets=(1, 5, 15, 60, 300, 900, 1800, 3600, 7200, 14400, 21600, 43200, 86400),
+)
+
+
+def _observe(op: str, result: str, start: float) -> None:
+    cache_operations.inc(op=op, result=result)
+    cache_latency.observe(time.perf_counter() - start, op=op, result=result)
+
+
+def _observe_age(entity: str, ttl: int, ttl_ms: int) -> None:
+    if ttl_ms >= 0:
+        cache_hit_age.observe(max(ttl - ttl_ms / 1000, 0.0), entity=entity)
+
+
+# Пользователь хранится один раз под ключом записи, а индексы username и email
+# (см. cache_keys) содержат только id. Памяти это не экономит (три ключа вместо
+# двух копий, см. benchmarks/bench_cache_memory.py), зато запись и индексы
+# меняются и удаляются одним скриптом, и поиск по username и по email не может
+# вернуть разные версии пользователя. Скрипты обращаются к ключу записи, не
+# объявленному в KEYS, поэтому рассчитаны на Redis без кластера.
+
+# Инвалидация не удаляет ключи, а на tombstone_ttl секунд заменяет их пустой
+# меткой. SET_USER не пишет поверх метки: запрос, прочитавший пользователя из
+# базы до изменения, не вернет прежнее значение в кеш, даже если его запись
+# дойдет до Redis после инвалидации. Чтения считают метку промахом.
+
+# возвращает запись и ее оставшийся TTL в миллисекундах
+GET_BY_INDEX = '''
+local id = redis.call('GET', KEYS[1])
+if not id or id == '' then
+    return false
+end
+local record_key = ARGV[1] .. id
+local value = redis.call('GET', record_key)
+if not value or value == '' then
+    return false
+end
+return {value, redis.call('PTTL', record_key)}
+'''
+
+# KEYS: запись, индекс username, индекс email
+# ARGV: значение, ttl, id, префикс username, префикс email, версия схемы
+# Индексы прежних username/email удаляются, если еще указывают на этого
+# пользователя; скрипт возвращает удаленные ключи.
+SET_USER = '''
+for i = 1, 3 do
+    if redis.call('GET', KEYS[i]) == '' then
+        return {}
+    end
+end
+local evicted = {}
+local old = redis.call('GET', KEYS[1])
+if old and string.byte(old, 1) == tonumber(ARGV[6]) then
+    local ok, row = pcall(cjson.decode, string.sub(old, 2))
+    if ok then
+        local stale = {ARGV[4] .. row[2], ARGV[5] .. row[3]}
+        for i = 1, 2 do
+            if stale[i] ~= KEYS[i + 1] and redis.call('GET', stale[i]) == ARGV[3] then
+                redis.call('DEL', stale[i])
+                table.insert(evicted, stale[i])
+            end
+        end
+    end
+end
+redis.call('SET', KEYS[1], ARGV[1], 'EX', ARGV[2])
+redis.call('SET', KEYS[2], ARGV[3], 'EX', ARGV[2])
+redis.call('SET', KEYS[3], ARGV[3], 'EX', ARGV[2])
+return evicted
+'''
+
+# KEYS: индексы; ARGV: префикс записи, префикс username, префикс email, версия схемы, ttl метки
+# Помечает индексы, записи, на которые они указывают, и остальные индексы этих
+# записей, возвращает помеченные ключи. Индексы помечаются, даже если их нет в
+# кеше: запись пользователя может быть еще в пути.
+DELETE_BY_INDEX = '''
+local marked = {}
+local function mark(key)
+    redis.call('SET', key, '', 'EX', ARGV[5])
+    table.insert(marked, key)
+end
+local ids = {}
+for _, key in ipairs(KEYS) do
+    local id = redis.call('GET', key)
+    if id and id ~= '' then
+        ids[id] = true
+    end
+    mark(key)
+end
+for id in pairs(ids) do
+    local record_key = ARGV[1] .. id
+    local old = redis.call('GET', record_key)
+    mark(record_key)
+    if old and string.byte(old, 1) == tonumber(ARGV[4]) then
+        local ok, row = pcall(cjson.decode, string.sub(old, 2))
+        if ok then
+            for _, key in ipairs({ARGV[2] .. row[2], ARGV[3] .. row[3]}) do
+                if redis.call('GET', key) == id then
+                    mark(key)
+                end
+            end
+        end
+    end
+end
+return marked
+'''
+
+
+# KEYS: список рефералов, блокировка его перестройки; ARGV: значение, ttl, токен
+# Список пишется, только если блокировка все еще принадлежит перестройке.
+# Инвалидация удаляет блокировку вместе со списком, поэтому список, прочитанный
+# из базы до инвалидации, не попадет в кеш на exp_second_referrals.
+SET_IF_LOCKED = '''
+if redis.call('GET', KEYS[2]) ~= ARGV[3] then
+    return 0
+end
+redis.call('SET', KEYS[1], ARGV[1], 'EX', ARGV[2])
+return 1
+'''
+
+RELEASE_LOCK = '''
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+'''
+
+
+# канал, в который Redis присылает инвалидации отслеживаемых ключей по RESP2
+TRACKING_CHANNEL = '__redis__:invalidate'
+
+
+class RedisCache:
+    '''Кеш в Redis с необязательным локальным уровнем в памяти воркера.
+
+    Локальный уровень (L1) хранит сырые значения из Redis (L2) ограниченное
+    время. В режиме pubsub запись или удаление ключа на любом воркере
+    публикуется в канал invalidation_channel, и остальные воркеры удаляют ключ
+    из своего L1. В режиме tracking об изменении любого ключа приложения,
+    в том числе истечении TTL, сообщает сам Redis.
+    Пользователи в L1 кешируются по ключам индексов username/email.
+    '''
+
+    def __init__(self, url: str = settings.cache.url) -> None:
+        self._redis: aioredis.Redis = aioredis.from_url(url)
+        self._local: TTLCache | None = None
+        self._origin = uuid.uuid4().hex
+        self._listener: asyncio.Task | None = None
+        self._get_by_index = self._redis.register_script(GET_BY_INDEX)
+        self._set_user = self._redis.register_script(SET_USER)
+        self._delete_by_index = self._redis.register_script(DELETE_BY_INDEX)
+        self._set_if_locked = self._redis.register_script(SET_IF_LOCKED)
+        self._release_lock = self._redis.register_script(RELEASE_LOCK)
+        self._flights = SingleFlight()
+        self._guard = CacheGuard(
+            timeout=settings.cache.timeout,
+            breaker=CircuitBreaker(settings.cache.breaker_failures, settings.cache.breaker_reset),
+            max_pending_writes=settings.cache.max_pending_writes,
+            max_pending_retries=settings.cache.max_pending_retries,
         )
+        # увеличивается при каждой инвалидации; значение, прочитанное из Redis
+        # до пришедшей инвалидации, в L1 не сохраняется
+        self._epoch = 0
+        if settings.cache.local_invalidation not in ('pubsub', 'tracking'):
+            raise ValueError(f'Unknown cache invalidation mode: {settings.cache.local_invalidation}')
+        if settings.cache.local_enabled:
+            self._local = TTLCache(
+                maxsize=settings.cache.local_maxsize,
+                ttl=settings.cache.local_ttl,
+            )
+
+    def register_metrics(self) -> None:
+        '''Метрики состояния кеша; регистрируются один раз для кеша приложения'''
+        register_metrics(self._guard)
+        if self._local is not None:
+            local = self._local
+            registry.gauge(
+                'cache_local_entries',
+                'Количество записей в локальном кеше воркера',
+                lambda: {labels(): len(local)},
+            )
         return None
 
-    async def get_user(self, username: str) -> User | None:
-        result = await self._redis.get(username)  # type: ignore
-        if result:
-            return pickle.loads(result)
+    async def start(self) -> None:
+        '''Подписаться на сообщения об инвалидации локального кеша'''
+        if self._local is not None and self._listener is None:
+            self._listener = asyncio.create_task(self._listen_invalidations())
         return None
 
-    async def del_user(self, username: str) -> None:
-        await self._redis.delete(username)  # type: ignore
+    async def close(self) -> None:
+        await self._guard.drain(settings.cache.write_timeout)
+        if self._listener is not None:
+            self._listener.cancel()
+            self._listener = None
+        await self._redis.aclose()  # type: ignore
         return None
 
-    async def set_email_user(self, item: User) -> None:
-        await self._redis.set(  # type: ignore
-            item.email,
-            pickle.dumps(item),
-            ex=300
-        )
+    async def _listen_invalidations(self) -> None:
+        if settings.cache.local_invalidation == 'tracking':
+            invalidations = self._tracking_invalidations
+        else:
+            invalidations = self._pubsub_invalidations
+        while True:
+            try:
+                async for keys in invalidations():
+                    self._invalidate(keys)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                # пока подписка не восстановлена, сообщения об инвалидации теряются
+                logger.exception('Cache invalidation listener failed, reconnecting')
+                self._invalidate(None)
+                await asyncio.sleep(1)
+
+    def _invalidate(self, keys: list | None) -> None:
+        '''Удалить ключи из L1, None - очистить L1 целиком'''
+        self._epoch += 1
+        if keys is None:
+            self._local.clear()  # type: ignore
+            return None
+        for key in keys:
+            self._local.pop(key.decode() if isinstance(key, bytes) else key)  # type: ignore
+        return None
+
+    async def _pubsub_invalidations(self) -> AsyncIterator[list]:
+        async with self._redis.pubsub() as pubsub:  # type: ignore
+            await pubsub.subscribe(settings.cache.invalidation_channel)
+            async for message in pubsub.listen():
+                if message['type'] != 'message':
+                    continue
+                origin, keys = orjson.loads(message['data'])
+                if origin != self._origin:
+                    yield keys
+
+    async def _tracking_invalidations(self) -> AsyncIterator[list | None]:
+        '''Инвалидации от Redis (RESP2: CLIENT TRACKING с REDIRECT в pubsub соединение).
+
+        Одно соединение подписано на __redis__:invalidate, другое включает
+        отслеживание в режиме BCAST по префиксам ключей приложения. Режим BCAST
+        не требует отслеживать каждое чтение, поэтому чтения идут через общий пул.
+        '''
+        pool = self._redis.connection_pool  # type: ignore
+        listener = pool.connection_class(**pool.connection_kwargs)
+        tracker = pool.connection_class(**pool.connection_kwargs)
+        try:
+            await listener.connect()
+            await tracker.connect()
+            await listener.send_command('CLIENT', 'ID')
+            client_id = await listener.read_response()
+            await listener.send_command('SUBSCRIBE', TRACKING_CHANNEL)
+            await listener.read_response()
+            prefixes = [cache_keys.USER, cache_keys.USERNAME, cache_keys.EMAIL, cache_keys.REFERRALS]
+            await tracker.send_command(
+                'CLIENT', 'TRACKING', 'ON', 'REDIRECT', client_id, 'BCAST',
+                *(arg for prefix in prefixes for arg in ('PREFIX', prefix)),
+            )
+            await tracker.read_response()
+            # значения, попавшие в L1 до включения отслеживания, могли устареть
+            yield None
+            while True:
+                message = await listener.read_response(timeout=settings.cache.tracking_ping_interval)
+                if message is None:
+                    # при разрыве соединения tracker Redis перестает присылать
+                    # инвалидации молча, поэтому его нужно проверять
+                    await tracker.send_command('PING')
+                    await tracker.read_response()
+                    continue
+                kind, _, keys = message
+                if kind == b'message':
+                    # None означает FLUSHALL/FLUSHDB
+                    yield keys
+        finally:
+            await listener.disconnect()
+            await tracker.disconnect()
+
+    async def _get(self, op: str, key: str, loads: Callable, fetch: Callable[[], Awaitable] | None = None):
+        start = time.perf_counter()
+        epoch = self._epoch
+        if self._local is not None:
+            raw = self._local.get(key)
+            if raw is not None:
+                cache_requests.inc(tier='l1', result='hit')
+                _observe(op, 'hit', start)
+                return loads(raw)
+            cache_requests.inc(tier='l1', result='miss')
+        try:
+            raw = await self._guard.call(fetch or (lambda: self._redis.get(key)))  # type: ignore
+        except CacheUnavailableError:
+            cache_requests.inc(tier='l2', result='error')
+            _observe(op, 'error', start)
+            return None
+        item = loads(raw)
+        if item is None:
+            cache_requests.inc(tier='l2', result='miss')
+            _observe(op, 'miss', start)
+            return None
+        cache_requests.inc(tier='l2', result='hit')
+        _observe(op, 'hit', start)
+        if self._local is not None and self._epoch == epoch:
+            self._local.set(key, raw)
+        return item
+
+    def batch(self) -> 'RedisCacheBatch':
+        '''Новый набор операций, выполняемых одним pipeline'''
+        return RedisCacheBatch(self)
+
+    async def _execute(self, operations: list[Operation], stored: dict[str, bytes]) -> None:
+        epoch = self._epoch
+        evicted: list = []
+        async with self._redis.pipeline(transaction=False) as pipe:  # type: ignore
+            for operation in operations:
+                evicted.extend(await operation(pipe))
+            results = await pipe.execute()
+        # скрипты возвращают списки ключей, которые они удалили или перенесли
+        for result in results:
+            if isinstance(result, list):
+                evicted.extend(result)
+        await self._evict(evicted)
+        if self._local is not None and self._epoch == epoch:
+            for key, raw in stored.items():
+                self._local.set(key, raw)
+        return None
+
+    async def _evict(self, keys: list) -> None:
+        '''Удалить ключи из своего L1 и из L1 остальных воркеров'''
+        if self._local is None or not keys:
+            return None
+        keys = [key.decode() if isinstance(key, bytes) else key for key in keys]
+        for key in keys:
+            self._local.pop(key)
+        if settings.cache.local_invalidation == 'pubsub':
+            await self._redis.publish(  # type: ignore
+                settings.cache.invalidation_channel, orjson.dumps([self._origin, keys])
+            )
+        return None
+
+    async def mget(self, keys: list[str]) -> list[bytes | None]:
+        '''Прочитать несколько ключей одной командой'''
+        if not keys:
+            return []
+        try:
+            return await self._guard.call(lambda: self._redis.mget(keys))  # type: ignore
+        except CacheUnavailableError:
+            return [None] * len(keys)
+
+    async def mset(self, mapping: dict[str, bytes], ex: int) -> None:
+        '''Записать несколько ключей с одинаковым TTL одним pipeline'''
+        await self.batch().mset(mapping, ex).execute()
+        return None
+
+    async def delete(self, *keys: str) -> None:
+        '''Удалить ключи одной командой'''
+        await self.batch().delete(*keys).execute()
+        return None
+
+    async def _fetch_user_by_index(self, key: str) -> bytes | None:
+        found = await self._get_by_index(keys=[key], args=[cache_keys.USER])
+        if not found:
+            return None
+        raw, ttl_ms = found
+        _observe_age('user', settings.cache.exp_second_set, ttl_ms)
+        return raw
+
+    async def _get_user_by_index(self, op: str, key: str) -> UserDTO | None:
+        return await self._get(op, key, loads_user, lambda: self._fetch_user_by_index(key))
+
+    async def set_user(self, item: User | UserDTO) -> None:
+        '''Сохранить пользователя и перенести индексы username/email'''
+        await self.batch().set_user(item).execute()
+        return None
+
+    async def get_user(self, username: str) -> UserDTO | None:
+        user = await self._get_user_by_index('get_user', cache_keys.username(username))
+        # индекс мог пережить удаленную запись, если Redis вытеснил ее по памяти
+        if user is not None and user.username != username:
+            return None
+        return user
+
+    async def del_user(self, username: str, email: str | None = None) -> None:
+        await self.batch().del_user(username, email).execute()
         return None
 
-    async def get_email_user(self, email: str) -> User | None:
-        results = await self._redis.get(email)  # type: ignore
-        if results:
-            return pickle.loads(results)
+    async def set_email_user(self, item: User | UserDTO) -> None:
+        await self.set_user(item)
         return None
 
+    async def get_email_user(self, email: str) -> UserDTO | None:
+        user = await self._get_user_by_index('get_email_user', cache_keys.email(email))
+        if user is not None and user.email != email:
+            return None
+        return user
+
     async def delete_email_user(self, email: str) -> None:
-        await self._redis.delete(email)  # type: ignore
+        await self.delete(cache_keys.email(email))
+        return None
+
+    async def set_about_referrals_with_id(self, id: str, items: list[User] | list[UserDTO]) -> None:
+        await self.batch().set_referrals(id, items).execute()
+        return None
+
+    async def get_about_referrals_with_id(self, id: str) -> list[UserDTO] | None:
+        return await self._get('get_about_referrals_with_id', cache_keys.referrals(id), loads_users)
+
+    async def delete_about_referrals_with_id(self, id: str) -> None:
+        await self.batch().del_referrals(id).execute()
         return None
 
-    async def set_about_referrals_with_id(self, id: str, items: list[User]) -> None:
-        await self._redis.set(  # type: ignore
-            id,
-            pickle.dumps(items),
-            ex=300
+    async def get_about_referrals_or_load(
+        self,
+        id: str,
+        loader: Callable[[], Awaitable[list[User] | list[UserDTO]]],
+    ) -> list[User] | list[UserDTO]:
+        '''Получить рефералов из кеша, перестраивая запись не более чем одним запросом.
+
+        Внутри воркера одновременные промахи объединяются, между воркерами
+        перестройку выполняет владелец короткой блокировки в Redis.
+        '''
+        start = time.perf_counter()
+        key = cache_keys.referrals(id)
+        if self._local is not None:
+            raw = self._local.get(key)
+            if raw is not None:
+                cache_requests.inc(tier='l1', result='hit')
+                _observe('get_about_referrals_or_load', 'hit', start)
+                return loads_users(raw)  # type: ignore
+            cache_requests.inc(tier='l1', result='miss')
+        items, result = await self._flights.do(key, lambda: self._load_referrals(id, loader))
+        _observe('get_about_referrals_or_load', result, start)
+        return items
+
+    async def _get_with_ttl(self, key: str) -> tuple[bytes | None, int]:
+        async with self._redis.pipeline(transaction=False) as pipe:  # type: ignore
+            raw, ttl_ms = await pipe.get(key).pttl(key).execute()
+        return raw, ttl_ms
+
+    async def _load_referrals(
+        self,
+        id: str,
+        loader: Callable[[], Awaitable[list[User] | list[UserDTO]]],
+    ) -> tuple[list[User] | list[UserDTO], str]:
+        '''Рефералы и способ их получения для метрик'''
+        key = cache_keys.referrals(id)
+        epoch = self._epoch
+        try:
+            raw, ttl_ms = await self._guard.call(lambda: self._get_with_ttl(key))
+        except CacheUnavailableError:
+            cache_requests.inc(tier='l2', result='error')
+            return await loader(), 'error'
+        items = loads_users(raw)
+        if items is not None and ttl_ms > settings.cache.stale_grace * 1000:
+            cache_requests.inc(tier='l2', result='hit')
+            _observe_age('referrals', settings.cache.exp_second_referrals + settings.cache.stale_grace, ttl_ms)
+            if self._local is not None and self._epoch == epoch:
+                self._local.set(key, raw)
+            return items, 'hit'
+        cache_requests.inc(tier='l2', result='miss')
+
+        lock_key = cache_keys.lock(key)
+        token = uuid.uuid4().hex
+        try:
+            locked = await self._guard.call(
+                lambda: self._redis.set(lock_key, token, nx=True, px=settings.cache.rebuild_lock_ms)  # type: ignore
+            )
+        except CacheUnavailableError:
+            return (items, 'stale') if items is not None else (await loader(), 'error')
+        if locked:
+            try:
+                result = await loader()
+                await self.batch().set_referrals_if_locked(id, result, token).execute()
+            finally:
+                with contextlib.suppress(CacheUnavailableError):
+                    # не снятая блокировка истечет через rebuild_lock_ms
+                    await self._guard.call(lambda: self._release_lock(keys=[lock_key], args=[token]))
+            cache_rebuilds.inc(result='rebuild')
+            return result, 'rebuild'
+        if items is not None:
+            cache_rebuilds.inc(result='stale')
+            return items, 'stale'
+
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + settings.cache.rebuild_wait
+        while loop.time() < deadline:
+            await asyncio.sleep(0.05)
+            try:
+                items = loads_users(await self._guard.call(lambda: self._redis.get(key)))  # type: ignore
+            except CacheUnavailableError:
+                break
+            if items is not None:
+                cache_rebuilds.inc(result='waited')
+                return items, 'waited'
+        cache_rebuilds.inc(result='fallback')
+        return await loader(), 'fallback'
+
+
+class RedisCacheBatch:
+    '''Операции с кешем, выполняемые одним pipeline в порядке добавления.
+
+    Вместо N обращений к Redis выполняется одно, затем одно сообщение об
+    инвалидации L1 для всех затронутых ключей.
+    '''
+
+    __slots__ = ['_cache', '_operations', '_names', '_stored', '_keys']
+
+    def __init__(self, cache: RedisCache) -> None:
+        self._cache = cache
+        self._operations: list[Operation] = []
+        # имена операций для метрик
+        self._names: list[str] = []
+        # значения, которые после выполнения можно сразу положить в L1
+        self._stored: dict[str, bytes] = {}
+        # ключи, которые нужно убрать из своего L1, если Redis недоступен
+        self._keys: list[str] = []
+
+    def __len__(self) -> int:
+        return len(self._operations)
+
+    def set_user(self, item: User | UserDTO) -> 'RedisCacheBatch':
+        '''Сохранить пользователя и перенести индексы username/email'''
+        cache = self._cache
+        username_key = cache_keys.username(item.username)
+        email_key = cache_keys.email(item.email)
+        keys = [cache_keys.user(item.id), username_key, email_key]
+        raw = dumps_user(item)
+        cache_value_size.observe(len(raw), entity='user')
+        args = [
+            raw,
+            settings.cache.exp_second_set,
+            str(item.id),
+            cache_keys.USERNAME,
+            cache_keys.EMAIL,
+            SCHEMA_VERSION,
+        ]
+
+        async def operation(pipe: Pipeline) -> list:
+            await cache._set_user(keys=keys, args=args, client=pipe)
+            return [username_key, email_key]
+
+        return self._add('set_user', operation, keys)
+
+    def del_user(self, username: str, email: str | None = None) -> 'RedisCacheBatch':
+        '''Удалить пользователя и все его индексы по username и email'''
+        cache = self._cache
+        keys = [cache_keys.username(username)]
+        if email is not None:
+            keys.append(cache_keys.email(email))
+        args = [cache_keys.USER, cache_keys.USERNAME, cache_keys.EMAIL, SCHEMA_VERSION, settings.cache.tombstone_ttl]
+
+        async def operation(pipe: Pipeline) -> list:
+            await cache._delete_by_index(keys=keys, args=args, client=pipe)
+            return list(keys)
+
+        return self._add('del_user', operation, keys)
+
+    def set_referrals(self, id: str, items: Iterable[User | UserDTO]) -> 'RedisCacheBatch':
+        '''Сохранить список рефералов с запасом времени на перестройку'''
+        return self.mset(
+            {cache_keys.referrals(id): dumps_users(items)},
+            ex=settings.cache.exp_second_referrals + settings.cache.stale_grace,
         )
+
+    def set_referrals_if_locked(self, id: str, items: Iterable[User | UserDTO], token: str) -> 'RedisCacheBatch':
+        '''Сохранить перестроенный список, если его блокировку не сняла инвалидация'''
+        cache = self._cache
+        key = cache_keys.referrals(id)
+        raw = dumps_users(items)
+        cache_value_size.observe(len(raw), entity='referrals')
+        args = [raw, settings.cache.exp_second_referrals + settings.cache.stale_grace, token]
+
+        async def operation(pipe: Pipeline) -> list:
+            await cache._set_if_locked(keys=[key, cache_keys.lock(key)], args=args, client=pipe)
+            return [key]
+
+        # запись может быть отклонена, поэтому в L1 значение попадет при чтении
+        return self._add('set_referrals', operation, [key])
+
+    def del_referrals(self, id: str) -> 'RedisCacheBatch':
+        '''Удалить список рефералов и блокировку его перестройки'''
+        key = cache_keys.referrals(id)
+        keys = [key, cache_keys.lock(key)]
+
+        async def operation(pipe: Pipeline) -> list:
+            pipe.delete(*keys)
+            return [key]
+
+        return self._add('del_referrals', operation, [key])
+
+    def mset(self, mapping: dict[str, bytes], ex: int) -> 'RedisCacheBatch':
+        '''Записать ключи с одинаковым TTL'''
+        for key, raw in mapping.items():
+            cache_value_size.observe(len(raw), entity=cache_keys.entity(key) or 'other')
+
+        async def operation(pipe: Pipeline) -> list:
+            for key, raw in mapping.items():
+                pipe.set(key, raw, ex=ex)
+            return list(mapping)
+
+        self._add('set', operation, mapping)
+        self._stored.update(mapping)
+        return self
+
+    def delete(self, *keys: str) -> 'RedisCacheBatch':
+        '''Удалить ключи'''
+        if not keys:
+            return self
+
+        async def operation(pipe: Pipeline) -> list:
+            pipe.delete(*keys)
+            return list(keys)
+
+        return self._add('delete', operation, keys)
+
+    def _add(self, name: str, operation: Operation, keys: Iterable[str]) -> 'RedisCacheBatch':
+        # более поздняя операция над ключом отменяет запись его прежнего значения в L1
+        for key in keys:
+            self._stored.pop(key, None)
+            self._keys.append(key)
+        self._operations.append(operation)
+        self._names.append(name)
+        return self
+
+    def _take(self) -> tuple[Callable[[], Awaitable[None]], list[str], list[str]]:
+        operations, names, stored, keys = self._operations, self._names, self._stored, self._keys
+        self._operations, self._names, self._stored, self._keys = [], [], {}, []
+
+        async def execute() -> None:
+            start = time.perf_counter()
+            result = 'error'
+            try:
+                await self._cache._execute(operations, stored)
+                result = 'ok'
+            finally:
+                # операции одного pipeline делят его время
+                cache_latency.observe(time.perf_counter() - start, op='batch', result=result)
+                for name in names:
+                    cache_operations.inc(op=name, result=result)
+
+        return execute, names, keys
+
+    def _discard(self, keys: list[str]) -> None:
+        # запись не дошла до Redis: хотя бы свой L1 не должен отдавать прежние значения
+        if self._cache._local is not None:
+            for key in keys:
+                self._cache._local.pop(key)
+
+    async def execute(self) -> None:
+        '''Выполнить накопленные операции, не дольше write_timeout'''
+        if not self._operations:
+            return None
+        execute, _, keys = self._take()
+        try:
+            await self._cache._guard.call(execute, settings.cache.write_timeout)
+        except CacheUnavailableError as e:
+            logger.warning('Cache batch failed: %s', e)
+            self._discard(keys)
+        return None
+
+    async def invalidate(self) -> None:
+        '''Выполнить накопленные инвалидации; если Redis недоступен, повторять их в фоне'''
+        if not self._operations:
+            return None
+        execute, _, keys = self._take()
+        try:
+            await self._cache._guard.call(execute, settings.cache.write_timeout)
+        except CacheUnavailableError as e:
+            logger.warning('Cache invalidation failed, retrying in background: %s', e)
+            self._discard(keys)
+            if not self._cache._guard.retry(execute, settings.cache.write_timeout, key=tuple(keys)):
+                # очередь повторов полна: L1 воркера не должен пережить потерянную инвалидацию
+                logger.error('Cache invalidation dropped, retry queue is full')
+                if self._cache._local is not None:
+                    self._cache._invalidate(None)
         return None
 
-    async def get_about_referrals_with_id(self, id: str) -> list[User] | None:
-        results = await self._redis.get(id)  # type: ignore
-        if results:
-            return pickle.loads(results)
+    async def submit(self) -> None:
+        '''Выполнить накопленные операции в фоне; при перегрузке они отбрасываются'''
+        if not self._operations:
+            return None
+        execute, names, keys = self._take()
+        if not self._cache._guard.submit(execute, settings.cache.write_timeout):
+            for name in names:
+                cache_operations.inc(op=name, result='dropped')
+            self._discard(keys)
         return None
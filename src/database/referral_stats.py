@@ -0,0 +1,117 @@
+'''Счетчики рефералов (таблица referral_stats).
+
+Счетчики меняются CTE в тех же выражениях, что вставляют пользователей или
+меняют is_active, поэтому они согласованы с таблицей user без отдельных
+транзакций и обращений к базе. Для данных, появившихся до таблицы или
+помимо приложения, счетчики пересчитываются командой:
+
+    python -m src.database.referral_stats
+'''
+import asyncio
+from datetime import date, datetime, time, timedelta
+
+from sqlalchemy import (
+    Date,
+    FromClause,
+    Insert,
+    Select,
+    Update,
+    case,
+    delete,
+    func,
+    literal,
+    select,
+    text,
+    update,
+)
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+from src.database.config import engine
+from src.database.models import ReferralStats, User
+
+_COLUMNS = ['referrer_id', 'total', 'active', 'week_start', 'joined_week']
+
+
+def week_start(now: datetime | None = None) -> date:
+    '''Понедельник текущей недели'''
+    today = (now or datetime.now()).date()
+    return today - timedelta(days=today.weekday())
+
+
+def _referral_counts(users: FromClause, week: date) -> Select:
+    '''Счетчики по рефереру для строк users со столбцами id_referal, is_active и created_at'''
+    return (
+        select(
+            users.c.id_referal,
+            func.count(),
+            func.count().filter(users.c.is_active),
+            literal(week, Date),
+            func.count().filter(users.c.created_at >= datetime.combine(week, time())),
+        )
+        .where(users.c.id_referal.is_not(None))
+        .group_by(users.c.id_referal)
+    )
+
+
+def count_referrals(users: FromClause, now: datetime | None = None) -> Insert:
+    '''Добавить к счетчикам рефереров новых пользователей users.
+
+    Счетчик за неделю начинается заново, если записанная неделя уже прошла.
+    '''
+    statement = insert(ReferralStats).from_select(_COLUMNS, _referral_counts(users, week_start(now)))
+    excluded = statement.excluded
+    return statement.on_conflict_do_update(
+        index_elements=[ReferralStats.referrer_id],
+        set_={
+            'total': ReferralStats.total + excluded.total,
+            'active': ReferralStats.active + excluded.active,
+            'joined_week': case(
+                (ReferralStats.week_start == excluded.week_start, ReferralStats.joined_week + excluded.joined_week),
+                else_=excluded.joined_week,
+            ),
+            'week_start': excluded.week_start,
+        },
+    )
+
+
+def count_activity(users: FromClause, is_active: bool) -> Update:
+    '''Изменить число активных рефералов на число пользователей users, ставших активными или неактивными.
+
+    users должны содержать только пользователей, у которых is_active действительно изменился.
+    '''
+    changed = (
+        select(func.count())
+        .where(users.c.id_referal == ReferralStats.referrer_id)
+        .scalar_subquery()
+    )
+    return (
+        update(ReferralStats)
+        .where(ReferralStats.referrer_id.in_(select(users.c.id_referal)))
+        .values(active=ReferralStats.active + (changed if is_active else -changed))
+    )
+
+
+async def backfill(conn: AsyncConnection, now: datetime | None = None) -> int:
+    '''Пересчитать счетчики всех рефереров по таблице user и вернуть число рефереров.
+
+    Таблица счетчиков блокируется до конца транзакции: параллельные
+    регистрации ждут пересчета и затем добавляются к его результату.
+    '''
+    await conn.execute(text('LOCK TABLE referral_stats IN EXCLUSIVE MODE'))
+    await conn.execute(delete(ReferralStats))
+    result = await conn.execute(
+        insert(ReferralStats).from_select(_COLUMNS, _referral_counts(User.__table__, week_start(now)))
+    )
+    return result.rowcount
+
+
+async def main() -> None:
+    async with engine.begin() as conn:
+        referrers = await backfill(conn)
+    await engine.dispose()
+    print(f'referral_stats: {referrers} referrers')
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
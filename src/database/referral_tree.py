@@ -0,0 +1,112 @@
+'''Дерево рефералов в таблице замыкания (referral_closure).
+
+Для каждого пользователя хранятся все его рефереры вверх по дереву с
+расстоянием depth (1 - прямой реферер). Потомки до заданной глубины, размер
+поддерева и цепочка рефереров читаются одним запросом по индексу, без
+обхода дерева по уровням. Пары нового реферала вставляются CTE в выражении
+регистрации. Для данных, появившихся до таблицы или помимо приложения, пары
+строятся заново командой:
+
+    python -m src.database.referral_tree
+'''
+import asyncio
+import uuid
+
+from sqlalchemy import (
+    FromClause,
+    Insert,
+    Select,
+    delete,
+    func,
+    insert,
+    literal,
+    select,
+    text,
+    union_all,
+)
+from sqlalchemy.ext.asyncio import AsyncConnection
+from sqlalchemy.orm import aliased
+
+from src.database.config import engine
+from src.database.models import ReferralClosure, User
+
+_COLUMNS = ['ancestor_id', 'descendant_id', 'depth']
+
+
+def link_referrals(users: FromClause) -> Insert:
+    '''Пары для новых пользователей users (столбцы id и id_referal): реферер и все его рефереры.
+
+    Рефереры должны быть уже связаны, поэтому users не должны ссылаться друг на друга.
+    '''
+    direct = select(users.c.id_referal, users.c.id, literal(1)).where(users.c.id_referal.is_not(None))
+    inherited = select(
+        ReferralClosure.ancestor_id, users.c.id, ReferralClosure.depth + 1
+    ).join(users, users.c.id_referal == ReferralClosure.descendant_id)
+    return insert(ReferralClosure).from_select(_COLUMNS, union_all(direct, inherited))
+
+
+def descendants_query(id: uuid.UUID, depth: int, limit: int) -> Select:
+    '''Рефералы пользователя до глубины depth по уровням'''
+    return (
+        select(User.id, User.username, User.id_referal, ReferralClosure.depth)
+        .join(User, User.id == ReferralClosure.descendant_id)
+        .where(ReferralClosure.ancestor_id == id, ReferralClosure.depth <= depth)
+        .order_by(ReferralClosure.depth, ReferralClosure.descendant_id)
+        .limit(limit)
+    )
+
+
+def subtree_size_query(id: uuid.UUID, depth: int | None = None) -> Select:
+    '''Число рефералов пользователя на всех уровнях или до глубины depth'''
+    query = select(func.count()).select_from(ReferralClosure).where(ReferralClosure.ancestor_id == id)
+    if depth is not None:
+        query = query.where(ReferralClosure.depth <= depth)
+    return query
+
+
+def ancestors_query(id: uuid.UUID) -> Select:
+    '''Рефереры пользователя от прямого до корневого'''
+    return (
+        select(User.id, User.username, User.id_referal, ReferralClosure.depth)
+        .join(User, User.id == ReferralClosure.ancestor_id)
+        .where(ReferralClosure.descendant_id == id)
+        .order_by(ReferralClosure.depth)
+    )
+
+
+async def backfill(conn: AsyncConnection) -> int:
+    '''Построить пары заново по id_referal таблицы user и вернуть их число.
+
+    Таблица блокируется до конца транзакции: параллельные регистрации ждут
+    и затем добавляют свои пары к построенным.
+    '''
+    await conn.execute(text('LOCK TABLE referral_closure IN EXCLUSIVE MODE'))
+    await conn.execute(delete(ReferralClosure))
+    walk = (
+        select(User.id_referal.label('ancestor_id'), User.id.label('descendant_id'), literal(1).label('depth'))
+        .where(User.id_referal.is_not(None))
+        .cte('walk', recursive=True)
+    )
+    parent = aliased(User)
+    walk = walk.union_all(
+        select(parent.id_referal, walk.c.descendant_id, walk.c.depth + 1)
+        .join(parent, parent.id == walk.c.ancestor_id)
+        .where(parent.id_referal.is_not(None))
+    )
+    result = await conn.execute(
+        insert(ReferralClosure).from_select(
+            _COLUMNS, select(walk.c.ancestor_id, walk.c.descendant_id, walk.c.depth)
+        )
+    )
+    return result.rowcount
+
+
+async def main() -> None:
+    async with engine.begin() as conn:
+        pairs = await backfill(conn)
+    await engine.dispose()
+    print(f'referral_closure: {pairs} pairs')
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
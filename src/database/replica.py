@@ -0,0 +1,147 @@
+import time
+from typing import Any, AsyncGenerator, Callable
+
+from fastapi import Depends
+from sqlalchemy import Executable, Result, event
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from core.config import settings
+from src.database.config import engine, get_session_maker, replica_session_maker
+
+
+class WriteTracker:
+    '''Время последней записи в основную базу в этом воркере.
+
+    Пока с записи не прошло lag секунд, реплика может ее еще не содержать,
+    и чтения идут в основную базу: запрос видит собственные изменения, как и
+    запросы, пришедшие сразу после него в тот же воркер. Записи других
+    воркеров трекер не видит.
+    '''
+
+    __slots__ = ['lag', 'clock', '_last_write']
+
+    def __init__(self, lag: float, clock: Callable[[], float] = time.monotonic) -> None:
+        self.lag = lag
+        self.clock = clock
+        self._last_write = -float('inf')
+
+    def mark(self) -> None:
+        self._last_write = self.clock()
+
+    def replica_allowed(self) -> bool:
+        return self.clock() - self._last_write >= self.lag
+
+
+write_tracker = WriteTracker(settings.db.replica_lag)
+
+
+@event.listens_for(engine.sync_engine, 'after_cursor_execute')
+def _track_write(conn: Any, cursor: Any, statement: str, parameters: Any, context: Any, executemany: bool) -> None:
+    if context is not None and (context.isinsert or context.isupdate or context.isdelete):
+        write_tracker.mark()
+
+
+class SessionRouter:
+    '''Сессии запроса: основная база и реплика, если она настроена.
+
+    Сессии создаются при первом обращении, поэтому запрос, полностью
+    обслуженный из кеша, не создает и не закрывает ни одной сессии.
+    Соединение из пула сессия берет только при первом запросе к базе.
+    '''
+
+    __slots__ = ['primary_maker', 'replica_maker', 'tracker', '_primary', '_replica']
+
+    def __init__(
+        self,
+        primary_maker: async_sessionmaker[AsyncSession],
+        replica_maker: async_sessionmaker[AsyncSession] | None = None,
+        tracker: WriteTracker = write_tracker,
+    ) -> None:
+        self.primary_maker = primary_maker
+        self.replica_maker = replica_maker
+        self.tracker = tracker
+        self._primary: AsyncSession | None = None
+        self._replica: AsyncSession | None = None
+
+    @property
+    def primary(self) -> AsyncSession:
+        '''Сессия основной базы'''
+        if self._primary is None:
+            self._primary = self.primary_maker()
+        return self._primary
+
+    def reader(self) -> AsyncSession:
+        '''Сессия для чтения, не требующего только что записанных данных'''
+        if self.replica_maker is None or not self.tracker.replica_allowed():
+            return self.primary
+        if self._replica is None:
+            self._replica = self.replica_maker()
+        return self._replica
+
+    def detached_primary(self) -> AsyncSession:
+        '''Новая сессия основной базы, которую закрывает вызывающий.
+
+        Нужна заполнению кеша: список, прочитанный из отстающей реплики
+        другим воркером, хранился бы в кеше до его TTL.
+        '''
+        return self.primary_maker()
+
+    def detached_reader(self) -> AsyncSession:
+        '''Новая сессия для чтения, которую закрывает вызывающий.
+
+        Нужна потоковым ответам: тело ответа читается из базы уже после
+        закрытия сессий запроса.
+        '''
+        if self.replica_maker is None or not self.tracker.replica_allowed():
+            return self.primary_maker()
+        return self.replica_maker()
+
+    async def execute_once(self, statement: Executable) -> Result:
+        '''Выполнить одиночное выражение в основной базе и зафиксировать его.
+
+        Вне транзакции выражение выполняется в режиме autocommit: одно
+        обращение к базе вместо BEGIN, выражения и COMMIT. Если транзакция
+        сессии уже открыта, выражение выполняется и фиксируется в ней.
+        '''
+        session = self.primary
+        if not session.in_transaction():
+            await session.connection(execution_options={'isolation_level': 'AUTOCOMMIT'})
+        result = await session.execute(statement)
+        await session.commit()
+        return result
+
+    async def write(self, statement: Executable) -> Result:
+        '''Выполнить одиночное выражение записи (см. execute_once)'''
+        result = await self.execute_once(statement)
+        # выражение может быть SELECT с изменяющими CTE, которое слушатель не распознает
+        self.tracker.mark()
+        return result
+
+    async def end_read(self) -> None:
+        '''Завершить читающие транзакции перед долгой работой (хеширование пароля).
+
+        Иначе соединение простаивает в открытой транзакции, а за PgBouncer в
+        режиме transaction еще и занимает соединение с Postgres. Объекты после
+        коммита остаются загруженными (expire_on_commit=False).
+        '''
+        for session in (self._primary, self._replica):
+            if session is not None:
+                await session.commit()
+        return None
+
+    async def close(self) -> None:
+        for session in (self._primary, self._replica):
+            if session is not None:
+                await session.close()
+        self._primary = self._replica = None
+        return None
+
+
+async def get_session_router(
+    session_maker: async_sessionmaker[AsyncSession] = Depends(get_session_maker),
+) -> AsyncGenerator[SessionRouter, None]:
+    router = SessionRouter(session_maker, replica_session_maker)
+    try:
+        yield router
+    finally:
+        await router.close()
@@ -0,0 +1,235 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Hashable, TypeVar
+
+from redis.exceptions import RedisError
+
+from src.api.metrics.registry import labels, registry
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar('T')
+
+cache_failures = registry.counter(
+    'cache_failures_total',
+    'Неудачные обращения к Redis: timeout - превышен бюджет времени, error - ошибка, '
+    'open - пропущены открытым circuit breaker',
+)
+cache_writes_dropped = registry.counter(
+    'cache_writes_dropped_total', 'Фоновые записи в кеш, отброшенные из-за перегрузки или недоступности Redis'
+)
+cache_retries_dropped = registry.counter(
+    'cache_retries_dropped_total', 'Инвалидации, не поставленные в очередь повтора из-за ее переполнения'
+)
+
+
+class CacheUnavailableError(Exception):
+    '''Redis недоступен или не ответил за отведенное время'''
+
+
+class CircuitBreaker:
+    '''Размыкатель цепи для обращений к внешнему сервису.
+
+    После failure_threshold ошибок подряд цепь размыкается (open) и вызовы
+    сразу отклоняются. Через reset_timeout секунд пропускается один пробный
+    вызов (half-open): успех замыкает цепь, ошибка снова размыкает ее.
+    '''
+
+    __slots__ = ['failure_threshold', 'reset_timeout', 'clock', '_failures', '_opened_at', '_probing']
+
+    def __init__(
+        self,
+        failure_threshold: int,
+        reset_timeout: float,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self._failures = 0
+        self._opened_at: float | None = None
+        self._probing = False
+
+    @property
+    def state(self) -> str:
+        if self._opened_at is None:
+            return 'closed'
+        if self._probing or self.clock() - self._opened_at >= self.reset_timeout:
+            return 'half-open'
+        return 'open'
+
+    def allow(self) -> bool:
+        '''Можно ли выполнить вызов; в half-open разрешается один пробный'''
+        state = self.state
+        if state == 'closed':
+            return True
+        if state == 'half-open' and not self._probing:
+            self._probing = True
+            return True
+        return False
+
+    def success(self) -> None:
+        self._failures = 0
+        self._opened_at = None
+        self._probing = False
+
+    def cancel(self) -> None:
+        '''Вызов прерван не по вине сервиса: пробным сможет стать следующий'''
+        self._probing = False
+
+    def failure(self) -> None:
+        self._failures += 1
+        if self._probing or self._failures >= self.failure_threshold:
+            if self._opened_at is None or self._probing:
+                logger.warning('Circuit opened after %s failures', self._failures)
+            self._opened_at = self.clock()
+            self._probing = False
+
+
+class CacheGuard:
+    '''Бюджет времени, circuit breaker и фоновые записи для обращений к Redis.
+
+    Ошибка или таймаут обращения превращаются в CacheUnavailableError, и
+    вызывающий код идет в базу. Фоновых записей одновременно выполняется не
+    более max_pending_writes, остальные отбрасываются: кеш можно не дописать,
+    а вот копить задачи при медленном Redis нельзя. Исключение - инвалидации
+    (retry): без них кеш отдавал бы устаревшие данные до истечения TTL, поэтому
+    они повторяются в фоне, пока Redis снова не ответит. Повторы одних и тех же
+    ключей схлопываются, а очередь ограничена max_pending_retries.
+    '''
+
+    __slots__ = [
+        'timeout', 'breaker', 'max_pending_writes', 'max_pending_retries', 'retry_delay',
+        '_writes', '_retries', '_retrier',
+    ]
+
+    def __init__(
+        self,
+        timeout: float,
+        breaker: CircuitBreaker,
+        max_pending_writes: int,
+        max_pending_retries: int = 1024,
+        retry_delay: float = 0.1,
+    ) -> None:
+        self.timeout = timeout
+        self.breaker = breaker
+        self.max_pending_writes = max_pending_writes
+        self.max_pending_retries = max_pending_retries
+        self.retry_delay = retry_delay
+        self._writes: set[asyncio.Task] = set()
+        self._retries: OrderedDict[Hashable, tuple[Callable[[], Awaitable[Any]], float | None]] = OrderedDict()
+        self._retrier: asyncio.Task | None = None
+
+    @property
+    def pending_writes(self) -> int:
+        return len(self._writes)
+
+    @property
+    def pending_retries(self) -> int:
+        return len(self._retries)
+
+    async def call(self, func: Callable[[], Awaitable[T]], timeout: float | None = None) -> T:
+        '''Выполнить обращение к Redis в пределах бюджета времени'''
+        if not self.breaker.allow():
+            cache_failures.inc(reason='open')
+            raise CacheUnavailableError('Cache circuit is open')
+        try:
+            result = await asyncio.wait_for(func(), timeout or self.timeout)
+        except asyncio.CancelledError:
+            self.breaker.cancel()
+            raise
+        except asyncio.TimeoutError as e:
+            self.breaker.failure()
+            cache_failures.inc(reason='timeout')
+            raise CacheUnavailableError('Cache timeout') from e
+        except (RedisError, OSError) as e:
+            self.breaker.failure()
+            cache_failures.inc(reason='error')
+            raise CacheUnavailableError(f'Cache error: {e}') from e
+        self.breaker.success()
+        return result
+
+    def submit(self, func: Callable[[], Awaitable[Any]], timeout: float | None = None) -> bool:
+        '''Запустить запись в фоне, не дожидаясь ее; False - запись отброшена'''
+        if len(self._writes) >= self.max_pending_writes or self.breaker.state == 'open':
+            cache_writes_dropped.inc()
+            return False
+        task = asyncio.create_task(self._write(func, timeout))
+        self._writes.add(task)
+        task.add_done_callback(self._writes.discard)
+        return True
+
+    async def _write(self, func: Callable[[], Awaitable[Any]], timeout: float | None) -> None:
+        try:
+            await self.call(func, timeout)
+        except CacheUnavailableError as e:
+            logger.warning('Cache write dropped: %s', e)
+
+    def retry(
+        self,
+        func: Callable[[], Awaitable[Any]],
+        timeout: float | None = None,
+        key: Hashable | None = None,
+    ) -> bool:
+        '''Повторять неудавшуюся запись в фоне до успеха, по порядку поступления.
+
+        Запись с тем же key заменяет ожидающую, сохраняя ее место в очереди.
+        False - очередь заполнена и запись отброшена.
+        '''
+        key = func if key is None else key
+        if key not in self._retries and len(self._retries) >= self.max_pending_retries:
+            cache_retries_dropped.inc()
+            return False
+        self._retries[key] = (func, timeout)
+        if self._retrier is None or self._retrier.done():
+            self._retrier = asyncio.create_task(self._retry_all())
+        return True
+
+    async def _retry_all(self) -> None:
+        # пауза удваивается до reset_timeout: при открытой цепи чаще пробовать бесполезно
+        delay = self.retry_delay
+        while self._retries:
+            await asyncio.sleep(delay)
+            key, entry = next(iter(self._retries.items()))
+            func, timeout = entry
+            try:
+                await self.call(func, timeout)
+            except CacheUnavailableError:
+                delay = min(delay * 2, self.breaker.reset_timeout)
+                continue
+            # пока шел повтор, его могла заменить более поздняя запись тех же ключей
+            if self._retries.get(key) is entry:
+                del self._retries[key]
+            delay = 0.0 if self._retries else self.retry_delay
+
+    async def drain(self, timeout: float) -> None:
+        '''Дождаться фоновых записей и повторов при остановке приложения'''
+        tasks = set(self._writes)
+        if self._retrier is not None:
+            tasks.add(self._retrier)
+        if tasks:
+            await asyncio.wait(tasks, timeout=timeout)
+        if self._retries and self._retrier is not None:
+            logger.error('%s cache invalidations lost on shutdown', len(self._retries))
+            self._retrier.cancel()
+        return None
+
+
+def register_metrics(guard: CacheGuard) -> None:
+    registry.gauge(
+        'cache_circuit_open',
+        'Состояние circuit breaker кеша: 0 - closed, 0.5 - half-open, 1 - open',
+        lambda: {labels(): {'closed': 0.0, 'half-open': 0.5, 'open': 1.0}[guard.breaker.state]},
+    )
+    registry.gauge(
+        'cache_pending_writes',
+        'Фоновые записи в кеш в работе',
+        lambda: {labels(): guard.pending_writes},
+    )
+    registry.gauge(
+        'cache_pending_retries',
+        'Инвалидации кеша, ожидающие повтора после ошибки Redis',
+        lambda: {labels(): guard.pending_retries},
+    )
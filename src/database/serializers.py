@@ -0,0 +1,125 @@
+import uuid
+from datetime import datetime
+from typing import Any, Iterable, Sequence
+
+import orjson
+
+from src.database.models import User
+
+# первый байт каждого значения в кеше; при изменении набора или порядка полей
+# версию нужно увеличить, тогда старые записи будут считаться промахом
+SCHEMA_VERSION = 1
+_VERSION_PREFIX = bytes([SCHEMA_VERSION])
+
+
+def _uuid(value: str | None) -> uuid.UUID | None:
+    return uuid.UUID(value) if value is not None else None
+
+
+def _datetime(value: str | None) -> datetime | None:
+    return datetime.fromisoformat(value) if value is not None else None
+
+
+class UserDTO:
+    '''Данные пользователя для кеша и ответов API без состояния ORM и хеша пароля'''
+
+    __slots__ = (
+        'id',
+        'username',
+        'email',
+        'created_at',
+        'is_active',
+        'id_referal',
+        'referal_code',
+        'exp_ref_code',
+    )
+
+    def __init__(
+        self,
+        id: uuid.UUID,
+        username: str,
+        email: str,
+        created_at: datetime,
+        is_active: bool,
+        id_referal: uuid.UUID | None = None,
+        referal_code: str | None = None,
+        exp_ref_code: datetime | None = None,
+    ) -> None:
+        self.id = id
+        self.username = username
+        self.email = email
+        self.created_at = created_at
+        self.is_active = is_active
+        self.id_referal = id_referal
+        self.referal_code = referal_code
+        self.exp_ref_code = exp_ref_code
+
+    @classmethod
+    def from_user(cls, user: 'User | UserDTO') -> 'UserDTO':
+        '''Получить DTO из ORM модели'''
+        if isinstance(user, cls):
+            return user
+        return cls(*(getattr(user, name) for name in cls.__slots__))
+
+    @classmethod
+    def columns(cls) -> tuple[Any, ...]:
+        '''Столбцы User для выборки сразу в DTO: без хеша пароля и объектов ORM'''
+        return tuple(getattr(User, name) for name in cls.__slots__)
+
+    @classmethod
+    def from_record(cls, record: Sequence[Any]) -> 'UserDTO':
+        '''DTO из строки выборки по columns()'''
+        return cls(*record)
+
+    def to_row(self) -> list[Any]:
+        return [getattr(self, name) for name in self.__slots__]
+
+    @classmethod
+    def from_row(cls, row: list[Any]) -> 'UserDTO':
+        id, username, email, created_at, is_active, id_referal, referal_code, exp_ref_code = row
+        return cls(
+            id=uuid.UUID(id),
+            username=username,
+            email=email,
+            created_at=datetime.fromisoformat(created_at),
+            is_active=is_active,
+            id_referal=_uuid(id_referal),
+            referal_code=referal_code,
+            exp_ref_code=_datetime(exp_ref_code),
+        )
+
+    def __repr__(self) -> str:
+        return f'UserDTO(id={self.id!r}, username={self.username!r})'
+
+
+def _encode(value: Any) -> bytes:
+    # asyncpg возвращает собственный тип UUID, который orjson не знает
+    return _VERSION_PREFIX + orjson.dumps(value, default=str)
+
+
+def _decode(raw: bytes | None) -> Any:
+    if not raw or raw[:1] != _VERSION_PREFIX:
+        return None
+    try:
+        return orjson.loads(raw[1:])
+    except orjson.JSONDecodeError:
+        return None
+
+
+def dumps_user(user: 'User | UserDTO') -> bytes:
+    return _encode(UserDTO.from_user(user).to_row())
+
+
+def loads_user(raw: bytes | None) -> UserDTO | None:
+    '''Декодировать пользователя; запись другой версии считается отсутствующей'''
+    row = _decode(raw)
+    return UserDTO.from_row(row) if row is not None else None
+
+
+def dumps_users(users: Iterable['User | UserDTO']) -> bytes:
+    return _encode([UserDTO.from_user(user).to_row() for user in users])
+
+
+def loads_users(raw: bytes | None) -> list[UserDTO] | None:
+    rows = _decode(raw)
+    return [UserDTO.from_row(row) for row in rows] if rows is not None else None
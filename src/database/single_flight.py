@@ -0,0 +1,27 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Hashable
+
+
+class SingleFlight:
+    '''Объединение одновременных вызовов с одинаковым ключом внутри воркера.
+
+    Пока вычисление по ключу не завершено, остальные вызовы ждут его результат
+    вместо запуска собственного. Отмена одного из ожидающих не прерывает
+    вычисление для остальных.
+    '''
+
+    __slots__ = ['_calls']
+
+    def __init__(self) -> None:
+        self._calls: dict[Hashable, asyncio.Future] = {}
+
+    def __len__(self) -> int:
+        return len(self._calls)
+
+    async def do(self, key: Hashable, func: Callable[[], Awaitable[Any]]) -> Any:
+        task = self._calls.get(key)
+        if task is None:
+            task = asyncio.ensure_future(func())
+            self._calls[key] = task
+            task.add_done_callback(lambda _: self._calls.pop(key, None))
+        return await asyncio.shield(task)
@@ -0,0 +1,540 @@
+'''Загрузка пользователей из CSV или NDJSON.
+
+Записи читаются потоком и пишутся пачками по --batch-size: пачка копируется
+COPY во временную таблицу и переносится в user выражением INSERT ... SELECT
+ON CONFLICT DO NOTHING, поэтому уже существующие username и email пропускаются.
+Пароли хешируются в пуле процессов, пока пишется предыдущая пачка; записи
+с готовым хешем (hashed_password) не хешируются. Каждая пачка записывается
+в одной транзакции вместе с числом обработанных записей источника
+(таблица user_import), и прерванная загрузка продолжается с первой
+незаписанной пачки.
+
+Поля записи: username, email, password или hashed_password, необязательные
+created_at, is_active, referal_code и exp_ref_code (собственный код
+пользователя) и referrer_code (код, по которому он пришел). Коды рефереров
+сохраняются в user_import_referral и после загрузки сопоставляются с
+пользователями по уровням дерева (link_referrers). Ненайденные коды остаются
+и сопоставляются при следующей загрузке, коды рефереров, зарегистрированных
+позже реферала, отбрасываются и попадают в --rejects:
+
+    python -m src.database.user_import users.csv --rejects rejects.ndjson
+'''
+import argparse
+import asyncio
+import csv
+import time
+import uuid
+from concurrent.futures import Executor, ProcessPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Iterator
+
+import orjson
+from pydantic import EmailStr, TypeAdapter, ValidationError
+from sqlalchemy import (
+    ARRAY,
+    Column,
+    Integer,
+    MetaData,
+    String,
+    Table,
+    any_,
+    bindparam,
+    delete,
+    func,
+    literal,
+    or_,
+    select,
+    tuple_,
+    update,
+)
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncConnection
+from sqlalchemy.orm import aliased
+
+from core.config import settings
+from src.api.auth import password_policy
+from src.database import referral_stats, referral_tree
+from src.database.config import engine
+from src.database.models import User, UserImport, UserImportReferral
+
+_USER_COLUMNS = [
+    'id', 'username', 'email', 'created_at', 'hashed_password', 'is_active', 'referal_code', 'exp_ref_code'
+]
+_HASHED_PASSWORD = _USER_COLUMNS.index('hashed_password')
+_USERNAME_LENGTH: int = User.__table__.c.username.type.length  # type: ignore[attr-defined]
+_HASH_LENGTH: int = User.__table__.c.hashed_password.type.length  # type: ignore[attr-defined]
+_CODE_LENGTH: int = User.__table__.c.referal_code.type.length  # type: ignore[attr-defined]
+
+# пачка перед переносом в user; создается в транзакции пачки, поэтому работает и через PgBouncer
+_batch = Table(
+    'user_import_batch',
+    MetaData(),
+    *(Column(name, User.__table__.c[name].type) for name in _USER_COLUMNS),
+    Column('referrer_code', String(length=10)),
+    prefixes=['TEMPORARY'],
+    postgresql_on_commit='DROP',
+)
+
+# найденные рефереры загруженных пользователей и уровень связи (1 - реферер уже не ждет связи)
+_links = Table(
+    'user_import_link',
+    MetaData(),
+    Column('user_id', User.__table__.c.id.type, primary_key=True),
+    Column('referrer_id', User.__table__.c.id.type, nullable=False),
+    Column('level', Integer, index=True),
+    prefixes=['TEMPORARY'],
+    postgresql_on_commit='DROP',
+)
+
+_email = TypeAdapter(EmailStr)
+
+
+def _text(record: dict[str, Any], name: str, max_length: int | None = None) -> str | None:
+    value = record.get(name)
+    if value is None:
+        return None
+    if not isinstance(value, str):
+        raise ValueError(f'{name}: expected a string')
+    value = value.strip()
+    if max_length and len(value) > max_length:
+        raise ValueError(f'{name}: longer than {max_length}')
+    return value or None
+
+
+def _timestamp(record: dict[str, Any], name: str) -> datetime | None:
+    value = _text(record, name)
+    if value is None:
+        return None
+    try:
+        moment = datetime.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f'{name}: expected an ISO 8601 timestamp')
+    # столбцы без часового пояса хранят местное время, как datetime.now() в приложении
+    return moment.astimezone().replace(tzinfo=None) if moment.tzinfo else moment
+
+
+def _flag(record: dict[str, Any], name: str) -> bool:
+    value = record.get(name)
+    if value is None or isinstance(value, bool):
+        return value is not False
+    text = str(value).strip().lower()
+    if text in ('', '1', 'true', 't', 'yes'):
+        return True
+    if text in ('0', 'false', 'f', 'no'):
+        return False
+    raise ValueError(f'{name}: expected a boolean')
+
+
+def parse_record(record: dict[str, Any]) -> tuple[list[Any], str | None]:
+    '''Строка пачки в порядке столбцов _batch и пароль, который нужно захешировать.
+
+    Если пароля нет, в строке уже стоит hashed_password. Неверная запись вызывает ValueError.
+    '''
+    username = _text(record, 'username', _USERNAME_LENGTH)
+    if not username:
+        raise ValueError('username: required')
+    try:
+        email = _email.validate_python(_text(record, 'email'))
+    except ValidationError:
+        raise ValueError('email: invalid')
+    password = _text(record, 'password')
+    hashed_password = _text(record, 'hashed_password', _HASH_LENGTH)
+    if hashed_password:
+        # хеш неизвестной схемы не проверится при входе
+        if not any(hasher.identify(hashed_password) for hasher in password_policy.password_hash.hashers):
+            raise ValueError('hashed_password: unknown hash scheme')
+        password = None
+    elif not password:
+        raise ValueError('password or hashed_password: required')
+    referal_code = _text(record, 'referal_code', _CODE_LENGTH)
+    exp_ref_code = _timestamp(record, 'exp_ref_code')
+    if referal_code and exp_ref_code is None:
+        raise ValueError('exp_ref_code: required with referal_code')
+    row = [
+        uuid.uuid4(),
+        username,
+        email,
+        _timestamp(record, 'created_at') or datetime.now(),
+        hashed_password.encode() if hashed_password else None,
+        _flag(record, 'is_active'),
+        referal_code,
+        exp_ref_code if referal_code else None,
+        _text(record, 'referrer_code', _CODE_LENGTH),
+    ]
+    return row, password
+
+
+def read_records(path: Path, format: str) -> Iterator[dict[str, Any] | None]:
+    '''Записи файла по порядку; None - строка NDJSON, которая не является объектом'''
+    with path.open(newline='', encoding='utf-8') as file:
+        if format == 'csv':
+            yield from csv.DictReader(file)
+            return None
+        for line in file:
+            if not line.strip():
+                continue
+            try:
+                record = orjson.loads(line)
+            except orjson.JSONDecodeError:
+                record = None
+            yield record if isinstance(record, dict) else None
+
+
+def _parse_records(records: list[dict[str, Any] | None]) -> list[tuple[list[Any] | None, str | None]]:
+    '''Разобранные записи: строка и пароль или None и причина отказа'''
+    parsed: list[tuple[list[Any] | None, str | None]] = []
+    for record in records:
+        try:
+            if record is None:
+                raise ValueError('not a JSON object')
+            parsed.append(parse_record(record))
+        except ValueError as e:
+            parsed.append((None, str(e)))
+    return parsed
+
+
+def _hash_passwords(passwords: list[str]) -> list[bytes]:
+    return [password_policy.hash(password) for password in passwords]
+
+
+async def _map(executor: Executor, workers: int, func: Callable[[list], list], items: list) -> list:
+    '''func над items частями по числу процессов пула'''
+    if not items:
+        return []
+    loop = asyncio.get_running_loop()
+    size = -(-len(items) // workers)
+    chunks = await asyncio.gather(
+        *(loop.run_in_executor(executor, func, items[start:start + size]) for start in range(0, len(items), size))
+    )
+    return [item for chunk in chunks for item in chunk]
+
+
+class Progress:
+    '''Счетчики загрузки источника: всего и за текущий запуск'''
+
+    __slots__ = ['source', 'rows', 'inserted', 'skipped', 'rejected', 'start', 'done']
+
+    def __init__(self, source: str, rows: int = 0, inserted: int = 0, skipped: int = 0, rejected: int = 0) -> None:
+        self.source = source
+        self.rows = rows
+        self.inserted = inserted
+        self.skipped = skipped
+        self.rejected = rejected
+        self.start = time.perf_counter()
+        self.done = 0
+
+    def report(self) -> str:
+        rate = self.done / max(time.perf_counter() - self.start, 1e-9)
+        return (
+            f'{self.source}: rows {self.rows} inserted {self.inserted} skipped {self.skipped}'
+            f' rejected {self.rejected} ({rate:.0f} rows/s)'
+        )
+
+
+class Batch:
+    '''Записи источника от first до first + size: строки для записи и счетчики отброшенных'''
+
+    __slots__ = ['first', 'records', 'rows', 'passwords', 'rejects', 'skipped']
+
+    def __init__(self, first: int) -> None:
+        self.first = first
+        self.records: list[dict[str, Any] | None] = []
+        self.rows: list[list[Any]] = []
+        # индексы строк rows без хеша и их пароли
+        self.passwords: list[tuple[int, str]] = []
+        self.rejects: list[tuple[int, str]] = []
+        self.skipped = 0
+
+    @property
+    def size(self) -> int:
+        return len(self.records)
+
+    async def parse(self, executor: Executor, workers: int) -> None:
+        '''Разобрать записи в пуле: проверка email занимает большую часть разбора'''
+        parsed = await _map(executor, workers, _parse_records, self.records)
+        for number, (row, password) in enumerate(parsed, self.first + 1):
+            if row is None:
+                self.rejects.append((number, password or ''))
+                continue
+            if password is not None:
+                self.passwords.append((len(self.rows), password))
+            self.rows.append(row)
+
+    async def drop_existing(self) -> None:
+        '''Отбросить записи с занятыми username или email до хеширования паролей'''
+        if not self.rows:
+            return None
+        names = bindparam('names', [row[1] for row in self.rows], type_=ARRAY(String))
+        emails = bindparam('emails', [row[2] for row in self.rows], type_=ARRAY(String))
+        async with engine.connect() as conn:
+            taken = (
+                await conn.execute(
+                    select(User.username, User.email).where(
+                        or_(User.username == any_(names), User.email == any_(emails))
+                    )
+                )
+            ).all()
+        if not taken:
+            return None
+        usernames = {username for username, _ in taken}
+        taken_emails = {email for _, email in taken}
+        hashing = dict(self.passwords)
+        rows: list[list[Any]] = []
+        self.passwords = []
+        for index, row in enumerate(self.rows):
+            if row[1] in usernames or row[2] in taken_emails:
+                self.skipped += 1
+                continue
+            if index in hashing:
+                self.passwords.append((len(rows), hashing[index]))
+            rows.append(row)
+        self.rows = rows
+
+    async def hash(self, executor: Executor, workers: int) -> None:
+        '''Захешировать пароли частями по числу процессов пула'''
+        hashes = await _map(executor, workers, _hash_passwords, [password for _, password in self.passwords])
+        for (index, _), hashed in zip(self.passwords, hashes):
+            self.rows[index][_HASHED_PASSWORD] = hashed
+        self.passwords = []
+
+    async def prepare(self, executor: Executor, workers: int) -> 'Batch':
+        await self.parse(executor, workers)
+        await self.drop_existing()
+        await self.hash(executor, workers)
+        return self
+
+
+async def write_batch(batch: Batch, progress: Progress) -> None:
+    '''Перенести пачку в user и учесть ее записи в user_import одной транзакцией'''
+    inserted = 0
+    async with engine.begin() as conn:
+        if batch.rows:
+            await conn.run_sync(_batch.create)
+            driver = (await conn.get_raw_connection()).driver_connection
+            await driver.copy_records_to_table(  # type: ignore[union-attr]
+                _batch.name, records=batch.rows, columns=[column.name for column in _batch.c]
+            )
+            created = (
+                insert(User)
+                .from_select(_USER_COLUMNS, select(*(_batch.c[name] for name in _USER_COLUMNS)))
+                .on_conflict_do_nothing()
+                .returning(User.id)
+                .cte('created')
+            )
+            referrals = insert(UserImportReferral).from_select(
+                ['user_id', 'referrer_code'],
+                select(_batch.c.id, _batch.c.referrer_code)
+                .join(created, created.c.id == _batch.c.id)
+                .where(_batch.c.referrer_code.is_not(None)),
+            )
+            inserted = (
+                await conn.execute(
+                    select(func.count()).select_from(created).add_cte(referrals.cte('referrals'))
+                )
+            ).scalar_one()
+        skipped = batch.skipped + len(batch.rows) - inserted
+        statement = insert(UserImport).values(
+            source=progress.source,
+            rows=batch.size,
+            inserted=inserted,
+            skipped=skipped,
+            rejected=len(batch.rejects),
+            updated_at=datetime.now(),
+        )
+        excluded = statement.excluded
+        await conn.execute(
+            statement.on_conflict_do_update(
+                index_elements=[UserImport.source],
+                set_={
+                    'rows': UserImport.rows + excluded.rows,
+                    'inserted': UserImport.inserted + excluded.inserted,
+                    'skipped': UserImport.skipped + excluded.skipped,
+                    'rejected': UserImport.rejected + excluded.rejected,
+                    'updated_at': excluded.updated_at,
+                },
+            )
+        )
+    progress.rows += batch.size
+    progress.done += batch.size
+    progress.inserted += inserted
+    progress.skipped += skipped
+    progress.rejected += len(batch.rejects)
+
+
+async def link_referrers(conn: AsyncConnection) -> tuple[int, int, list[tuple[str, str]]]:
+    '''Проставить id_referal загруженным пользователям по кодам рефереров.
+
+    Реферер должен быть зарегистрирован раньше реферала: так коды не могут
+    замкнуть дерево в цикл. Коды, нарушающие это условие, отбрасываются.
+    Остальные связываются по уровням: сначала пользователи, чей реферер
+    уже не ждет связи, затем их рефералы и так далее. Каждый уровень -
+    одно выражение, которое добавляет только пары дерева рефералов и
+    счетчики новых связей (link_referrals, count_referrals), без пересчета
+    и блокировки таблиц целиком. Возвращает число связанных и оставшихся
+    кодов и отброшенные пары (username, код).
+    '''
+    referrer = aliased(User, name='referrer')
+    blocked = (
+        delete(UserImportReferral)
+        .where(
+            User.id == UserImportReferral.user_id,
+            referrer.referal_code == UserImportReferral.referrer_code,
+            tuple_(referrer.created_at, referrer.id) >= tuple_(User.created_at, User.id),
+        )
+        .returning(UserImportReferral.user_id, UserImportReferral.referrer_code)
+        .cte('blocked')
+    )
+    rejected = (
+        await conn.execute(
+            select(User.username, blocked.c.referrer_code)
+            .join(blocked, blocked.c.user_id == User.id)
+            .order_by(User.username)
+        )
+    ).all()
+
+    await conn.run_sync(_links.create)
+    await conn.execute(
+        insert(_links).from_select(
+            ['user_id', 'referrer_id'],
+            select(UserImportReferral.user_id, referrer.id)
+            .join(User, User.id == UserImportReferral.user_id)
+            .join(referrer, referrer.referal_code == UserImportReferral.referrer_code)
+            .where(User.id_referal.is_(None)),
+        )
+    )
+    # уровень - расстояние до реферера, который сам не ждет связи; пользователи, чей
+    # реферер ждет ненайденного кода, уровня не получают и остаются до следующей загрузки
+    waiting = select(UserImportReferral.user_id).where(UserImportReferral.user_id == _links.c.referrer_id)
+    levels = (
+        select(_links.c.user_id, literal(1).label('level'))
+        .where(~waiting.exists())
+        .cte('levels', recursive=True)
+    )
+    parent = levels.alias('parent')
+    levels = levels.union_all(
+        select(_links.c.user_id, parent.c.level + 1).join(parent, _links.c.referrer_id == parent.c.user_id)
+    )
+    await conn.execute(update(_links).where(_links.c.user_id == levels.c.user_id).values(level=levels.c.level))
+    depth = (await conn.execute(select(func.max(_links.c.level)))).scalar_one()
+
+    linked = 0
+    for level in range(1, (depth or 0) + 1):
+        updated = (
+            update(User)
+            .where(User.id == _links.c.user_id, _links.c.level == level)
+            .values(id_referal=_links.c.referrer_id)
+            .returning(User.id, User.id_referal, User.is_active, User.created_at)
+            .cte('linked')
+        )
+        done = delete(UserImportReferral).where(UserImportReferral.user_id.in_(select(updated.c.id)))
+        linked += (
+            await conn.execute(
+                select(func.count())
+                .select_from(updated)
+                .add_cte(referral_tree.link_referrals(updated).cte('closure'))
+                .add_cte(referral_stats.count_referrals(updated).cte('stats'))
+                .add_cte(done.cte('done'))
+            )
+        ).scalar_one()
+    pending = (await conn.execute(select(func.count()).select_from(UserImportReferral))).scalar_one()
+    return linked, pending, [(username, code) for username, code in rejected]
+
+
+async def import_users(
+    path: Path,
+    format: str = 'csv',
+    source: str | None = None,
+    batch_size: int = 5000,
+    workers: int = settings.hashing.max_workers,
+    rejects: Path | None = None,
+    restart: bool = False,
+) -> Progress:
+    '''Загрузить записи источника, начиная с первой необработанной'''
+    source = source or str(path.resolve())
+    async with engine.begin() as conn:
+        if restart:
+            await conn.execute(delete(UserImport).where(UserImport.source == source))
+        state = (
+            await conn.execute(
+                select(UserImport.rows, UserImport.inserted, UserImport.skipped, UserImport.rejected)
+                .where(UserImport.source == source)
+            )
+        ).first()
+    progress = Progress(source, *(state or ()))
+    records = read_records(path, format)
+    for _ in zip(range(progress.rows), records):
+        pass
+    rejects_file = rejects.open('ab') if rejects else None
+    pending: asyncio.Future | None = None
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            try:
+                batch = Batch(progress.rows)
+                # пачка готовится (разбор, проверка username и email, хеширование), пока пишется предыдущая
+                for record in records:
+                    batch.records.append(record)
+                    if batch.size < batch_size:
+                        continue
+                    # pending указывает на новую пачку до записи прежней: при ошибке записи ее отменит finally
+                    previous, pending = pending, asyncio.ensure_future(batch.prepare(executor, workers))
+                    if previous:
+                        await _write(await previous, progress, rejects_file)
+                    batch = Batch(batch.first + batch.size)
+                if pending:
+                    previous, pending = pending, None
+                    await _write(await previous, progress, rejects_file)
+                if batch.size:
+                    await _write(await batch.prepare(executor, workers), progress, rejects_file)
+            finally:
+                if pending:
+                    # отмена дожидается до остановки пула, иначе задача остается висеть
+                    pending.cancel()
+                    await asyncio.gather(pending, return_exceptions=True)
+    finally:
+        if rejects_file:
+            rejects_file.close()
+    return progress
+
+
+async def _write(batch: Batch, progress: Progress, rejects_file: Any) -> None:
+    await write_batch(batch, progress)
+    if rejects_file:
+        for row, error in batch.rejects:
+            rejects_file.write(orjson.dumps({'source': progress.source, 'row': row, 'error': error}) + b'\n')
+        rejects_file.flush()
+    print(progress.report(), flush=True)
+
+
+async def main(args: argparse.Namespace) -> None:
+    format = args.format or ('ndjson' if args.path.suffix in ('.ndjson', '.jsonl') else 'csv')
+    await import_users(
+        args.path,
+        format,
+        source=args.source,
+        batch_size=args.batch_size,
+        workers=args.workers,
+        rejects=args.rejects,
+        restart=args.restart,
+    )
+    async with engine.begin() as conn:
+        linked, pending, rejected = await link_referrers(conn)
+    if args.rejects and rejected:
+        with args.rejects.open('ab') as file:
+            for username, code in rejected:
+                error = 'Referrer registered after the user'
+                file.write(orjson.dumps({'username': username, 'referrer_code': code, 'error': error}) + b'\n')
+    print(f'referrers: {linked} linked, {pending} codes not found, {len(rejected)} rejected')
+    await engine.dispose()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('path', type=Path)
+    parser.add_argument('--format', choices=['csv', 'ndjson'], help='по умолчанию по расширению файла')
+    parser.add_argument('--source', help='имя источника для продолжения загрузки, по умолчанию путь к файлу')
+    parser.add_argument('--batch-size', type=int, default=5000)
+    parser.add_argument('--workers', type=int, default=settings.hashing.max_workers, help='процессы хеширования')
+    parser.add_argument('--rejects', type=Path, help='NDJSON с отброшенными записями и причинами')
+    parser.add_argument('--restart', action='store_true', help='загрузить источник с начала')
+    asyncio.run(main(parser.parse_args()))
@@ -1,6 +1,18 @@
+import time
 from http import HTTPStatus
 
+import jwt
 from httpx import AsyncClient
+from pwdlib.hashers.bcrypt import BcryptHasher
+from sqlalchemy import delete, select, update
+
+from core.config import settings
+from src.api.auth import password_policy
+from src.api.auth.repository import ResetPasswordRepository, UserAuthRepository
+from src.api.auth.token_cache import VerifiedTokenCache
+from src.database.models import User
+from src.database.replica import SessionRouter
+from tests.conftest import async_session_maker
 
 
 async def test_registration(ac_client: AsyncClient) -> None:
@@ -98,3 +110,82 @@ async def test_registration_with_code_bad(ac_client: AsyncClient) -> None:
     assert response.status_code == HTTPStatus.CONFLICT
     assert response.json() == {'detail': 'User with referral code '
                                          'not found or expire referral code'}
+
+
+async def test_jwks(
+    ac_client: AsyncClient,
+    save_token: dict[str, str],
+) -> None:
+    response = await ac_client.get(url='/.well-known/jwks.json')
+    assert response.status_code == HTTPStatus.OK
+    kids = [key['kid'] for key in response.json()['keys']]
+    assert jwt.get_unverified_header(save_token['access_token'])['kid'] in kids
+
+
+async def test_change_password_with_key(ac_client: AsyncClient) -> None:
+    repository = ResetPasswordRepository(SessionRouter(async_session_maker))
+    for password in ('new_password', 'password'):
+        key = await repository.create_reset_key('user1@user1.user')
+        response = await ac_client.patch(url='/resetpassword/', params={'resetkey': key, 'new_password': password})
+        assert response.status_code == HTTPStatus.OK
+        response = await ac_client.post(url='/login', data={'username': 'user1', 'password': password})
+        assert response.status_code == HTTPStatus.OK
+
+        response = await ac_client.patch(url='/resetpassword/', params={'resetkey': key, 'new_password': 'other'})
+        assert response.status_code == HTTPStatus.NOT_FOUND
+    await repository.sessions.close()
+
+
+async def stored_hash(username: str) -> bytes:
+    async with async_session_maker() as session:
+        return (await session.execute(select(User.hashed_password).where(User.username == username))).scalar_one()
+
+
+async def test_login_upgrades_weak_hash(ac_client: AsyncClient) -> None:
+    weak = BcryptHasher(rounds=4).hash('rehash_user').encode()
+    async with async_session_maker() as session:
+        session.add(User(username='rehash_user', email='rehash_user@rehash.user', hashed_password=weak))
+        await session.commit()
+
+    response = await ac_client.post(url='/login', data={'username': 'rehash_user', 'password': 'rehash_user'})
+    assert response.status_code == HTTPStatus.OK
+    upgraded = await stored_hash('rehash_user')
+    assert upgraded != weak
+    assert upgraded.startswith(f'$2b${settings.hashing.bcrypt_rounds:02d}$'.encode())
+    response = await ac_client.post(url='/login', data={'username': 'rehash_user', 'password': 'rehash_user'})
+    assert response.status_code == HTTPStatus.OK
+    assert await stored_hash('rehash_user') == upgraded
+
+
+async def test_rehash_keeps_concurrent_password_change(ac_client: AsyncClient) -> None:
+    repository = UserAuthRepository(SessionRouter(async_session_maker))
+    user = await repository.read('rehash_user')
+    # пароль сменили между проверкой старого хеша и записью нового
+    changed = password_policy.hash('changed_password')
+    async with async_session_maker() as session:
+        await session.execute(update(User).where(User.id == user.id).values(hashed_password=changed))
+        await session.commit()
+
+    await repository.update_hashed_password(user, password_policy.hash('rehash_user'))
+    await repository.sessions.close()
+    assert await stored_hash('rehash_user') == changed
+    response = await ac_client.post(url='/login', data={'username': 'rehash_user', 'password': 'changed_password'})
+    assert response.status_code == HTTPStatus.OK
+
+    async with async_session_maker() as session:
+        await session.execute(delete(User).where(User.username == 'rehash_user'))
+        await session.commit()
+
+
+def test_token_cache_purges_subject_by_index() -> None:
+    cache = VerifiedTokenCache(maxsize=2, ttl=60)
+    expire_at = time.time() + 600
+    cache.set('token1', {'sub': 'a', 'exp': expire_at})
+    cache.set('token2', {'sub': 'b', 'exp': expire_at})
+    # token1 вытеснен из LRU, индекс его забывает
+    cache.set('token3', {'sub': 'a', 'exp': expire_at})
+    assert cache.get('token1') is None
+    assert cache.purge_subject('a') == 1
+    assert cache.get('token3') is None
+    assert cache.get('token2') is not None
+    assert cache.purge_subject('a') == 0
@@ -0,0 +1,39 @@
+from pathlib import Path
+
+import jwt
+import pytest
+from cryptography.hazmat.primitives.asymmetric import ec
+from cryptography.hazmat.primitives.serialization import (
+    Encoding,
+    NoEncryption,
+    PrivateFormat,
+    PublicFormat,
+)
+from jwt.exceptions import InvalidSignatureError
+
+from src.api.auth.keys import KeyManager
+
+
+def write_public(path: Path, private_key: ec.EllipticCurvePrivateKey) -> None:
+    path.write_bytes(private_key.public_key().public_bytes(Encoding.PEM, PublicFormat.SubjectPublicKeyInfo))
+
+
+def test_tokens_without_kid_are_checked_against_retired_keys(tmp_path: Path) -> None:
+    active, retired, unknown = (ec.generate_private_key(ec.SECP256R1()) for _ in range(3))
+    (tmp_path / 'retired').mkdir()
+    (tmp_path / 'private.key').write_bytes(
+        active.private_bytes(Encoding.PEM, PrivateFormat.PKCS8, NoEncryption())
+    )
+    write_public(tmp_path / 'public.key', active)
+    write_public(tmp_path / 'retired' / 'old.key', retired)
+    manager = KeyManager('ES256', tmp_path / 'private.key', tmp_path / 'public.key', tmp_path / 'retired')
+
+    # токен выпущен до ротации и до появления kid
+    assert manager.decode(jwt.encode({'sub': 'old'}, retired, algorithm='ES256')) == {'sub': 'old'}
+
+    kid, algorithm, private_key = manager.signing_key()
+    token = jwt.encode({'sub': 'new'}, private_key, algorithm=algorithm, headers={'kid': kid})
+    assert manager.decode(token) == {'sub': 'new'}
+
+    with pytest.raises(InvalidSignatureError):
+        manager.decode(jwt.encode({'sub': 'forged'}, unknown, algorithm='ES256'))
@@ -0,0 +1,172 @@
+import asyncio
+import uuid
+from datetime import datetime
+from typing import Callable
+
+import pytest
+from httpx import AsyncClient
+
+from core.config import settings
+from src.database import cache_keys
+from src.database.cache import CacheBackend, NullCache, get_cache
+from src.database.memory_cache import MemoryCache
+from src.database.redis_tools import RedisCache
+from src.database.serializers import UserDTO
+
+
+def make_user(username: str, email: str) -> UserDTO:
+    return UserDTO(id=uuid.uuid4(), username=username, email=email, created_at=datetime.now(), is_active=True)
+
+
+async def test_memory_cache_moves_indexes() -> None:
+    cache = MemoryCache(maxsize=100)
+    user = make_user('memory1', 'memory1@memory.user')
+    await cache.batch().set_user(user).execute()
+    assert (await cache.get_user('memory1')).id == user.id  # type: ignore
+    assert (await cache.get_email_user('memory1@memory.user')).id == user.id  # type: ignore
+
+    renamed = UserDTO(user.id, 'memory2', 'memory2@memory.user', user.created_at, True)
+    await cache.batch().set_user(renamed).execute()
+    assert await cache.get_user('memory1') is None
+    assert await cache.get_email_user('memory1@memory.user') is None
+    assert (await cache.get_user('memory2')).username == 'memory2'  # type: ignore
+
+    await cache.batch().del_user('memory2').execute()
+    assert await cache.get_user('memory2') is None
+    assert await cache.get_email_user('memory2@memory.user') is None
+
+
+async def test_memory_cache_coalesces_referral_loads() -> None:
+    cache = MemoryCache(maxsize=100)
+    referral = make_user('memory3', 'memory3@memory.user')
+    calls = 0
+
+    async def loader() -> list[UserDTO]:
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return [referral]
+
+    results = await asyncio.gather(*(cache.get_about_referrals_or_load('1', loader) for _ in range(10)))
+    assert calls == 1
+    assert all(result[0].id == referral.id for result in results)
+    assert (await cache.get_about_referrals_or_load('1', loader))[0].id == referral.id
+    assert calls == 1
+
+    await cache.batch().delete(cache_keys.referrals('1')).execute()
+    await cache.get_about_referrals_or_load('1', loader)
+    assert calls == 2
+
+
+@pytest.mark.parametrize('factory', [RedisCache, MemoryCache])
+async def test_fill_read_before_invalidation_is_rejected(
+    factory: Callable[[], CacheBackend], monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setattr(settings.cache, 'tombstone_ttl', 1)
+    cache = factory()
+    user = make_user('race1', 'race1@race.user')
+    await cache.batch().set_user(user).execute()
+    # запрос прочитал пользователя из базы, затем пользователь отключен,
+    # и запись прочитанного значения дошла до кеша уже после инвалидации
+    await cache.batch().del_user(user.username, user.email).execute()
+    await cache.batch().set_user(user).execute()
+    assert await cache.get_user('race1') is None
+    assert await cache.get_email_user('race1@race.user') is None
+
+    # после истечения метки кеш снова заполняется
+    await asyncio.sleep(1.1)
+    await cache.batch().set_user(user).execute()
+    assert (await cache.get_user('race1')).id == user.id  # type: ignore
+    await cache.batch().del_user(user.username, user.email).execute()
+    await cache.close()
+
+
+@pytest.mark.parametrize('factory', [RedisCache, MemoryCache])
+async def test_referral_rebuild_read_before_invalidation_is_not_stored(
+    factory: Callable[[], CacheBackend]
+) -> None:
+    cache = factory()
+    id = str(uuid.uuid4())
+    old, new = make_user('rebuild1', 'rebuild1@race.user'), make_user('rebuild2', 'rebuild2@race.user')
+    selected, release = asyncio.Event(), asyncio.Event()
+
+    async def stale_loader() -> list[UserDTO]:
+        selected.set()
+        await release.wait()
+        return [old]
+
+    async def loader() -> list[UserDTO]:
+        return [old, new]
+
+    async def failing_loader() -> list[UserDTO]:
+        raise AssertionError('list must be cached')
+
+    # перестройка прочитала список из базы, затем зарегистрировался новый реферал
+    rebuild = asyncio.create_task(cache.get_about_referrals_or_load(id, stale_loader))
+    await selected.wait()
+    await cache.batch().del_referrals(id).invalidate()
+    release.set()
+    assert [user.id for user in await rebuild] == [old.id]
+
+    assert [user.id for user in await cache.get_about_referrals_or_load(id, loader)] == [old.id, new.id]
+    assert [user.id for user in await cache.get_about_referrals_or_load(id, failing_loader)] == [old.id, new.id]
+    await cache.batch().del_referrals(id).execute()
+    await cache.close()
+
+
+async def scrape(ac_client: AsyncClient) -> dict[str, float]:
+    '''Значения метрик из /metrics по строке серии с метками'''
+    response = await ac_client.get(url='http://test/metrics')
+    series = (line.rsplit(' ', 1) for line in response.text.splitlines() if not line.startswith('#'))
+    return {name: float(value) for name, value in series}
+
+
+async def test_redis_cache_metrics(ac_client: AsyncClient) -> None:
+    cache = RedisCache()
+    user = make_user('metrics1', 'metrics1@metrics.user')
+    before = await scrape(ac_client)
+    await cache.batch().set_user(user).execute()
+    assert (await cache.get_user('metrics1')).id == user.id  # type: ignore
+    assert await cache.get_user('metrics2') is None
+    after = await scrape(ac_client)
+
+    for series in (
+        'cache_operations_total{op="get_user",result="hit"}',
+        'cache_operations_total{op="get_user",result="miss"}',
+        'cache_operations_total{op="set_user",result="ok"}',
+        'cache_operation_seconds_count{op="get_user",result="hit"}',
+        'cache_operation_seconds_count{op="get_user",result="miss"}',
+        'cache_value_bytes_count{entity="user"}',
+        'cache_hit_age_seconds_count{entity="user"}',
+    ):
+        assert after[series] == before.get(series, 0) + 1, series
+    await cache.batch().delete(
+        cache_keys.user(user.id), cache_keys.username(user.username), cache_keys.email(user.email)
+    ).execute()
+    await cache.close()
+
+
+async def test_redis_cache_instances_keep_app_metrics(ac_client: AsyncClient) -> None:
+    app_cache = get_cache()
+    if not isinstance(app_cache, RedisCache):
+        pytest.skip('Redis cache backend is not configured')
+    cache = RedisCache()
+    for _ in range(settings.cache.breaker_failures):
+        cache._guard.breaker.failure()
+    assert cache._guard.breaker.state == 'open'
+    assert app_cache._guard.breaker.state == 'closed'
+    assert (await scrape(ac_client))['cache_circuit_open'] == 0
+    await cache.close()
+
+
+@pytest.mark.parametrize('batch_method', ['execute', 'submit'])
+async def test_null_cache_always_loads(batch_method: str) -> None:
+    cache = NullCache()
+    user = make_user('null1', 'null1@null.user')
+    await getattr(cache.batch().set_user(user), batch_method)()
+    assert await cache.get_user('null1') is None
+
+    async def loader() -> list[UserDTO]:
+        return [user]
+
+    assert await cache.get_about_referrals_or_load('1', loader) == [user]
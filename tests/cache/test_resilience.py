@@ -0,0 +1,164 @@
+import asyncio
+import time
+import uuid
+from datetime import datetime
+from http import HTTPStatus
+from typing import AsyncGenerator
+
+import pytest
+from httpx import AsyncClient
+from redis import asyncio as aioredis
+
+from core.config import settings
+from src.database import cache
+from src.database.cache import get_cache
+from src.database.events import UserDeactivated, event_bus
+from src.database.redis_tools import RedisCache
+from src.database.resilience import CacheGuard, CacheUnavailableError, CircuitBreaker
+from src.database.serializers import UserDTO
+
+
+class SlowRedis:
+    '''TCP прокси перед Redis из настроек, задерживающий ответы на delay секунд'''
+
+    def __init__(self) -> None:
+        self.delay = 0.0
+        self.port = 0
+        self._server: asyncio.Server | None = None
+
+    async def start(self) -> None:
+        self._server = await asyncio.start_server(self._handle, '127.0.0.1', 0)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def stop(self) -> None:
+        self._server.close()  # type: ignore
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        upstream_reader, upstream_writer = await asyncio.open_connection(
+            settings.cache.host, settings.cache.port
+        )
+        await asyncio.gather(
+            self._pipe(reader, upstream_writer, delayed=False),
+            self._pipe(upstream_reader, writer, delayed=True),
+            return_exceptions=True,
+        )
+
+    async def _pipe(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, delayed: bool) -> None:
+        try:
+            while data := await reader.read(65536):
+                if delayed and self.delay:
+                    await asyncio.sleep(self.delay)
+                writer.write(data)
+                await writer.drain()
+        finally:
+            writer.close()
+
+
+@pytest.fixture
+async def slow_redis() -> AsyncGenerator[tuple[SlowRedis, aioredis.Redis], None]:
+    proxy = SlowRedis()
+    await proxy.start()
+    client = aioredis.from_url(f'redis://127.0.0.1:{proxy.port}')
+    yield proxy, client
+    await client.aclose()
+    await proxy.stop()
+
+
+async def test_circuit_opens_on_timeouts_and_recovers(slow_redis: tuple[SlowRedis, aioredis.Redis]) -> None:
+    proxy, client = slow_redis
+    guard = CacheGuard(timeout=0.05, breaker=CircuitBreaker(2, reset_timeout=0.3), max_pending_writes=8)
+    assert await guard.call(client.ping) is True
+
+    proxy.delay = 0.2
+    for _ in range(2):
+        with pytest.raises(CacheUnavailableError):
+            await guard.call(client.ping)
+    assert guard.breaker.state == 'open'
+
+    start = time.perf_counter()
+    with pytest.raises(CacheUnavailableError):
+        await guard.call(client.ping)
+    assert time.perf_counter() - start < 0.01
+
+    proxy.delay = 0.0
+    await asyncio.sleep(0.3)
+    assert await guard.call(client.ping) is True
+    assert guard.breaker.state == 'closed'
+
+
+async def test_background_writes_dropped_under_pressure(slow_redis: tuple[SlowRedis, aioredis.Redis]) -> None:
+    proxy, client = slow_redis
+    guard = CacheGuard(timeout=1.0, breaker=CircuitBreaker(5, reset_timeout=1.0), max_pending_writes=2)
+    proxy.delay = 0.1
+
+    accepted = [guard.submit(lambda: client.set('test:resilience', 1, ex=10)) for _ in range(5)]
+    assert accepted == [True, True, False, False, False]
+    await guard.drain(timeout=1.0)
+    assert guard.pending_writes == 0
+    assert await client.get('test:resilience') == b'1'
+    await client.delete('test:resilience')
+
+
+async def test_invalidation_during_outage_is_retried(
+    slow_redis: tuple[SlowRedis, aioredis.Redis], monkeypatch: pytest.MonkeyPatch
+) -> None:
+    proxy, _ = slow_redis
+    redis_cache = RedisCache(url=f'redis://127.0.0.1:{proxy.port}')
+    monkeypatch.setattr(cache, '_cache', redis_cache)
+    user = UserDTO(uuid.uuid4(), 'outage1', 'outage1@outage.user', datetime.now(), True)
+    await redis_cache.set_user(user)
+
+    # Redis не отвечает, пока пользователь отключается
+    proxy.delay = settings.cache.write_timeout + 0.1
+    await event_bus.emit(UserDeactivated(user))
+    assert redis_cache._guard.pending_retries == 1
+
+    proxy.delay = 0.0
+    for _ in range(50):
+        if not redis_cache._guard.pending_retries:
+            break
+        await asyncio.sleep(0.1)
+    assert redis_cache._guard.pending_retries == 0
+    assert await redis_cache.get_user('outage1') is None
+    assert await redis_cache.get_email_user('outage1@outage.user') is None
+    await redis_cache.close()
+
+
+async def test_retry_queue_collapses_keys_and_is_bounded() -> None:
+    guard = CacheGuard(
+        timeout=0.05, breaker=CircuitBreaker(1, reset_timeout=1.0), max_pending_writes=1,
+        max_pending_retries=2, retry_delay=10.0,
+    )
+
+    async def invalidate() -> None:
+        raise OSError('Redis is down')
+
+    assert guard.retry(invalidate, key=('v1:username:a',))
+    assert guard.retry(invalidate, key=('v1:username:a',))
+    assert guard.retry(invalidate, key=('v1:username:b',))
+    assert guard.pending_retries == 2
+    assert not guard.retry(invalidate, key=('v1:username:c',))
+    assert guard.pending_retries == 2
+    guard._retrier.cancel()  # type: ignore
+
+
+async def test_open_circuit_bypasses_cache(ac_client: AsyncClient) -> None:
+    cache = get_cache()
+    if not isinstance(cache, RedisCache):
+        pytest.skip('Redis cache backend is not configured')
+    params = {'username': 'cacheuser', 'email': 'cacheuser@cache.user', 'password': 'password'}
+    response = await ac_client.post(url='/registration/', params=params)
+    assert response.status_code == HTTPStatus.CREATED
+
+    breaker = cache._guard.breaker
+    for _ in range(breaker.failure_threshold):
+        breaker.failure()
+    try:
+        response = await ac_client.post(url='/login', data={'username': 'cacheuser', 'password': 'password'})
+        assert response.status_code == HTTPStatus.OK
+        token = response.json()['access_token']
+        response = await ac_client.get(url='/user/me/', headers={'Authorization': f'Bearer {token}'})
+        assert response.status_code == HTTPStatus.OK
+        assert response.json()['username'] == 'cacheuser'
+    finally:
+        breaker.success()
@@ -1,5 +1,4 @@
 import asyncio
-from typing import AsyncGenerator
 
 import pytest
 from httpx import AsyncClient
@@ -9,7 +8,7 @@ from sqlalchemy_utils import create_database, drop_database  # noqa # type: igno
 
 from core.config import settings
 from main import app
-from src.database.config import get_async_session
+from src.database.config import get_session_maker
 from src.database.models import Base
 
 # # used on local
@@ -22,11 +21,11 @@ engine = create_async_engine(settings.db.url, poolclass=NullPool)
 async_session_maker = async_sessionmaker(engine, expire_on_commit=False)
 
 
-async def override_get_db() -> AsyncGenerator[AsyncSession, None]:
-    async with async_session_maker() as session:
-        yield session
+def override_get_session_maker() -> async_sessionmaker[AsyncSession]:
+    return async_session_maker
 
-app.dependency_overrides[get_async_session] = override_get_db
+
+app.dependency_overrides[get_session_maker] = override_get_session_maker
 
 
 @pytest.fixture(scope='session')
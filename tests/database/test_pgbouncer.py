@@ -0,0 +1,68 @@
+from typing import AsyncIterator
+
+import asyncpg
+import pytest
+from sqlalchemy import text
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+from sqlalchemy.pool import NullPool
+
+from core.config import settings
+from src.database.pool import engine_options
+
+QUERY = text('SELECT 1 + :x')
+
+
+@pytest.fixture
+async def pgbouncer_engine() -> AsyncIterator[AsyncEngine]:
+    engine = create_async_engine(settings.db.url, **engine_options(settings.db.model_copy(update={'pgbouncer': True})))
+    yield engine
+    await engine.dispose()
+
+
+@pytest.fixture
+async def default_engine() -> AsyncIterator[AsyncEngine]:
+    engine = create_async_engine(settings.db.url, **engine_options(settings.db.model_copy(update={'pgbouncer': False})))
+    yield engine
+    await engine.dispose()
+
+
+async def test_pgbouncer_mode_uses_null_pool(pgbouncer_engine: AsyncEngine) -> None:
+    assert isinstance(pgbouncer_engine.pool, NullPool)
+
+
+async def test_statement_survives_server_connection_switch(
+    pgbouncer_engine: AsyncEngine,
+    default_engine: AsyncEngine,
+) -> None:
+    # DEALLOCATE ALL изображает переход PgBouncer на другое соединение с Postgres,
+    # где подготовленных ранее выражений нет
+    async with default_engine.connect() as conn:
+        await conn.execute(QUERY, {'x': 1})
+        await conn.exec_driver_sql('DEALLOCATE ALL')
+        with pytest.raises(DBAPIError):
+            await conn.execute(QUERY, {'x': 1})
+
+    async with pgbouncer_engine.connect() as conn:
+        await conn.execute(QUERY, {'x': 1})
+        await conn.exec_driver_sql('DEALLOCATE ALL')
+        assert (await conn.execute(QUERY, {'x': 1})).scalar() == 2
+
+
+async def test_statement_names_do_not_collide(
+    pgbouncer_engine: AsyncEngine,
+    default_engine: AsyncEngine,
+) -> None:
+    for engine, collides in ((default_engine, True), (pgbouncer_engine, False)):
+        async with engine.connect() as conn:
+            raw = await conn.get_raw_connection()
+            # другой клиент на том же соединении с Postgres уже подготовил выражения
+            # со следующими именами из счетчика asyncpg
+            start = asyncpg.connection._uid  # type: ignore
+            prepare = ';'.join(f'PREPARE __asyncpg_stmt_{start + index:x}__ AS SELECT 1' for index in range(1, 9))
+            await raw.driver_connection.execute(prepare)  # type: ignore
+            if collides:
+                with pytest.raises(DBAPIError):
+                    await conn.execute(QUERY, {'x': 1})
+            else:
+                assert (await conn.execute(QUERY, {'x': 1})).scalar() == 2
@@ -0,0 +1,29 @@
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from core.config import settings
+from src.api.metrics.registry import registry
+from src.database.pool import TimedQueuePool, register_metrics, warm_up
+
+
+def checkouts() -> int:
+    for line in registry.render().splitlines():
+        if line.startswith('db_pool_checkout_seconds_count'):
+            return int(line.split()[-1])
+    return 0
+
+
+async def test_warm_up_opens_connections() -> None:
+    engine = create_async_engine(settings.db.url, poolclass=TimedQueuePool, pool_size=3, max_overflow=0)
+    register_metrics(engine)
+    before = checkouts()
+
+    await warm_up(engine, 3)
+    assert engine.pool.checkedin() == 3  # type: ignore
+    assert engine.pool.checkedout() == 0  # type: ignore
+    assert checkouts() == before + 3
+    assert 'db_pool_connections{state="idle"} 3' in registry.render()
+
+    async with engine.connect() as conn:
+        await conn.exec_driver_sql('SELECT 1')
+        assert 'db_pool_connections{state="checked_out"} 1' in registry.render()
+    await engine.dispose()
@@ -0,0 +1,99 @@
+import uuid
+from types import SimpleNamespace
+from typing import Any
+
+import pytest
+from sqlalchemy import delete, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.api.auth.repository import UserAuthRepository
+from src.api.info.repository import InfoRepository
+from src.database.config import engine
+from src.database.models import User
+from src.database.replica import SessionRouter, WriteTracker, write_tracker
+from tests.conftest import async_session_maker
+
+
+async def test_reads_go_to_primary_right_after_write() -> None:
+    now = [100.0]
+    tracker = WriteTracker(lag=2.0, clock=lambda: now[0])
+    primary, replica = AsyncSession(), AsyncSession()
+    router = SessionRouter(lambda: primary, lambda: replica, tracker)  # type: ignore
+    assert router.reader() is replica
+
+    tracker.mark()
+    assert router.reader() is primary
+    now[0] += 1.9
+    assert router.reader() is primary
+    now[0] += 0.1
+    assert router.reader() is replica
+
+    assert SessionRouter(lambda: primary, None, tracker).reader() is primary  # type: ignore
+
+
+async def test_sessions_are_created_on_demand() -> None:
+    created: list[AsyncSession] = []
+
+    def maker() -> AsyncSession:
+        created.append(AsyncSession())
+        return created[-1]
+
+    router = SessionRouter(maker, maker)  # type: ignore
+    await router.end_read()
+    await router.close()
+    assert created == []
+
+    assert router.primary is router.primary
+    assert len(created) == 1
+    await router.close()
+
+
+async def test_primary_engine_marks_writes(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(write_tracker, 'lag', 2.0)
+    monkeypatch.setattr(write_tracker, '_last_write', -float('inf'))
+    async with engine.connect() as conn:
+        await conn.execute(select(User.id).limit(1))
+        assert write_tracker.replica_allowed()
+        await conn.execute(update(User).where(User.username == '').values(is_active=False))
+        assert not write_tracker.replica_allowed()
+    await engine.dispose()
+
+
+class LaggingReplica:
+    '''Сессия реплики, которая еще не получила ни одной записи'''
+
+    async def execute(self, statement: Any) -> Any:
+        return SimpleNamespace(scalar=lambda: None, scalars=lambda: SimpleNamespace(all=list))
+
+    async def commit(self) -> None:
+        return None
+
+    async def close(self) -> None:
+        return None
+
+    async def __aenter__(self) -> 'LaggingReplica':
+        return self
+
+    async def __aexit__(self, *args: Any) -> None:
+        return None
+
+
+async def test_fresh_reads_do_not_trust_lagging_replica() -> None:
+    user_id = uuid.uuid4()
+    async with async_session_maker() as session:
+        session.add(User(id=user_id, username='lag_user', email='lag_user@lag.user', hashed_password=b'lag_user'))
+        await session.flush()
+        session.add(User(username='lag_child', email='lag_child@lag.user', hashed_password=b'lag_child', id_referal=user_id))
+        await session.commit()
+
+    # пользователь зарегистрирован через другой воркер: трекер этого воркера записи не видел
+    router = SessionRouter(async_session_maker, LaggingReplica, WriteTracker(lag=2.0))  # type: ignore
+    assert isinstance(router.reader(), LaggingReplica)
+    assert (await UserAuthRepository(router).read('lag_user')).id == user_id
+    referrals = await InfoRepository(router).load_users_id_referal(str(user_id))
+    assert [user.username for user in referrals] == ['lag_child']
+    await router.close()
+
+    async with async_session_maker() as session:
+        await session.execute(delete(User).where(User.username.startswith('lag_')))
+        await session.commit()
@@ -0,0 +1,105 @@
+import asyncio
+import csv
+from http import HTTPStatus
+from pathlib import Path
+
+import orjson
+import pytest
+from httpx import AsyncClient
+from sqlalchemy import delete, select
+
+from src.api.auth import password_policy
+from src.database import user_import
+from src.database.models import ReferralStats, User, UserImport, UserImportReferral
+from src.database.user_import import import_users, link_referrers
+from tests.conftest import async_session_maker, engine
+
+FIELDS = [
+    'username', 'email', 'password', 'hashed_password', 'created_at', 'referal_code', 'exp_ref_code', 'referrer_code'
+]
+
+
+def write_csv(path: Path, rows: list[dict[str, str]]) -> None:
+    exists = path.exists()
+    with path.open('a', newline='') as file:
+        writer = csv.DictWriter(file, FIELDS)
+        if not exists:
+            writer.writeheader()
+        writer.writerows(rows)
+
+
+async def test_import_users_resumes_and_links_referrers(ac_client: AsyncClient, tmp_path: Path) -> None:
+    path, rejects = tmp_path / 'users.csv', tmp_path / 'rejects.ndjson'
+    hashed_password = password_policy.hash('imp_child').decode()
+    write_csv(path, [
+        {'username': 'imp_root', 'email': 'imp_root@import.user', 'password': 'imp_root',
+         'created_at': '2025-01-01T00:00:00', 'referal_code': 'IMPROOT', 'exp_ref_code': '2030-01-01T00:00:00'},
+        {'username': 'imp_child', 'email': 'imp_child@import.user', 'hashed_password': hashed_password,
+         'created_at': '2025-01-02T00:00:00', 'referal_code': 'IMPCHILD', 'exp_ref_code': '2030-01-01T00:00:00',
+         'referrer_code': 'IMPROOT'},
+        {'username': 'imp_bad', 'email': 'not an email', 'password': 'imp_bad'},
+    ])
+    progress = await import_users(path, batch_size=2, workers=1, rejects=rejects)
+    assert (progress.rows, progress.inserted, progress.skipped, progress.rejected) == (3, 2, 0, 1)
+
+    # продолжение с четвертой записи после дописывания файла
+    write_csv(path, [
+        {'username': 'imp_grandchild', 'email': 'imp_grandchild@import.user', 'password': 'imp_grandchild',
+         'created_at': '2025-01-03T00:00:00', 'referrer_code': 'IMPCHILD'},
+        {'username': 'imp_orphan', 'email': 'imp_orphan@import.user', 'password': 'imp_orphan',
+         'referrer_code': 'NOSUCH'},
+        {'username': 'imp_root', 'email': 'imp_root2@import.user', 'password': 'imp_root'},
+        # реферер зарегистрирован позже реферала
+        {'username': 'imp_early', 'email': 'imp_early@import.user', 'password': 'imp_early',
+         'created_at': '2024-01-01T00:00:00', 'referrer_code': 'IMPCHILD'},
+    ])
+    progress = await import_users(path, batch_size=2, workers=1, rejects=rejects)
+    assert (progress.rows, progress.inserted, progress.skipped, progress.rejected) == (7, 5, 1, 1)
+    assert progress.done == 4
+    assert [orjson.loads(line)['row'] for line in rejects.read_bytes().splitlines()] == [3]
+
+    async with engine.begin() as conn:
+        assert await link_referrers(conn) == (2, 1, [('imp_early', 'IMPCHILD')])
+
+    ids = {}
+    for username in ('imp_root', 'imp_child', 'imp_grandchild'):
+        response = await ac_client.post(url='/login', data={'username': username, 'password': username})
+        assert response.status_code == HTTPStatus.OK
+        headers = {'Authorization': f"Bearer {response.json()['access_token']}"}
+        ids[username] = (await ac_client.get(url='/user/me/', headers=headers)).json()['id']
+    response = await ac_client.get(url=f"/referrals/{ids['imp_grandchild']}/referrers")
+    assert [node['id'] for node in response.json()] == [ids['imp_child'], ids['imp_root']]
+    response = await ac_client.get(url=f"/referrals/{ids['imp_root']}/tree/size")
+    assert response.json()['size'] == 2
+
+    async with async_session_maker() as session:
+        stats = await session.get(ReferralStats, ids['imp_root'])
+        assert stats is not None and stats.total == 1
+        for username in ('imp_orphan', 'imp_early'):
+            user = (await session.execute(select(User).where(User.username == username))).scalar_one()
+            assert user.id_referal is None
+        pending = (await session.execute(select(UserImportReferral.referrer_code))).scalars().all()
+        assert pending == ['NOSUCH']
+        await session.execute(delete(User).where(User.username.startswith('imp_')))
+        await session.execute(delete(UserImport))
+        await session.commit()
+
+
+async def test_import_users_cancels_prepared_batch_on_write_error(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    path = tmp_path / 'users.csv'
+    write_csv(path, [
+        {'username': f'imp_fail{index}', 'email': f'imp_fail{index}@import.user', 'password': f'imp_fail{index}'}
+        for index in range(3)
+    ])
+
+    async def write_batch(batch: user_import.Batch, progress: user_import.Progress) -> None:
+        raise OSError('database is gone')
+
+    monkeypatch.setattr(user_import, 'write_batch', write_batch)
+    with pytest.raises(OSError):
+        await import_users(path, batch_size=1, workers=1)
+    # следующая пачка уже готовилась, пока писалась первая
+    current = asyncio.current_task()
+    assert [task for task in asyncio.all_tasks() if task is not current and not task.done()] == []
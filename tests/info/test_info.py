@@ -1,6 +1,22 @@
+import json
+import uuid
+from datetime import datetime, timedelta
 from http import HTTPStatus
 
+import pytest
 from httpx import AsyncClient
+from sqlalchemy import delete, insert, select
+
+from src.api.info.repository import InfoRepository
+from src.api.info.schemas import UserInfo
+from src.api.info.service import InfoService
+from src.api.pagination import NEXT_CURSOR_HEADER, PageParams, json_page
+from src.database.memory_cache import MemoryCache
+from src.database.models import ReferralStats, User
+from src.database.referral_stats import backfill, count_referrals, week_start
+from src.database.replica import SessionRouter
+from src.database.serializers import UserDTO
+from tests.conftest import async_session_maker
 
 
 async def test_receive_code_by_email_not_exist(ac_client: AsyncClient) -> None:
@@ -25,3 +41,138 @@ async def test_get_info_about_referrals(ac_client: AsyncClient) -> None:
     )
     assert response.status_code == HTTPStatus.NOT_FOUND
     assert response.json() == {'detail': 'Referrals not found'}
+
+
+@pytest.fixture
+async def referrals() -> list[str]:
+    referrer = uuid.uuid4()
+    names = [f'page_ref{index}' for index in range(5)]
+    # явное время регистрации: значения по умолчанию в одной пачке могут совпасть,
+    # и порядок страниц зависел бы от случайных id
+    start = datetime.now()
+    async with async_session_maker() as session:
+        await session.execute(insert(User), [
+            {
+                'id': referrer if name == 'page_ref0' else uuid.uuid4(),
+                'username': name,
+                'email': f'{name}@page.user',
+                'created_at': start + timedelta(milliseconds=index),
+                'hashed_password': name.encode(),
+                'id_referal': None if name == 'page_ref0' else referrer,
+            }
+            for index, name in enumerate(names)
+        ])
+        await session.commit()
+    yield [str(referrer), *names[1:]]
+    async with async_session_maker() as session:
+        await session.execute(delete(User).where(User.username.startswith('page_ref')))
+        await session.commit()
+
+
+async def test_referrals_pages(ac_client: AsyncClient, referrals: list[str]) -> None:
+    referrer, *names = referrals
+    pages: list[list[str]] = []
+    params = {'limit': 3}
+    while True:
+        response = await ac_client.get(url=f'/referrals/{referrer}', params=params)
+        assert response.status_code == HTTPStatus.OK
+        pages.append([item['username'] for item in response.json()])
+        if NEXT_CURSOR_HEADER not in response.headers:
+            break
+        params['after'] = response.headers[NEXT_CURSOR_HEADER]
+    assert pages == [names[:3], names[3:]]
+
+
+async def test_referrals_ndjson(ac_client: AsyncClient, referrals: list[str]) -> None:
+    referrer, *names = referrals
+    response = await ac_client.get(url=f'/referrals/{referrer}', params={'format': 'ndjson', 'limit': 1})
+    assert response.status_code == HTTPStatus.OK
+    assert response.headers['content-type'] == 'application/x-ndjson'
+    assert [json.loads(line)['username'] for line in response.text.splitlines()] == names
+
+
+@pytest.mark.parametrize('format', ['json', 'ndjson'])
+@pytest.mark.parametrize('id', ['not-a-uuid', str(uuid.uuid4())])
+async def test_referrals_unknown_referrer(ac_client: AsyncClient, format: str, id: str) -> None:
+    response = await ac_client.get(url=f'/referrals/{id}', params={'format': format})
+    assert response.status_code == HTTPStatus.NOT_FOUND
+    assert response.json() == {'detail': 'Referrals not found'}
+
+
+async def test_referrals_bad_cursor(ac_client: AsyncClient) -> None:
+    response = await ac_client.get(url=f'/referrals/{uuid.uuid4()}', params={'after': 'bad'})
+    assert response.status_code == HTTPStatus.BAD_REQUEST
+    assert response.json() == {'detail': 'Invalid cursor'}
+
+
+async def test_shared_referrals_load_runs_in_own_session(referrals: list[str]) -> None:
+    referrer, *names = referrals
+    sessions = SessionRouter(async_session_maker)
+    service = InfoService(InfoRepository(sessions), MemoryCache())
+    rows, _ = await service.about_referrals(referrer, PageParams(limit=3, after=None))
+    assert [row.username for row in rows] == names[:3]
+    # загрузку разделяют конкурентные запросы, поэтому сессия запроса не создается
+    assert sessions._primary is None
+
+
+def test_json_page_matches_response_schema() -> None:
+    user = UserDTO(uuid.uuid4(), 'page_dto', 'page_dto@page.user', datetime(2024, 4, 14, 20, 24, 1, 344861), True)
+    response = json_page([user], None, UserInfo)
+    assert json.loads(response.body) == [UserInfo.model_validate(user, from_attributes=True).model_dump(mode='json')]
+    assert NEXT_CURSOR_HEADER not in response.headers
+
+
+async def register(ac_client: AsyncClient, username: str, referal_code: str | None = None) -> dict[str, str]:
+    params = {'username': username, 'email': f'{username}@stats.user', 'password': username}
+    if referal_code:
+        params['referal_code'] = referal_code
+    response = await ac_client.post(url='/registration/', params=params)
+    assert response.status_code == HTTPStatus.CREATED
+    response = await ac_client.post(url='/login', data={'username': username, 'password': username})
+    return {'Authorization': f"Bearer {response.json()['access_token']}"}
+
+
+async def test_referral_stats_follow_registration_and_deactivation(ac_client: AsyncClient) -> None:
+    headers = await register(ac_client, 'stats_ref')
+    referrer = (await ac_client.get(url='/user/me/', headers=headers)).json()['id']
+    response = await ac_client.get(url=f'/referrals/{referrer}/stats')
+    assert response.status_code == HTTPStatus.NOT_FOUND
+
+    code = (await ac_client.patch(url='/user/me/referralcode/', headers=headers)).json()['referal_code']
+    referral_headers = await register(ac_client, 'stats_ref1', code)
+    await register(ac_client, 'stats_ref2', code)
+    response = await ac_client.get(url=f'/referrals/{referrer}/stats')
+    assert response.status_code == HTTPStatus.OK
+    assert response.json() == {
+        'referrer_id': referrer,
+        'total': 2,
+        'active': 2,
+        'week_start': week_start().isoformat(),
+        'joined_this_week': 2,
+    }
+
+    assert (await ac_client.delete(url='/user/me/', headers=referral_headers)).status_code == HTTPStatus.OK
+    stats = (await ac_client.get(url=f'/referrals/{referrer}/stats')).json()
+    assert (stats['total'], stats['active']) == (2, 1)
+
+    async with async_session_maker() as session:
+        await session.execute(delete(User).where(User.username.startswith('stats_ref')))
+        await session.commit()
+
+
+async def test_referral_stats_backfill(referrals: list[str]) -> None:
+    referrer, *names = referrals
+    now = datetime.now()
+    async with async_session_maker() as session:
+        await backfill(await session.connection(), now)
+        await session.commit()
+        stats = await session.get(ReferralStats, uuid.UUID(referrer))
+        assert (stats.total, stats.active, stats.week_start, stats.joined_week) == (4, 4, week_start(now), 4)
+
+        # первая регистрация следующей недели начинает счетчик недели заново
+        next_week = now + timedelta(days=7)
+        users = select(User.id_referal, User.is_active, User.created_at).where(User.username == names[0]).subquery()
+        await session.execute(count_referrals(users, next_week))
+        await session.commit()
+        await session.refresh(stats)
+        assert (stats.total, stats.week_start, stats.joined_week) == (5, week_start(next_week), 0)
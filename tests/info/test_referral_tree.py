@@ -0,0 +1,50 @@
+from http import HTTPStatus
+
+from httpx import AsyncClient
+from sqlalchemy import delete
+
+from src.database.models import ReferralClosure, User
+from src.database.referral_tree import backfill
+from tests.conftest import async_session_maker
+from tests.info.test_info import register
+
+
+async def check_tree(ac_client: AsyncClient, ids: list[str]) -> None:
+    root, child, grandchild = ids
+    response = await ac_client.get(url=f'/referrals/{root}/tree', params={'depth': 1})
+    assert response.status_code == HTTPStatus.OK
+    assert response.json() == [{'id': child, 'username': 'tree_ref1', 'id_referal': root, 'depth': 1}]
+
+    response = await ac_client.get(url=f'/referrals/{root}/tree')
+    assert [(node['id'], node['depth']) for node in response.json()] == [(child, 1), (grandchild, 2)]
+
+    response = await ac_client.get(url=f'/referrals/{root}/tree/size')
+    assert response.json() == {'id': root, 'depth': None, 'size': 2}
+    response = await ac_client.get(url=f'/referrals/{root}/tree/size', params={'depth': 1})
+    assert response.json()['size'] == 1
+
+    response = await ac_client.get(url=f'/referrals/{grandchild}/referrers')
+    assert response.status_code == HTTPStatus.OK
+    assert [(node['id'], node['depth']) for node in response.json()] == [(child, 1), (root, 2)]
+    response = await ac_client.get(url=f'/referrals/{root}/referrers')
+    assert response.json() == []
+
+
+async def test_referral_tree(ac_client: AsyncClient) -> None:
+    ids: list[str] = []
+    code = None
+    for username in ('tree_ref0', 'tree_ref1', 'tree_ref2'):
+        headers = await register(ac_client, username, code)
+        ids.append((await ac_client.get(url='/user/me/', headers=headers)).json()['id'])
+        code = (await ac_client.patch(url='/user/me/referralcode/', headers=headers)).json()['referal_code']
+    await check_tree(ac_client, ids)
+
+    async with async_session_maker() as session:
+        await session.execute(delete(ReferralClosure))
+        assert await backfill(await session.connection()) == 3
+        await session.commit()
+    await check_tree(ac_client, ids)
+
+    async with async_session_maker() as session:
+        await session.execute(delete(User).where(User.username.startswith('tree_ref')))
+        await session.commit()
@@ -1,7 +1,15 @@
+import uuid
+from datetime import datetime
 from http import HTTPStatus
 
+import pytest
 from httpx import AsyncClient
 
+from src.api.user.repository import UserRepository
+from src.database.replica import SessionRouter
+from src.database.serializers import UserDTO
+from tests.conftest import async_session_maker
+
 
 async def test_read(
     ac_client: AsyncClient,
@@ -113,6 +121,39 @@ async def test_create_referral_code_alredy_exist(
     }
 
 
+async def test_create_referral_code_checks_current_row(save_response_data: dict[str, str]) -> None:
+    # копия пользователя в кеше могла быть сохранена до создания кода
+    stale = UserDTO(
+        uuid.UUID(save_response_data['id']),
+        save_response_data['username'],
+        save_response_data['email'],
+        datetime.now(),
+        True,
+    )
+    repository = UserRepository(SessionRouter(async_session_maker))
+    try:
+        with pytest.raises(ValueError) as e:
+            await repository.create_referral_code(stale, 30)
+    finally:
+        await repository.sessions.close()
+    assert e.value.args[0] == (
+        f" Refarral code alredy exist. "
+        f"Your code: '{save_response_data.get('referal_code')}' "
+    )
+
+
+async def test_get_all_referrals_empty(
+    ac_client: AsyncClient,
+    save_token: dict[str, str],
+) -> None:
+    response = await ac_client.get(
+        url='/user/me/referrals/',
+        headers={'Authorization': f"Bearer {save_token['access_token']}"}
+    )
+    assert response.status_code == HTTPStatus.OK
+    assert response.json() == []
+
+
 async def test_registration_user_with_code(
     registration_with_code_good: dict[str, str],
     ac_client: AsyncClient,